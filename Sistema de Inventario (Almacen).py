@@ -4,7 +4,22 @@ import json
 import os
 import sys
 import datetime
+import gc
+import gzip
+import hashlib
+import marshal
+import math
+import time
 import shutil
+import sqlite3
+import threading
+import queue
+import heapq
+import concurrent.futures
+import contextlib
+import bisect
+import unicodedata
+from collections import Counter, OrderedDict
 import openpyxl
 from openpyxl.styles import Font
 from docx import Document
@@ -50,8 +65,73 @@ else:
     CARPETA_ACTUAL = os.path.dirname(os.path.abspath(__file__))
 
 ARCHIVO_DATOS = os.path.join(CARPETA_ACTUAL, "inventario_taller.json")
-ARCHIVO_LOG = os.path.join(CARPETA_ACTUAL, "historial_global.json")
+ARCHIVO_SNAPSHOT_BIN = os.path.join(CARPETA_ACTUAL, "inventario_taller.snap")
+ARCHIVO_JOURNAL = os.path.join(CARPETA_ACTUAL, "inventario_taller.journal")
+ARCHIVO_SQLITE = os.path.join(CARPETA_ACTUAL, "inventario_taller.db")
+ARCHIVO_IDS = os.path.join(CARPETA_ACTUAL, "inventario_taller.ids")
+ARCHIVO_PRESTAMOS = os.path.join(CARPETA_ACTUAL, "inventario_taller.prestamos")
+CARPETA_LOG = os.path.join(CARPETA_ACTUAL, "Historial_Global")
+ARCHIVO_LOG_JSONL = os.path.join(CARPETA_ACTUAL, "historial_global.jsonl")
+ARCHIVO_LOG_ANTIGUO = os.path.join(CARPETA_ACTUAL, "historial_global.json")
 CARPETA_RESPALDOS = os.path.join(CARPETA_ACTUAL, "Respaldos")
+CARPETA_MOVIMIENTOS = os.path.join(CARPETA_ACTUAL, "Movimientos")
+
+# Almacenamiento: "json" (snapshot + journal + log particionado) o "sqlite" (tablas indexadas)
+MODO_ALMACENAMIENTO = "json"
+
+# Versión del snapshot binario (marshal); si no coincide se vuelve a leer el JSON
+FORMATO_SNAPSHOT = 1
+
+# Respaldos incrementales: cada cuántos deltas se escribe una nueva base completa
+MAX_DELTAS_RESPALDO = 30
+
+# Retención de respaldos (abuelo-padre-hijo): todos los de hoy, uno por día durante
+# "dias_diarios" días y uno por mes después (None = sin límite de meses).
+POLITICA_RESPALDOS = {
+    "dias_completos": 1,
+    "dias_diarios": 30,
+    "meses_mensuales": None,
+    "conservar_manuales": True,
+}
+
+# Semáforo de inventario: cantidad máxima para considerar una pieza en stock crítico / bajo.
+# Son los valores por defecto; cada pieza puede tener sus propios puntos de reorden
+# (punto_critico / punto_bajo).
+STOCK_CRITICO = 2
+STOCK_BAJO = 5
+
+# Búsqueda mientras se escribe: milisegundos sin teclear antes de filtrar, y filas máximas en el
+# buscador de préstamos (es para elegir una pieza; con más resultados hay que seguir escribiendo)
+RETARDO_BUSQUEDA_MS = 150
+LIMITE_RESULTADOS_MODAL = 200
+
+# Búsqueda en segundo plano: piezas que se revisan antes de entregar las coincidencias encontradas
+# (así las primeras aparecen enseguida) y cada cuántos milisegundos las recoge el hilo de Tk
+TAMANO_PARTE_BUSQUEDA = 20000
+INTERVALO_BUSQUEDA_MS = 30
+
+# Búsqueda aproximada (cuando no hay coincidencia exacta): fracción mínima de trigramas del término
+# que debe tener una pieza y cuántas de las más parecidas se muestran
+SIMILITUD_MINIMA = 0.5
+LIMITE_APROXIMADOS = 50
+
+# Tabla principal virtual: alto de cada fila (px) y filas extra que se crean debajo de las visibles
+ALTO_FILA_TABLA = 25
+MARGEN_FILAS_TABLA = 10
+
+# Movimientos del historial que se muestran de una vez en la ficha (el resto, al bajar o con "Cargar más")
+LINEAS_HISTORIAL_PAGINA = 100
+
+# Reportes (Excel / Word / PDF) que se pueden generar a la vez en segundo plano
+MAX_REPORTES_SIMULTANEOS = 2
+
+# Segundos que se esperan para agrupar cambios seguidos en una sola escritura del snapshot
+VENTANA_GUARDADO = 2.0
+# Tope de la espera entre reintentos cuando la escritura del snapshot falla (se duplica en cada fallo)
+REINTENTO_GUARDADO_MAXIMO = 60.0
+
+# Historiales de piezas que se mantienen en memoria (las últimas fichas abiertas)
+CAPACIDAD_CACHE_HISTORIAL = 64
 
 
 # --- CLASE PDF PERSONALIZADA ---
@@ -80,42 +160,641 @@ class PDF(FPDF):
 
 
 # --- FUNCIONES DE CARGA DE DATOS ---
+@contextlib.contextmanager
+def sin_recolector():
+    # Las cargas crean cientos de miles de objetos que viven toda la sesión; el recolector de ciclos
+    # los recorrería una y otra vez sin encontrar basura, así que se pausa mientras duran
+    recolector = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if recolector: gc.enable()
+
 def cargar_datos():
+    if MODO_ALMACENAMIENTO == "sqlite":
+        _libro_prestamos.saldos = almacen_sqlite().cargar_prestamos()
+        return almacen_sqlite().cargar()
+    return cargar_datos_json(_libro_prestamos)
+
+
+def cargar_datos_json(libro=None):
+    # "libro": si se pasa, también se carga el libro de préstamos (al día con el journal)
+    prestamos = leer_prestamos() if libro is not None else None
     if not os.path.exists(ARCHIVO_DATOS):
+        inventario = {}
         try:
             with open(ARCHIVO_DATOS, "w", encoding="utf-8") as archivo:
                 json.dump({}, archivo, indent=4)
-            return {}
         except:
-            return {}
+            pass
     else:
         try:
-            with open(ARCHIVO_DATOS, "r", encoding="utf-8") as archivo:
-                return json.load(archivo)
+            with sin_recolector():
+                inventario = leer_snapshot_binario()
+                if inventario is None:
+                    with open(ARCHIVO_DATOS, "r", encoding="utf-8") as archivo:
+                        inventario = json.load(archivo)
         except:
             return {}
 
+    # Inventarios anteriores guardaban el historial dentro de cada pieza: se pasa a los segmentos
+    migrado = any('historial' in p or 'ult_fecha' in p for p in inventario.values())
+    if migrado: separar_historial(inventario)
+
+    # Reconstruir el estado con las mutaciones que quedaron en el journal y consolidarlas
+    efectos = []
+    consolidado = aplicar_journal(inventario, efectos) > 0 or migrado
+    if consolidado:
+        reparar_segmentos(efectos)
+        guardar_datos_json(inventario)
+    if libro is not None:
+        if prestamos is None:
+            # Falta o no corresponde al snapshot: se rehace con el historial (ya completo)
+            libro.reconstruir(inventario)
+        else:
+            libro.saldos = prestamos
+            libro.aplicar_efectos(efectos)
+        # Un snapshot nuevo cambia el sello: el libro se reescribe aunque no haya movimientos
+        if prestamos is None or consolidado:
+            try:
+                escribir_prestamos(libro.saldos)
+            except OSError:
+                pass
+    return inventario
+
 
-def guardar_datos(inventario):
+def guardar_datos_json(inventario):
     try:
-        with open(ARCHIVO_DATOS, "w", encoding="utf-8") as archivo:
-            json.dump(inventario, archivo, indent=4)
+        escribir_snapshot(inventario)
+        # El snapshot ya incluye todo lo registrado en el journal
+        open(ARCHIVO_JOURNAL, "w").close()
     except Exception as e:
         messagebox.showerror("Error", f"No se pudo guardar inventario: {e}")
 
 
+def escribir_snapshot(inventario):
+    # Snapshot completo (checkpoint): se escribe a un temporal y se reemplaza de forma atómica
+    temporal = ARCHIVO_DATOS + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(inventario, archivo, indent=4)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ARCHIVO_DATOS)
+
+    # Copia binaria para arranque rápido; se escribe después del JSON para quedar como la más nueva
+    temporal = ARCHIVO_SNAPSHOT_BIN + ".tmp"
+    with open(temporal, "wb") as archivo:
+        marshal.dump((FORMATO_SNAPSHOT, inventario), archivo)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ARCHIVO_SNAPSHOT_BIN)
+
+
+def leer_snapshot_binario():
+    # Solo se usa si es al menos tan nuevo como el JSON (si alguien editó el JSON a mano, gana el JSON)
+    try:
+        if os.path.getmtime(ARCHIVO_SNAPSHOT_BIN) < os.path.getmtime(ARCHIVO_DATOS): return None
+        # marshal.loads sobre el archivo completo: marshal.load lee el archivo en trozos muy pequeños
+        with open(ARCHIVO_SNAPSHOT_BIN, "rb") as archivo:
+            formato, inventario = marshal.loads(archivo.read())
+        return inventario if formato == FORMATO_SNAPSHOT else None
+    except Exception:
+        # No existe, está dañado o es de otra versión de Python
+        return None
+
+
+# --- JOURNAL DE MUTACIONES (SOLO AGREGAR) ---
+# Cada cambio se guarda como una línea JSON compacta:
+#   {"op": "alta",   "id": pid, "pieza": {...}}
+#   {"op": "editar", "id": pid, "campos": {...}}
+#   {"op": "baja",   "id": pid}
+#   {"op": "mov",    "id": pid, "cantidad": n,
+#                     "mov": {"ts": epoch, "tipo": "SALIDA", "empleado": "123", "delta": -3, "saldo": n}}
+#   {"op": "lote",   "registros": [...]}   (una sola línea: se aplica todo o nada)
+# Lo que toca el historial de cada pieza se devuelve en "efectos" para escribirlo en su segmento.
+def aplicar_mutacion(inventario, registro, efectos=None):
+    op = registro.get("op")
+    pid = registro.get("id")
+    if op == "lote":
+        for sub in registro["registros"]: aplicar_mutacion(inventario, sub, efectos)
+    elif op == "alta":
+        inventario[pid] = {k: v for k, v in registro["pieza"].items() if k != 'historial'}
+        if efectos is not None: efectos.append(("reinicio", pid))
+    elif op == "editar":
+        if pid in inventario: inventario[pid].update(registro["campos"])
+    elif op == "baja":
+        inventario.pop(pid, None)
+        if efectos is not None: efectos.append(("reinicio", pid))
+    elif op == "mov":
+        pieza = inventario.get(pid)
+        if pieza is None: return
+        mov = movimiento_de_registro(registro)
+        pieza['cantidad'] = registro['cantidad']
+        pieza['ult_ts'], pieza['ult_tipo'] = mov['ts'], mov['tipo']
+        if efectos is not None: efectos.append(("mov", pid, mov))
+
+
+def registrar_mutacion(registro):
+    # Lanza excepción si no se pudo escribir; quien llama decide cómo revertir
+    if MODO_ALMACENAMIENTO == "sqlite": return almacen_sqlite().aplicar(registro)
+    with open(ARCHIVO_JOURNAL, "a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def tamano_journal():
+    try:
+        return os.path.getsize(ARCHIVO_JOURNAL)
+    except OSError:
+        return 0
+
+
+def recortar_journal(posicion):
+    # Descarta del journal lo que ya quedó incluido en el snapshot (se conserva lo agregado después)
+    try:
+        with open(ARCHIVO_JOURNAL, "rb") as f:
+            f.seek(posicion)
+            resto = f.read()
+    except OSError:
+        resto = b""
+    temporal = ARCHIVO_JOURNAL + ".tmp"
+    with open(temporal, "wb") as f:
+        f.write(resto)
+    os.replace(temporal, ARCHIVO_JOURNAL)
+
+
+def aplicar_journal(inventario, efectos=None):
+    if not os.path.exists(ARCHIVO_JOURNAL): return 0
+    aplicadas = 0
+    try:
+        with open(ARCHIVO_JOURNAL, "r", encoding="utf-8") as f:
+            for linea in f:
+                if not linea.strip(): continue
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    # Última línea incompleta por un cierre inesperado
+                    break
+                aplicar_mutacion(inventario, registro, efectos)
+                aplicadas += 1
+    except OSError:
+        pass
+    return aplicadas
+
+
+# --- HISTORIAL POR PIEZA (SEGMENTOS) ---
+# El historial de movimientos no vive en el registro de la pieza. En modo JSON cada pieza tiene
+# su segmento Movimientos/<id>.jsonl (una línea por movimiento, del más viejo al más nuevo); en
+# SQLite está en la tabla movimientos. En el registro solo quedan "ult_ts" y "ult_tipo", que es
+# lo que usa la tabla principal. El historial completo se lee al abrir la pieza y queda en un LRU.
+# Cada movimiento es {"ts", "tipo", "empleado", "delta", "saldo"}; el texto solo se arma al mostrarlo.
+def movimiento_desde_linea(linea):
+    # Formato anterior (texto ya armado):
+    # "📤 07/01/2026 15:30:00 | SALIDA | Empleado: 123 | Cant: -3 | Restan: 7"
+    #   -> {"ts": 1767821400, "tipo": "SALIDA", "empleado": "123", "delta": -3, "saldo": 7}
+    mov = {"ts": None, "tipo": "", "empleado": "", "delta": 0, "saldo": None}
+    partes = [p.strip() for p in str(linea).split("|")]
+    try:
+        fecha = datetime.datetime.strptime(partes[0].split(" ", 1)[1], "%d/%m/%Y %H:%M:%S")
+        mov["ts"] = int(time.mktime(fecha.timetuple()))
+    except:
+        # No se reconoce: se conserva el texto original para mostrarlo tal cual
+        mov["texto"] = str(linea)
+    if len(partes) > 1: mov["tipo"] = partes[1]
+    for p in partes[2:]:
+        clave, _, valor = p.partition(":")
+        try:
+            if clave == "Empleado":
+                mov["empleado"] = valor.strip()
+            elif clave == "Cant":
+                mov["delta"] = int(valor)
+            elif clave in ("Restan", "Total"):
+                mov["saldo"] = int(valor)
+        except ValueError:
+            pass
+    return mov
+
+
+def movimiento_de_registro(registro):
+    if "mov" in registro: return registro["mov"]
+    # Journal anterior: el movimiento venía como texto
+    mov = movimiento_desde_linea(registro['linea'])
+    mov["saldo"] = registro['cantidad']
+    return mov
+
+
+def fecha_movimiento(ts, formato="%Y-%m-%d %H:%M:%S"):
+    return datetime.datetime.fromtimestamp(ts).strftime(formato)
+
+
+def texto_movimiento(mov):
+    if "texto" in mov: return mov["texto"]
+    fecha = fecha_movimiento(mov["ts"], "%d/%m/%Y %H:%M:%S")
+    if mov["tipo"] == "SALIDA":
+        return f"📤 {fecha} | SALIDA | Empleado: {mov['empleado']} | Cant: {mov['delta']:+d} | Restan: {mov['saldo']}"
+    return f"📥 {fecha} | {mov['tipo']} | Empleado: {mov['empleado']} | Cant: {mov['delta']:+d} | Total: {mov['saldo']}"
+
+
+def inicio_del_dia():
+    return int(time.mktime(datetime.date.today().timetuple()))
+
+class CacheHistorial:
+    def __init__(self, capacidad=CAPACIDAD_CACHE_HISTORIAL):
+        self.capacidad = capacidad
+        self.datos = OrderedDict()
+        self.candado = threading.Lock()
+
+    def obtener(self, pid):
+        with self.candado:
+            if pid not in self.datos: return None
+            self.datos.move_to_end(pid)
+            return self.datos[pid]
+
+    def guardar(self, pid, historial):
+        with self.candado:
+            self.datos[pid] = historial
+            self.datos.move_to_end(pid)
+            while len(self.datos) > self.capacidad:
+                self.datos.popitem(last=False)
+
+    def agregar(self, pid, mov):
+        # Si la pieza no está en memoria no hace falta: se leerá completa al abrirla
+        with self.candado:
+            if pid in self.datos: self.datos[pid].insert(0, mov)
+
+    def descartar(self, pid=None):
+        with self.candado:
+            if pid is None:
+                self.datos.clear()
+            else:
+                self.datos.pop(pid, None)
+
+
+_cache_historial = CacheHistorial()
+
+
+def ruta_segmento(pid):
+    return os.path.join(CARPETA_MOVIMIENTOS, f"{pid}.jsonl")
+
+
+def leer_segmento(pid):
+    movimientos = []
+    try:
+        with open(ruta_segmento(pid), "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    mov = json.loads(linea)
+                except ValueError:
+                    # Línea cortada por un cierre inesperado
+                    continue
+                movimientos.append(movimiento_desde_linea(mov) if isinstance(mov, str) else mov)
+    except OSError:
+        pass
+    return movimientos
+
+
+def escribir_segmento(pid, movimientos):
+    ruta = ruta_segmento(pid)
+    if not movimientos:
+        if os.path.exists(ruta): os.remove(ruta)
+        return
+    os.makedirs(CARPETA_MOVIMIENTOS, exist_ok=True)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        f.write("".join(serializar_evento(m) for m in movimientos))
+    os.replace(ruta + ".tmp", ruta)
+
+
+def agregar_a_segmento(pid, movimientos):
+    os.makedirs(CARPETA_MOVIMIENTOS, exist_ok=True)
+    with open(ruta_segmento(pid), "a", encoding="utf-8") as f:
+        f.write("".join(serializar_evento(m) for m in movimientos))
+
+
+def historial_pieza(pid):
+    # Del más nuevo al más viejo, como se muestra en la ficha
+    historial = _cache_historial.obtener(pid)
+    if historial is None:
+        if MODO_ALMACENAMIENTO == "sqlite":
+            historial = almacen_sqlite().historial(pid)
+        else:
+            historial = leer_segmento(pid)
+            historial.reverse()
+        _cache_historial.guardar(pid, historial)
+    return historial
+
+
+def aplicar_efectos_historial(efectos):
+    # ("mov", pid, mov) agrega al segmento; ("reinicio", pid) por alta o baja lo descarta
+    for efecto in efectos:
+        pid = efecto[1]
+        if efecto[0] == "reinicio":
+            _cache_historial.descartar(pid)
+            if MODO_ALMACENAMIENTO == "json" and os.path.exists(ruta_segmento(pid)):
+                os.remove(ruta_segmento(pid))
+        else:
+            if MODO_ALMACENAMIENTO == "json": agregar_a_segmento(pid, [efecto[2]])
+            _cache_historial.agregar(pid, efecto[2])
+
+
+def reparar_segmentos(efectos):
+    # Al reaplicar el journal, sus movimientos pueden estar ya (todos o los primeros) al final
+    # del segmento: se agregan solo los que faltan y se reescribe sin líneas cortadas
+    pendientes = {}
+    for efecto in efectos:
+        pid = efecto[1]
+        if efecto[0] == "reinicio":
+            pendientes[pid] = (True, [])
+        else:
+            pendientes.setdefault(pid, (False, []))[1].append(efecto[2])
+    for pid, (reiniciado, movimientos) in pendientes.items():
+        previos = [] if reiniciado else leer_segmento(pid)
+        ya_escritos = next(j for j in range(min(len(movimientos), len(previos)), -1, -1)
+                           if previos[len(previos) - j:] == movimientos[:j])
+        escribir_segmento(pid, previos + movimientos[ya_escritos:])
+        _cache_historial.descartar(pid)
+
+
+def separar_historial(inventario, segmentos=True):
+    # Pasa el historial incluido en cada pieza (formato anterior o respaldos viejos) a su segmento
+    for pid, pieza in inventario.items():
+        if 'ult_fecha' in pieza:
+            # Registro con la fecha del último movimiento como texto
+            fecha = pieza.pop('ult_fecha')
+            pieza['ult_ts'] = int(time.mktime(datetime.datetime.strptime(fecha, "%Y-%m-%d %H:%M:%S").timetuple())) \
+                if fecha else None
+        if 'historial' not in pieza: continue
+        historial = [m if isinstance(m, dict) else movimiento_desde_linea(m) for m in pieza.pop('historial') or []]
+        if segmentos: escribir_segmento(pid, list(reversed(historial)))
+        _cache_historial.descartar(pid)
+        pieza.pop('ult_ts', None)
+        pieza.pop('ult_tipo', None)
+        if historial:
+            pieza['ult_ts'], pieza['ult_tipo'] = historial[0]['ts'], historial[0]['tipo']
+
+
+def texto_ultimo_movimiento(pieza):
+    if pieza.get('historial'):
+        ultimo = pieza['historial'][0]
+        return texto_movimiento(ultimo) if isinstance(ultimo, dict) else ultimo
+    if not pieza.get('ult_ts'): return "Sin movimientos"
+    fecha = fecha_movimiento(pieza['ult_ts'], "%d/%m/%Y %H:%M:%S")
+    return f"{'📤' if pieza.get('ult_tipo') == 'SALIDA' else '📥'} {fecha} | {pieza.get('ult_tipo', '')}"
+
+
+# --- LIBRO DE PRÉSTAMOS ---
+# Saldo de cada (empleado, pieza) con préstamos abiertos: sacados, devueltos, pendiente y la hora
+# del primer y último movimiento. Se actualiza con los mismos efectos que el historial, así que es
+# un derivado de él: cuando el pendiente vuelve a cero el préstamo se cierra (se quita), y si el
+# archivo falta o no corresponde al snapshot se reconstruye desde los segmentos.
+def es_prestamo(mov):
+    return mov['tipo'] in ("SALIDA", "ENTRADA") and bool(mov.get('delta'))
+
+
+def acumular_prestamo(saldo, mov):
+    # Devuelve el saldo nuevo, o None si el préstamo quedó cerrado. Devolver más de lo que se debía
+    # (o sin préstamo abierto) también lo cierra: no queda un saldo negativo que absorba la siguiente salida
+    if saldo is None:
+        saldo = {"pendiente": 0, "sacados": 0, "devueltos": 0, "primer_ts": mov['ts'], "ult_ts": mov['ts']}
+    cantidad = abs(mov['delta'])
+    if mov['tipo'] == "SALIDA":
+        saldo['sacados'] += cantidad
+        saldo['pendiente'] += cantidad
+    else:
+        saldo['devueltos'] += cantidad
+        saldo['pendiente'] -= cantidad
+    saldo['ult_ts'] = mov['ts']
+    return saldo if saldo['pendiente'] > 0 else None
+
+
+class LibroPrestamos:
+    def __init__(self):
+        self.saldos = {}  # (empleado, pid) -> saldo
+
+    def aplicar(self, pid, mov):
+        if not es_prestamo(mov): return
+        clave = (mov.get('empleado') or "Desconocido", pid)
+        saldo = acumular_prestamo(self.saldos.get(clave), mov)
+        if saldo is None:
+            self.saldos.pop(clave, None)
+        else:
+            self.saldos[clave] = saldo
+
+    def descartar_pieza(self, pid):
+        for clave in [c for c in self.saldos if c[1] == pid]:
+            del self.saldos[clave]
+
+    def aplicar_efectos(self, efectos):
+        # Mismos efectos que aplicar_efectos_historial: alta / baja descartan, "mov" acumula
+        for efecto in efectos:
+            if efecto[0] == "reinicio":
+                self.descartar_pieza(efecto[1])
+            else:
+                self.aplicar(efecto[1], efecto[2])
+
+    def reconstruir(self, inventario):
+        self.saldos = {}
+        if MODO_ALMACENAMIENTO == "sqlite":
+            movimientos = almacen_sqlite().iterar_movimientos()
+        else:
+            movimientos = ((pid, mov) for pid in inventario for mov in leer_segmento(pid))
+        for pid, mov in movimientos:
+            if pid in inventario: self.aplicar(pid, mov)
+
+    def copiar(self):
+        return {clave: dict(saldo) for clave, saldo in self.saldos.items()}
+
+    def abiertos(self):
+        # Por empleado y, dentro de cada uno, del préstamo más viejo al más nuevo
+        return sorted(self.saldos.items(), key=lambda x: (x[0][0], x[1]['primer_ts'] or 0, clave_id(x[0][1])))
+
+
+_libro_prestamos = LibroPrestamos()
+
+
+def sello_snapshot():
+    # Identifica la versión del snapshot JSON (se reemplaza completo en cada escritura)
+    try:
+        st = os.stat(ARCHIVO_DATOS)
+        return [st.st_mtime_ns, st.st_size, st.st_ino]
+    except OSError:
+        return None
+
+
+def leer_prestamos():
+    # None si no existe, está dañado o se guardó con otro snapshot
+    try:
+        with open(ARCHIVO_PRESTAMOS, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        if datos["sello"] != sello_snapshot(): return None
+        return {(empleado, pid): saldo for empleado, pid, saldo in datos["saldos"]}
+    except Exception:
+        return None
+
+
+def escribir_prestamos(saldos):
+    # Se escribe después del snapshot (y de recortar el journal): el sello lo liga a esa versión
+    datos = {"sello": sello_snapshot(), "saldos": [[e, pid, s] for (e, pid), s in saldos.items()]}
+    temporal = ARCHIVO_PRESTAMOS + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ARCHIVO_PRESTAMOS)
+
+
 # --- FUNCIONES DE LOG GLOBAL ---
-def cargar_log_global():
-    if not os.path.exists(ARCHIVO_LOG): return []
+# El log se particiona por mes en CARPETA_LOG:
+#   AAAA-MM.jsonl     -> un evento compacto por línea (JSON Lines), solo se agrega al final
+#   AAAA-MM.idx.json  -> índice {"dd/mm/AAAA": [[inicio, fin], ...]} con los rangos de bytes de cada día
+# Consultar "hoy" o un rango de fechas solo lee los bytes de esos días.
+_indices_log = {}
+
+
+def serializar_evento(evento):
+    return json.dumps(evento, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def leer_eventos_jsonl(f):
+    # Las líneas dañadas (p. ej. la última, cortada por un cierre) se saltan
+    for linea in f:
+        if not linea.strip(): continue
+        try:
+            yield json.loads(linea)
+        except ValueError:
+            continue
+
+
+def rutas_particion_log(fecha):
+    dia, mes, anio = fecha.split("/")
+    base = os.path.join(CARPETA_LOG, f"{anio}-{mes}")
+    return base + ".jsonl", base + ".idx.json"
+
+
+def agregar_rango_indice(indice, fecha, inicio, fin):
+    rangos = indice.setdefault(fecha, [])
+    if rangos and rangos[-1][1] == inicio:
+        rangos[-1][1] = fin
+    else:
+        rangos.append([inicio, fin])
+
+
+def cargar_indice_log(ruta_datos, ruta_idx):
+    if ruta_idx in _indices_log: return _indices_log[ruta_idx]
     try:
-        with open(ARCHIVO_LOG, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(ruta_idx, "r", encoding="utf-8") as f:
+            indice = json.load(f)
     except:
-        return []
+        indice = {}
+
+    # Si hubo un cierre entre la escritura del evento y la del índice, se indexa la cola faltante
+    indexado = max((r[1] for rangos in indice.values() for r in rangos), default=0)
+    if os.path.exists(ruta_datos) and os.path.getsize(ruta_datos) > indexado:
+        with open(ruta_datos, "rb") as f:
+            f.seek(indexado)
+            pos = indexado
+            for linea in f:
+                try:
+                    fecha = json.loads(linea)['fecha']
+                except:
+                    break
+                agregar_rango_indice(indice, fecha, pos, pos + len(linea))
+                pos += len(linea)
+        guardar_indice_log(ruta_idx, indice)
+
+    _indices_log[ruta_idx] = indice
+    return indice
+
+
+def guardar_indice_log(ruta_idx, indice):
+    temporal = ruta_idx + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(indice, f, separators=(",", ":"))
+    os.replace(temporal, ruta_idx)
+
+
+def agregar_eventos_log(eventos):
+    if MODO_ALMACENAMIENTO == "sqlite": return almacen_sqlite().agregar_eventos(eventos)
+    if not os.path.exists(CARPETA_LOG): os.mkdir(CARPETA_LOG)
+    por_particion = {}
+    for evento in eventos:
+        por_particion.setdefault(rutas_particion_log(evento['fecha']), []).append(evento)
+
+    for (ruta_datos, ruta_idx), lote in por_particion.items():
+        indice = cargar_indice_log(ruta_datos, ruta_idx)
+        lineas = [(evento['fecha'], serializar_evento(evento).encode("utf-8")) for evento in lote]
+        with open(ruta_datos, "ab") as f:
+            pos = f.seek(0, os.SEEK_END)
+            f.write(b"".join(linea for _, linea in lineas))
+        for fecha, linea in lineas:
+            agregar_rango_indice(indice, fecha, pos, pos + len(linea))
+            pos += len(linea)
+        guardar_indice_log(ruta_idx, indice)
+
+
+def leer_rangos_log(ruta_datos, rangos):
+    eventos = []
+    try:
+        with open(ruta_datos, "rb") as f:
+            for inicio, fin in rangos:
+                f.seek(inicio)
+                for linea in f.read(fin - inicio).splitlines():
+                    try:
+                        eventos.append(json.loads(linea))
+                    except ValueError:
+                        continue
+    except OSError:
+        pass
+    return eventos
+
+
+def eventos_del_dia(fecha):
+    if MODO_ALMACENAMIENTO == "sqlite": return almacen_sqlite().eventos_del_dia(fecha)
+    ruta_datos, ruta_idx = rutas_particion_log(fecha)
+    if not os.path.exists(ruta_datos): return []
+    rangos = cargar_indice_log(ruta_datos, ruta_idx).get(fecha)
+    return leer_rangos_log(ruta_datos, rangos) if rangos else []
+
+
+def eventos_rango(desde, hasta):
+    # desde / hasta: datetime.date (inclusive). Solo se abren las particiones de los meses del rango,
+    # y de cada una solo se leen los bytes de los días pedidos (rangos del .idx.json)
+    if MODO_ALMACENAMIENTO == "sqlite": return almacen_sqlite().eventos_rango(desde, hasta)
+    eventos = []
+    anio, mes = desde.year, desde.month
+    while (anio, mes) <= (hasta.year, hasta.month):
+        ruta_datos, ruta_idx = rutas_particion_log(f"01/{mes:02d}/{anio}")
+        if os.path.exists(ruta_datos):
+            indice = cargar_indice_log(ruta_datos, ruta_idx)
+            dias = sorted((datetime.datetime.strptime(f, "%d/%m/%Y").date(), f) for f in indice)
+            for dia, fecha in dias:
+                if desde <= dia <= hasta:
+                    eventos.extend(leer_rangos_log(ruta_datos, indice[fecha]))
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return eventos
+
+
+def migrar_log_global():
+    # Conversión única de los formatos anteriores (arreglo JSON y JSON Lines en un solo archivo)
+    for ruta in (ARCHIVO_LOG_ANTIGUO, ARCHIVO_LOG_JSONL):
+        if not os.path.exists(ruta): continue
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                if ruta == ARCHIVO_LOG_ANTIGUO:
+                    agregar_eventos_log(json.load(f))
+                else:
+                    lote = []
+                    for evento in leer_eventos_jsonl(f):
+                        lote.append(evento)
+                        if len(lote) >= 10000:
+                            agregar_eventos_log(lote)
+                            lote = []
+                    agregar_eventos_log(lote)
+            os.replace(ruta, ruta + ".migrado")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo migrar el historial global: {e}")
 
 
-def registrar_accion_global(accion, codigo, nombre, detalle_extra=""):
-    log = cargar_log_global()
+def crear_evento_global(accion, codigo, nombre, detalle_extra="", empleado=None):
     ahora = datetime.datetime.now()
     nuevo_evento = {
         "fecha": ahora.strftime("%d/%m/%Y"),
@@ -125,14 +804,1182 @@ def registrar_accion_global(accion, codigo, nombre, detalle_extra=""):
         "nombre": nombre,
         "detalle": detalle_extra
     }
-    log.append(nuevo_evento)
+    if empleado: nuevo_evento["empleado"] = empleado
+    return nuevo_evento
+
+
+def registrar_accion_global(accion, codigo, nombre, detalle_extra="", empleado=None):
+    registrar_acciones_globales([crear_evento_global(accion, codigo, nombre, detalle_extra, empleado)])
+
+
+def registrar_acciones_globales(eventos):
+    # Todos los eventos de una transacción se agregan en una sola escritura
     try:
-        with open(ARCHIVO_LOG, "w", encoding="utf-8") as f:
-            json.dump(log, f, indent=4)
+        agregar_eventos_log(eventos)
     except:
         pass
 
 
+def reemplazar_datos(inventario):
+    # Reemplazo completo del inventario (restauración de respaldos); lanza excepción si falla
+    if MODO_ALMACENAMIENTO == "sqlite":
+        with almacen_sqlite().conexion:
+            almacen_sqlite().reemplazar_inventario(inventario)
+        separar_historial(inventario, segmentos=False)
+        _cache_historial.descartar()
+        _libro_prestamos.saldos = almacen_sqlite().cargar_prestamos()
+        return
+    separar_historial(inventario)
+    escribir_snapshot(inventario)
+    open(ARCHIVO_JOURNAL, "w").close()
+    # El historial de las piezas que no existen en el respaldo ya no corresponde a nada
+    if os.path.exists(CARPETA_MOVIMIENTOS):
+        for nombre in os.listdir(CARPETA_MOVIMIENTOS):
+            if nombre.endswith(".jsonl") and nombre[:-len(".jsonl")] not in inventario:
+                os.remove(os.path.join(CARPETA_MOVIMIENTOS, nombre))
+    _cache_historial.descartar()
+    _libro_prestamos.reconstruir(inventario)
+    escribir_prestamos(_libro_prestamos.saldos)
+
+
+def exportar_json(inventario, ruta):
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(inventario, archivo, indent=4)
+    os.replace(temporal, ruta)
+
+
+# --- ALMACENAMIENTO SQLITE (OPCIONAL) ---
+# Misma interfaz que el modo JSON: cargar / checkpoint / aplicar(mutación) / eventos.
+# Cada mutación del journal se traduce a una actualización por fila.
+class AlmacenSQLite:
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS piezas (
+            id TEXT PRIMARY KEY, codigo TEXT, nombre TEXT, cantidad INTEGER,
+            gabinete TEXT, descripcion TEXT, punto_critico INTEGER, punto_bajo INTEGER);
+        CREATE TABLE IF NOT EXISTS movimientos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, pieza_id TEXT NOT NULL, fecha TEXT,
+            tipo TEXT, empleado TEXT, delta INTEGER, saldo INTEGER, linea TEXT, ts INTEGER);
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, fecha TEXT, hora TEXT, accion TEXT,
+            codigo TEXT, nombre TEXT, detalle TEXT, empleado TEXT);
+        CREATE INDEX IF NOT EXISTS idx_piezas_codigo ON piezas (lower(trim(codigo)));
+        CREATE INDEX IF NOT EXISTS idx_piezas_gabinete ON piezas (gabinete);
+        CREATE INDEX IF NOT EXISTS idx_movimientos_pieza ON movimientos (pieza_id, id);
+        CREATE INDEX IF NOT EXISTS idx_movimientos_empleado ON movimientos (empleado);
+        CREATE INDEX IF NOT EXISTS idx_eventos_fecha ON eventos (fecha);
+        CREATE INDEX IF NOT EXISTS idx_eventos_empleado ON eventos (empleado);
+        CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+        CREATE TABLE IF NOT EXISTS prestamos (
+            empleado TEXT NOT NULL, pieza_id TEXT NOT NULL, pendiente INTEGER, sacados INTEGER,
+            devueltos INTEGER, primer_ts INTEGER, ult_ts INTEGER, PRIMARY KEY (empleado, pieza_id));
+    """
+    COLUMNAS_PRESTAMO = ("pendiente", "sacados", "devueltos", "primer_ts", "ult_ts")
+
+    def __init__(self, ruta):
+        nueva = not os.path.exists(ruta)
+        self.conexion = sqlite3.connect(ruta)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript(self.ESQUEMA)
+        if "ts" not in {c[1] for c in self.conexion.execute("PRAGMA table_info(movimientos)")}:
+            # Bases anteriores: la marca de tiempo se calcula de la fecha local ya guardada
+            with self.conexion:
+                self.conexion.execute("ALTER TABLE movimientos ADD COLUMN ts INTEGER")
+                self.conexion.execute("UPDATE movimientos SET ts = CAST(strftime('%s', fecha, 'utc') AS INTEGER)")
+        # Los rangos de movimientos se piden por marca de tiempo; "fecha" es texto local y solo se muestra
+        self.conexion.executescript("DROP INDEX IF EXISTS idx_movimientos_fecha;"
+                                    "CREATE INDEX IF NOT EXISTS idx_movimientos_ts ON movimientos (ts);")
+        if "punto_critico" not in {c[1] for c in self.conexion.execute("PRAGMA table_info(piezas)")}:
+            # Bases anteriores: NULL = puntos de reorden por defecto
+            with self.conexion:
+                self.conexion.execute("ALTER TABLE piezas ADD COLUMN punto_critico INTEGER")
+                self.conexion.execute("ALTER TABLE piezas ADD COLUMN punto_bajo INTEGER")
+        if nueva: self.importar_json()
+        if self.leer_meta("prestamos") is None:
+            # Bases anteriores al libro de préstamos: se arma una vez desde la tabla de movimientos
+            with self.conexion:
+                self.guardar_prestamos(self.calcular_prestamos())
+
+    # Las fechas de eventos se guardan como AAAA-MM-DD para poder indexar rangos
+    @staticmethod
+    def fecha_iso(fecha):
+        dia, mes, anio = fecha.split("/")
+        return f"{anio}-{mes}-{dia}"
+
+    @staticmethod
+    def movimiento_desde_fila(fila):
+        ts, tipo, empleado, delta, saldo, linea = fila
+        # Filas importadas del formato anterior: solo el texto trae el saldo
+        if linea is not None and (ts is None or saldo is None): return movimiento_desde_linea(linea)
+        return {"ts": ts, "tipo": tipo, "empleado": empleado, "delta": delta, "saldo": saldo}
+
+    def insertar_movimiento(self, pid, mov):
+        self.conexion.execute(
+            "INSERT INTO movimientos (pieza_id, fecha, tipo, empleado, delta, saldo, linea, ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (pid, fecha_movimiento(mov['ts']) if mov['ts'] is not None else None, mov['tipo'], mov['empleado'],
+             mov['delta'], mov['saldo'], mov.get('texto'), mov['ts']))
+
+    @staticmethod
+    def evento_desde_fila(fila):
+        anio, mes, dia = fila[0].split("-")
+        evento = {"fecha": f"{dia}/{mes}/{anio}", "hora": fila[1], "accion": fila[2], "codigo": fila[3],
+                  "nombre": fila[4], "detalle": fila[5]}
+        if fila[6]: evento["empleado"] = fila[6]
+        return evento
+
+    def importar_json(self):
+        # Primera ejecución: se importa el inventario y el historial global existentes en JSON
+        migrados = []
+        with self.conexion:
+            inventario = cargar_datos_json()
+            for pid, pieza in inventario.items():
+                pieza['historial'] = list(reversed(leer_segmento(pid)))
+            self.reemplazar_inventario(inventario)
+            eventos = []
+            for ruta in (ARCHIVO_LOG_ANTIGUO, ARCHIVO_LOG_JSONL):
+                if not os.path.exists(ruta): continue
+                with open(ruta, "r", encoding="utf-8") as f:
+                    if ruta == ARCHIVO_LOG_ANTIGUO:
+                        try:
+                            eventos.extend(json.load(f))
+                        except ValueError:
+                            continue  # Dañado: queda para migrar_log_global, que avisa del error
+                    else:
+                        eventos.extend(leer_eventos_jsonl(f))
+                migrados.append(ruta)
+            self.insertar_eventos(eventos)
+            if os.path.exists(CARPETA_LOG):
+                for nombre in sorted(os.listdir(CARPETA_LOG)):
+                    if not nombre.endswith(".jsonl"): continue
+                    with open(os.path.join(CARPETA_LOG, nombre), "r", encoding="utf-8") as f:
+                        self.insertar_eventos(leer_eventos_jsonl(f))
+        # Ya están en la tabla eventos: migrar_log_global no los debe volver a importar
+        for ruta in migrados:
+            os.replace(ruta, ruta + ".migrado")
+
+    def reemplazar_inventario(self, inventario):
+        self.conexion.execute("DELETE FROM piezas")
+        for pid, pieza in inventario.items():
+            self.insertar_pieza(pid, pieza)
+        self.conexion.execute("DELETE FROM movimientos WHERE pieza_id NOT IN (SELECT id FROM piezas)")
+        self.guardar_prestamos(self.calcular_prestamos())
+
+    def insertar_pieza(self, pid, pieza):
+        self.conexion.execute(
+            "INSERT OR REPLACE INTO piezas (id, codigo, nombre, cantidad, gabinete, descripcion, punto_critico, "
+            "punto_bajo) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (pid, pieza.get('codigo', ''), pieza['nombre'], int(pieza['cantidad']), pieza['gabinete'],
+             pieza['descripcion'], pieza.get('punto_critico'), pieza.get('punto_bajo')))
+        if 'historial' not in pieza: return
+        # Historial incluido en la pieza (importación o respaldo viejo): reemplaza al de la tabla.
+        # Viene de más nuevo a más viejo; en la tabla el id crece con el tiempo.
+        self.conexion.execute("DELETE FROM movimientos WHERE pieza_id = ?", (pid,))
+        for mov in reversed(pieza['historial']):
+            self.insertar_movimiento(pid, mov if isinstance(mov, dict) else movimiento_desde_linea(mov))
+
+    def insertar_eventos(self, eventos):
+        self.conexion.executemany(
+            "INSERT INTO eventos (fecha, hora, accion, codigo, nombre, detalle, empleado) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((self.fecha_iso(e['fecha']), e['hora'], e['accion'], str(e['codigo']), e['nombre'], e['detalle'],
+              e.get('empleado')) for e in eventos))
+
+    def cargar(self):
+        inventario = {}
+        for pid, codigo, nombre, cantidad, gabinete, descripcion, punto_critico, punto_bajo in self.conexion.execute(
+                "SELECT id, codigo, nombre, cantidad, gabinete, descripcion, punto_critico, punto_bajo FROM piezas"):
+            inventario[pid] = {"codigo": codigo, "nombre": nombre, "cantidad": cantidad, "gabinete": gabinete,
+                               "descripcion": descripcion}
+            if punto_critico is not None: inventario[pid]['punto_critico'] = punto_critico
+            if punto_bajo is not None: inventario[pid]['punto_bajo'] = punto_bajo
+        # Solo el último movimiento de cada pieza; el historial completo se consulta al abrirla
+        for pid, ts, tipo in self.conexion.execute(
+                "SELECT m.pieza_id, m.ts, m.tipo FROM movimientos m JOIN "
+                "(SELECT pieza_id, MAX(id) AS id FROM movimientos GROUP BY pieza_id) u ON m.id = u.id"):
+            if pid in inventario: inventario[pid]['ult_ts'], inventario[pid]['ult_tipo'] = ts, tipo
+        return inventario
+
+    def iterar_movimientos(self):
+        # Todos los movimientos, del más viejo al más nuevo: [(pid, mov), ...]
+        return [(f[0], self.movimiento_desde_fila(f[1:])) for f in self.conexion.execute(
+            "SELECT pieza_id, ts, tipo, empleado, delta, saldo, linea FROM movimientos ORDER BY id")]
+
+    def calcular_prestamos(self):
+        libro = LibroPrestamos()
+        for pid, mov in self.iterar_movimientos():
+            libro.aplicar(pid, mov)
+        return libro.saldos
+
+    def guardar_prestamos(self, saldos):
+        # Dentro de la transacción de quien llama
+        self.conexion.execute("DELETE FROM prestamos")
+        self.conexion.executemany(
+            "INSERT INTO prestamos (empleado, pieza_id, pendiente, sacados, devueltos, primer_ts, ult_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((e, pid) + tuple(s[c] for c in self.COLUMNAS_PRESTAMO) for (e, pid), s in saldos.items()))
+        self.conexion.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('prestamos', '1')")
+
+    def cargar_prestamos(self):
+        return {(f[0], f[1]): dict(zip(self.COLUMNAS_PRESTAMO, f[2:])) for f in self.conexion.execute(
+            "SELECT empleado, pieza_id, pendiente, sacados, devueltos, primer_ts, ult_ts FROM prestamos")}
+
+    def actualizar_prestamo(self, pid, mov):
+        if not es_prestamo(mov): return
+        empleado = mov.get('empleado') or "Desconocido"
+        fila = self.conexion.execute(
+            "SELECT pendiente, sacados, devueltos, primer_ts, ult_ts FROM prestamos WHERE empleado = ? AND pieza_id = ?",
+            (empleado, pid)).fetchone()
+        saldo = acumular_prestamo(dict(zip(self.COLUMNAS_PRESTAMO, fila)) if fila else None, mov)
+        if saldo is None:
+            self.conexion.execute("DELETE FROM prestamos WHERE empleado = ? AND pieza_id = ?", (empleado, pid))
+        else:
+            self.conexion.execute(
+                "INSERT OR REPLACE INTO prestamos (empleado, pieza_id, pendiente, sacados, devueltos, primer_ts, "
+                "ult_ts) VALUES (?, ?, ?, ?, ?, ?, ?)", (empleado, pid) + tuple(saldo[c] for c in self.COLUMNAS_PRESTAMO))
+
+    def historial(self, pid):
+        return [self.movimiento_desde_fila(f) for f in self.conexion.execute(
+            "SELECT ts, tipo, empleado, delta, saldo, linea FROM movimientos WHERE pieza_id = ? ORDER BY id DESC",
+            (pid,))]
+
+    def aplicar(self, registro):
+        # Una mutación (o un lote completo) = una transacción
+        with self.conexion:
+            self.aplicar_filas(registro)
+
+    def aplicar_filas(self, registro):
+        op, pid = registro.get("op"), registro.get("id")
+        if op == "lote":
+            for sub in registro["registros"]: self.aplicar_filas(sub)
+        elif op == "alta":
+            self.conexion.execute("DELETE FROM movimientos WHERE pieza_id = ?", (pid,))
+            self.conexion.execute("DELETE FROM prestamos WHERE pieza_id = ?", (pid,))
+            self.insertar_pieza(pid, registro["pieza"])
+        elif op == "editar":
+            campos = registro["campos"]
+            columnas = [c for c in ("codigo", "nombre", "cantidad", "gabinete", "descripcion", "punto_critico",
+                                    "punto_bajo") if c in campos]
+            if columnas:
+                self.conexion.execute(
+                    f"UPDATE piezas SET {', '.join(c + ' = ?' for c in columnas)} WHERE id = ?",
+                    [campos[c] for c in columnas] + [pid])
+        elif op == "baja":
+            self.conexion.execute("DELETE FROM piezas WHERE id = ?", (pid,))
+            self.conexion.execute("DELETE FROM movimientos WHERE pieza_id = ?", (pid,))
+            self.conexion.execute("DELETE FROM prestamos WHERE pieza_id = ?", (pid,))
+        elif op == "mov":
+            mov = movimiento_de_registro(registro)
+            self.conexion.execute("UPDATE piezas SET cantidad = ? WHERE id = ?", (registro['cantidad'], pid))
+            self.insertar_movimiento(pid, mov)
+            self.actualizar_prestamo(pid, mov)
+
+    def leer_meta(self, clave):
+        fila = self.conexion.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    def guardar_meta(self, clave, valor):
+        with self.conexion:
+            self.conexion.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, str(valor)))
+
+    def checkpoint(self):
+        try:
+            self.conexion.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error:
+            pass
+
+    def agregar_eventos(self, eventos):
+        with self.conexion:
+            self.insertar_eventos(eventos)
+
+    def eventos_del_dia(self, fecha):
+        return [self.evento_desde_fila(f) for f in self.conexion.execute(
+            "SELECT fecha, hora, accion, codigo, nombre, detalle, empleado FROM eventos WHERE fecha = ? ORDER BY id",
+            (self.fecha_iso(fecha),))]
+
+    def eventos_rango(self, desde, hasta):
+        return [self.evento_desde_fila(f) for f in self.conexion.execute(
+            "SELECT fecha, hora, accion, codigo, nombre, detalle, empleado FROM eventos "
+            "WHERE fecha BETWEEN ? AND ? ORDER BY fecha, id", (desde.isoformat(), hasta.isoformat()))]
+
+
+_almacen_sqlite = None
+
+
+def almacen_sqlite():
+    global _almacen_sqlite
+    if _almacen_sqlite is None: _almacen_sqlite = AlmacenSQLite(ARCHIVO_SQLITE)
+    return _almacen_sqlite
+
+
+# --- RESPALDOS INCREMENTALES ---
+# Cada punto de respaldo es un archivo .resp (JSON comprimido con gzip):
+#   base:  manifiesto completo {pid: hash} + todos los objetos {hash: pieza}
+#   delta: solo los pid que cambiaron respecto al punto "padre", los dados de baja
+#          y los objetos cuyo hash todavía no existe en la cadena.
+# Las piezas sin cambios no se vuelven a guardar (deduplicación por hash de contenido).
+EXTENSION_RESPALDO = ".resp"
+_candado_respaldos = threading.Lock()
+
+
+def hash_pieza(pieza):
+    contenido = json.dumps(pieza, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+
+
+def leer_punto_respaldo(ruta):
+    with gzip.open(ruta, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def escribir_punto_respaldo(ruta, punto):
+    temporal = ruta + ".tmp"
+    with gzip.open(temporal, "wt", encoding="utf-8") as f:
+        json.dump(punto, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporal, ruta)
+
+
+def marca_tiempo_respaldo(nombre):
+    # "Respaldo_Auto_2026-01-07_15-30-00.resp" -> "2026-01-07_15-30-00"
+    return os.path.splitext(nombre)[0].split("_", 2)[-1]
+
+
+def listar_puntos_respaldo(carpeta=None):
+    carpeta = carpeta or CARPETA_RESPALDOS
+    if not os.path.exists(carpeta): return []
+    return sorted((n for n in os.listdir(carpeta) if n.endswith(EXTENSION_RESPALDO)), key=marca_tiempo_respaldo)
+
+
+def cadena_respaldo(nombre, carpeta=None):
+    # Puntos desde la base hasta 'nombre' (inclusive), en orden cronológico
+    carpeta = carpeta or CARPETA_RESPALDOS
+    cadena = []
+    while nombre:
+        punto = leer_punto_respaldo(os.path.join(carpeta, nombre))
+        cadena.append(punto)
+        nombre = punto.get("padre")
+    cadena.reverse()
+    return cadena
+
+
+def combinar_cadena(cadena):
+    manifiesto, objetos = {}, {}
+    for punto in cadena:
+        manifiesto.update(punto["manifiesto"])
+        for pid in punto.get("bajas", []): manifiesto.pop(pid, None)
+        objetos.update(punto["objetos"])
+    return manifiesto, objetos
+
+
+def reconstruir_respaldo(ruta):
+    manifiesto, objetos = combinar_cadena(cadena_respaldo(os.path.basename(ruta), os.path.dirname(ruta)))
+    return {pid: objetos[h] for pid, h in manifiesto.items()}
+
+
+def crear_punto_respaldo(inventario, etiqueta="Auto"):
+    # Devuelve el nombre del archivo creado, o None si no hubo cambios desde el último punto
+    with _candado_respaldos:
+        if not os.path.exists(CARPETA_RESPALDOS): os.mkdir(CARPETA_RESPALDOS)
+        manifiesto = {pid: hash_pieza(p) for pid, p in inventario.items()}
+
+        puntos = listar_puntos_respaldo()
+        padre = puntos[-1] if puntos else None
+        try:
+            cadena = cadena_respaldo(padre) if padre else []
+        except Exception:
+            # Cadena incompleta (archivo borrado o dañado): se empieza una base nueva
+            cadena = []
+
+        if cadena and len(cadena) <= MAX_DELTAS_RESPALDO:
+            previo, conocidos = combinar_cadena(cadena)
+            cambios = {pid: h for pid, h in manifiesto.items() if previo.get(pid) != h}
+            bajas = [pid for pid in previo if pid not in manifiesto]
+            if not cambios and not bajas and etiqueta == "Auto": return None
+            punto = {"formato": 1, "tipo": "delta", "padre": padre, "manifiesto": cambios, "bajas": bajas,
+                     "objetos": {h: inventario[pid] for pid, h in cambios.items() if h not in conocidos}}
+        else:
+            punto = {"formato": 1, "tipo": "base", "padre": None, "manifiesto": manifiesto, "bajas": [],
+                     "objetos": {h: inventario[pid] for pid, h in manifiesto.items()}}
+
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        nombre = f"Respaldo_{etiqueta}_{timestamp}{EXTENSION_RESPALDO}"
+        escribir_punto_respaldo(os.path.join(CARPETA_RESPALDOS, nombre), punto)
+        return nombre
+
+
+# --- RETENCIÓN Y COMPACTACIÓN DE RESPALDOS ---
+def fecha_respaldo(nombre):
+    try:
+        return datetime.datetime.strptime(marca_tiempo_respaldo(nombre), "%Y-%m-%d_%H-%M-%S")
+    except ValueError:
+        return None
+
+
+def seleccionar_respaldos_a_conservar(nombres, politica=None, ahora=None):
+    politica = politica or POLITICA_RESPALDOS
+    hoy = (ahora or datetime.datetime.now()).date()
+    conservar, por_dia, por_mes = set(), {}, {}
+    fechados = []
+    for nombre in nombres:
+        fecha = fecha_respaldo(nombre)
+        if fecha is None:
+            conservar.add(nombre)  # nombre desconocido: no se toca
+        else:
+            fechados.append((fecha, nombre))
+
+    # En orden cronológico, el último de cada día / mes es el que queda como representante
+    for fecha, nombre in sorted(fechados):
+        if politica.get("conservar_manuales", True) and nombre.startswith("Respaldo_MANUAL_"):
+            conservar.add(nombre)
+            continue
+        edad = (hoy - fecha.date()).days
+        if edad < politica["dias_completos"]:
+            conservar.add(nombre)
+        elif edad < politica["dias_diarios"]:
+            por_dia[fecha.date()] = nombre
+        else:
+            por_mes[(fecha.year, fecha.month)] = nombre
+
+    conservar.update(por_dia.values())
+    meses = sorted(por_mes)
+    if politica.get("meses_mensuales") is not None:
+        meses = meses[len(meses) - politica["meses_mensuales"]:] if politica["meses_mensuales"] > 0 else []
+    conservar.update(por_mes[m] for m in meses)
+    return conservar
+
+
+def fusionar_puntos(anterior, siguiente):
+    # 'siguiente' absorbe a 'anterior' para poder borrar 'anterior' sin romper la cadena.
+    # Los objetos se conservan todos: los deltas posteriores pueden depender de ellos.
+    manifiesto = dict(anterior["manifiesto"])
+    bajas = set(anterior.get("bajas", []))
+    for pid in siguiente.get("bajas", []):
+        manifiesto.pop(pid, None)
+        bajas.add(pid)
+    for pid, h in siguiente["manifiesto"].items():
+        manifiesto[pid] = h
+        bajas.discard(pid)
+    objetos = dict(anterior["objetos"])
+    objetos.update(siguiente["objetos"])
+    return {"formato": 1, "tipo": anterior["tipo"], "padre": anterior.get("padre"), "manifiesto": manifiesto,
+            "bajas": [] if anterior["tipo"] == "base" else sorted(bajas), "objetos": objetos}
+
+
+def podar_respaldos(politica=None, ahora=None):
+    # Devuelve cuántos archivos se eliminaron
+    with _candado_respaldos:
+        if not os.path.exists(CARPETA_RESPALDOS): return 0
+        nombres = [n for n in os.listdir(CARPETA_RESPALDOS)
+                   if n.startswith("Respaldo_") and (n.endswith(".json") or n.endswith(EXTENSION_RESPALDO))]
+        conservar = seleccionar_respaldos_a_conservar(nombres, politica, ahora)
+        puntos_resp = listar_puntos_respaldo()
+        if puntos_resp: conservar.add(puntos_resp[-1])  # el último punto es la base de los siguientes deltas
+        eliminados = 0
+
+        # Copias completas del formato anterior: se borran directamente
+        for nombre in nombres:
+            if nombre.endswith(".json") and nombre not in conservar:
+                try:
+                    os.remove(os.path.join(CARPETA_RESPALDOS, nombre))
+                    eliminados += 1
+                except OSError:
+                    pass
+
+        # Puntos incrementales: antes de borrar uno, su hijo lo absorbe (compactación)
+        borrar = [n for n in puntos_resp if n not in conservar]
+        if not borrar: return eliminados
+        puntos = {}
+        for nombre in puntos_resp:
+            try:
+                puntos[nombre] = leer_punto_respaldo(os.path.join(CARPETA_RESPALDOS, nombre))
+            except Exception:
+                continue
+        # Dos puntos creados en el mismo segundo pueden colgar del mismo padre: se guardan todos los hijos
+        hijos = {}
+        for n, p in puntos.items():
+            if p.get("padre"): hijos.setdefault(p["padre"], []).append(n)
+
+        for nombre in borrar:
+            if nombre not in puntos: continue
+            for hijo in hijos.pop(nombre, []):
+                if hijo not in puntos: continue
+                puntos[hijo] = fusionar_puntos(puntos[nombre], puntos[hijo])
+                escribir_punto_respaldo(os.path.join(CARPETA_RESPALDOS, hijo), puntos[hijo])
+                if puntos[hijo]["padre"]: hijos.setdefault(puntos[hijo]["padre"], []).append(hijo)
+            os.remove(os.path.join(CARPETA_RESPALDOS, nombre))
+            del puntos[nombre]
+            eliminados += 1
+        return eliminados
+
+
+# --- CONTADOR DE IDS ---
+# El próximo ID se guarda aparte (ARCHIVO_IDS, o la tabla meta en SQLite) y solo avanza: los IDs de
+# piezas eliminadas no se vuelven a asignar. Se persiste antes de usar el ID; si el programa se
+# cierra en medio, como mucho queda un hueco en la numeración.
+def leer_contador_ids():
+    try:
+        if MODO_ALMACENAMIENTO == "sqlite": return int(almacen_sqlite().leer_meta("siguiente_id") or 0)
+        with open(ARCHIVO_IDS, "r", encoding="utf-8") as f:
+            return int(json.load(f)["siguiente_id"])
+    except Exception:
+        return 0
+
+
+def guardar_contador_ids(siguiente):
+    # Lanza excepción si no se pudo guardar
+    if MODO_ALMACENAMIENTO == "sqlite": return almacen_sqlite().guardar_meta("siguiente_id", siguiente)
+    temporal = ARCHIVO_IDS + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({"siguiente_id": siguiente}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ARCHIVO_IDS)
+
+
+class ContadorIds:
+    def __init__(self, inventario):
+        self.siguiente = max(leer_contador_ids(), 1)
+        self.ajustar(inventario)
+
+    def ajustar(self, inventario):
+        # Sin archivo de contador (o con piezas restauradas) nunca queda por debajo del ID más alto
+        maximo = max((int(pid) for pid in inventario if pid.isdigit()), default=0)
+        self.siguiente = max(self.siguiente, maximo + 1)
+
+    def proximo(self):
+        # Solo consulta (para mostrarlo en el formulario); no lo reserva
+        return str(self.siguiente)
+
+    def reservar(self, cantidad=1):
+        # Reserva un rango de IDs consecutivos de una sola vez (p. ej. para una importación masiva)
+        inicio = self.siguiente
+        guardar_contador_ids(inicio + cantidad)
+        self.siguiente = inicio + cantidad
+        return [str(i) for i in range(inicio, inicio + cantidad)]
+
+
+# --- ÍNDICE DE CÓDIGOS ---
+# codigo normalizado -> pids que lo usan (normalmente uno; más de uno solo en datos viejos con repetidos).
+# Se mantiene en cada alta, edición y baja para que buscar un código no recorra todo el inventario.
+def normalizar_codigo(codigo):
+    return str(codigo).strip().lower()
+
+
+class IndiceCodigos:
+    def __init__(self, inventario=None):
+        self.pids = {}
+        if inventario: self.reconstruir(inventario)
+
+    def reconstruir(self, inventario):
+        self.pids = {}
+        for pid, pieza in inventario.items():
+            self.agregar(pid, pieza)
+
+    def agregar(self, pid, pieza):
+        codigo = normalizar_codigo(pieza.get('codigo', ''))
+        if codigo: self.pids.setdefault(codigo, []).append(pid)
+
+    def quitar(self, pid, pieza):
+        codigo = normalizar_codigo(pieza.get('codigo', ''))
+        pids = self.pids.get(codigo)
+        if not pids or pid not in pids: return
+        pids.remove(pid)
+        if not pids: del self.pids[codigo]
+
+    def buscar(self, codigo, excluir=None):
+        for pid in self.pids.get(normalizar_codigo(codigo), ()):
+            if excluir is None or str(pid) != str(excluir): return pid
+        return None
+
+    def repetidos(self):
+        return {codigo: pids for codigo, pids in self.pids.items() if len(pids) > 1}
+
+
+# --- ÍNDICE DE BÚSQUEDA POR N-GRAMAS ---
+# Índice invertido trigrama -> pids sobre codigo, nombre y descripcion sin acentos y en minúsculas.
+# Una búsqueda por subcadena solo revisa las piezas que contienen todos los trigramas del término;
+# la aproximada ordena por cuántos trigramas del término comparte cada pieza.
+# Los tres campos se guardan unidos por "\0" para comprobar cada candidato con un solo "in".
+TAMANO_NGRAMA = 3
+
+
+def normalizar_texto(texto):
+    # "Llave Allén" -> "llave allen"
+    texto = str(texto)
+    if texto.isascii(): return texto.lower()
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c)).casefold()
+
+
+def clave_id(pid):
+    return int(pid) if pid.isdigit() else 0
+
+
+class IndiceNgramas:
+    CAMPOS = ('codigo', 'nombre', 'descripcion')
+
+    def __init__(self, inventario=None):
+        self.postings = {}
+        self.textos = {}
+        # Cambia con cada alta/baja en el índice: invalida resultados guardados
+        self.version = 0
+        self.orden, self.version_orden = [], -1
+        if inventario: self.reconstruir(inventario)
+
+    @staticmethod
+    def ngramas(texto):
+        # Los trigramas que cruzan el separador "\0" nunca coinciden con un término buscado
+        return {texto[i:i + TAMANO_NGRAMA] for i in range(len(texto) - TAMANO_NGRAMA + 1)}
+
+    def reconstruir(self, inventario):
+        self.postings, self.textos = {}, {}
+        with sin_recolector():
+            for pid, pieza in inventario.items():
+                self.agregar(pid, pieza)
+
+    def agregar(self, pid, pieza):
+        texto = "\0".join(normalizar_texto(pieza.get(c, '')) for c in self.CAMPOS)
+        self.textos[pid] = texto
+        self.version += 1
+        postings = self.postings
+        for ngrama in self.ngramas(texto):
+            pids = postings.get(ngrama)
+            if pids is None:
+                postings[ngrama] = {pid}
+            else:
+                pids.add(pid)
+
+    def quitar(self, pid):
+        texto = self.textos.pop(pid, None)
+        if texto is None: return
+        self.version += 1
+        for ngrama in self.ngramas(texto):
+            pids = self.postings.get(ngrama)
+            if pids is None: continue
+            pids.discard(pid)
+            if not pids: del self.postings[ngrama]
+
+    def cambio(self, anterior, nueva):
+        return any(normalizar_texto(anterior.get(c, '')) != normalizar_texto(nueva.get(c, '')) for c in self.CAMPOS)
+
+    def candidatos(self, termino):
+        # None = todas las piezas: términos más cortos que un trigrama (se revisan todos los textos)
+        ngramas = self.ngramas(termino)
+        if not ngramas: return None
+        listas = sorted((self.postings.get(g, ()) for g in ngramas), key=len)
+        resultado = set(listas[0])
+        for pids in listas[1:]:
+            if not resultado: break
+            resultado &= pids
+        return resultado
+
+    def ordenados(self):
+        # Todos los pids por ID, recalculado solo si el índice cambió. La versión se lee antes de
+        # ordenar: si el índice cambia mientras tanto (hilo de búsqueda), se vuelve a ordenar luego
+        version = self.version
+        if self.version_orden != version:
+            self.orden, self.version_orden = sorted(self.textos, key=clave_id), version
+        return self.orden
+
+    def buscar(self, termino):
+        termino = normalizar_texto(termino).strip().replace("\0", "")
+        textos = self.textos
+        if not termino: return list(self.ordenados())
+        candidatos = self.candidatos(termino)
+        if candidatos is None:
+            return [pid for pid in self.ordenados() if termino in textos[pid]]
+        if len(candidatos) * 4 < len(textos):
+            return sorted((pid for pid in candidatos if termino in textos[pid]), key=clave_id)
+        # Muchos candidatos: es más barato recorrer el orden ya calculado que ordenarlos
+        return [pid for pid in self.ordenados() if pid in candidatos and termino in textos[pid]]
+
+    def buscar_por_partes(self, termino, base=None, tamano=TAMANO_PARTE_BUSQUEDA):
+        # Como buscar() (o refinar() si se da "base"), pero entrega las coincidencias por partes, en
+        # orden de ID. Corre en el hilo de búsqueda: recorre listas que no se modifican (el orden se
+        # reemplaza, no se cambia) y lee los textos con get; si el índice cambia a la vez puede
+        # lanzar RuntimeError / KeyError, y quien llama repite la búsqueda.
+        termino = normalizar_texto(termino).strip().replace("\0", "")
+        textos = self.textos
+        if base is not None:
+            recorrido, candidatos = base, None
+        elif not termino:
+            orden = self.ordenados()
+            for i in range(0, len(orden), tamano):
+                yield orden[i:i + tamano]
+            return
+        else:
+            candidatos = self.candidatos(termino)
+            if candidatos is not None and len(candidatos) * 4 < len(textos):
+                yield sorted((pid for pid in candidatos if termino in textos.get(pid, "")), key=clave_id)
+                return
+            recorrido = self.ordenados()
+        for i in range(0, len(recorrido), tamano):
+            yield [pid for pid in recorrido[i:i + tamano]
+                   if (candidatos is None or pid in candidatos) and termino in textos.get(pid, "")]
+
+    def buscar_aproximado(self, termino, limite=LIMITE_APROXIMADOS):
+        # Tolera errores de dedo: las piezas se ordenan por la fracción de trigramas del término que
+        # contienen (a igual puntaje, primero el texto más corto, que es la coincidencia más específica)
+        termino = normalizar_texto(termino).strip().replace("\0", "")
+        ngramas = self.ngramas(termino)
+        if not ngramas: return []
+        listas = sorted((self.postings.get(g, ()) for g in ngramas), key=len)
+        minimo = math.ceil(SIMILITUD_MINIMA * len(listas))
+        # Quien tenga al menos "minimo" trigramas aparece en alguna de las len - minimo + 1 listas más
+        # cortas: solo esas se recorren; las largas (trigramas muy comunes) solo se consultan
+        cortas, largas = listas[:len(listas) - minimo + 1], listas[len(listas) - minimo + 1:]
+        conteo = Counter()
+        for pids in cortas:
+            conteo.update(pids)
+        for pids in largas:
+            for pid in conteo:
+                if pid in pids: conteo[pid] += 1
+        textos = self.textos
+        return heapq.nsmallest(limite, (pid for pid, n in conteo.items() if n >= minimo),
+                               key=lambda pid: (-conteo[pid], len(textos.get(pid, "")), clave_id(pid)))
+
+    def refinar(self, termino, pids):
+        # Filtra un resultado anterior (ya ordenado) con un término más largo
+        termino = normalizar_texto(termino).strip().replace("\0", "")
+        textos = self.textos
+        return [pid for pid in pids if termino in textos.get(pid, "")]
+
+
+class BusquedaIncremental:
+    # Recuerda el último término: si el nuevo lo contiene, solo se filtra el resultado anterior.
+    # Sin coincidencias exactas se recurre a la búsqueda aproximada ("aproximada" queda en True).
+    def __init__(self, indice):
+        self.indice = indice
+        self.termino = None
+        self.resultado = None
+        self.version = None
+        self.aproximada = False
+
+    def buscar(self, termino):
+        termino = normalizar_texto(termino).strip()
+        vigente = self.resultado is not None and self.version == self.indice.version
+        if vigente and termino == self.termino: return self.resultado
+        if vigente and not self.aproximada and self.termino and self.termino in termino:
+            self.resultado = self.indice.refinar(termino, self.resultado)
+        else:
+            self.resultado = self.indice.buscar(termino)
+        self.aproximada = False
+        if not self.resultado and termino:
+            self.resultado = self.indice.buscar_aproximado(termino)
+            self.aproximada = bool(self.resultado)
+        self.termino, self.version = termino, self.indice.version
+        return self.resultado
+
+    def vigente(self):
+        return self.resultado is not None and self.version == self.indice.version
+
+    def refinable(self, termino):
+        # Resultado anterior que se puede filtrar en lugar de buscar en todo el índice
+        if self.vigente() and not self.aproximada and self.termino and self.termino in termino:
+            return self.resultado
+        return None
+
+    def recordar(self, termino, resultado, version, aproximada):
+        # Resultado calculado en el hilo de búsqueda: la próxima buscar() con el mismo término lo reusa
+        self.termino, self.resultado, self.version, self.aproximada = termino, resultado, version, aproximada
+
+
+# --- BÚSQUEDA EN SEGUNDO PLANO ---
+# Un hilo por ventana recorre el índice mientras Tk sigue respondiendo. Cada búsqueda lleva un número
+# de generación: las partes encontradas vuelven por una cola que el hilo de Tk vacía con after, y se
+# descartan si ya hay una búsqueda más nueva. Si el índice cambió mientras se buscaba (otra versión),
+# la búsqueda se repite contra la versión actual.
+class BuscadorSegundoPlano:
+    def __init__(self, ventana):
+        self.ventana = ventana
+        self.pedidos = queue.Queue()
+        self.resultados = queue.Queue()
+        self.generacion = 0
+        self.hilo = None
+        self.revisando = None
+        self.activa = False
+        self.busqueda = self.termino = None
+        self.parciales = []
+        self.al_avanzar = self.al_terminar = self.ordenar = None
+        self.vista = None
+
+    def buscar(self, busqueda, termino, al_avanzar, al_terminar, ordenar=None):
+        # al_avanzar(pids): coincidencias exactas encontradas hasta ahora, en orden de ID
+        # al_terminar(pids): resultado completo (busqueda.aproximada dice si son parecidas)
+        # ordenar(pids): se aplica en el hilo al resultado exacto; queda en self.vista (None si no se
+        # pudo o si el resultado ya estaba guardado)
+        termino = normalizar_texto(termino).strip()
+        self.vista = None
+        if busqueda.vigente() and termino == busqueda.termino:
+            self.cancelar()
+            return al_terminar(busqueda.resultado)
+        self.busqueda, self.termino = busqueda, termino
+        self.al_avanzar, self.al_terminar, self.ordenar = al_avanzar, al_terminar, ordenar
+        self.activa = True
+        self.lanzar(busqueda.refinable(termino))
+        if self.revisando is None: self.revisando = self.ventana.after(INTERVALO_BUSQUEDA_MS, self.revisar)
+
+    def lanzar(self, base):
+        self.generacion += 1
+        self.parciales = []
+        self.pedidos.put((self.generacion, self.busqueda, self.termino, base, self.busqueda.indice.version,
+                          self.ordenar))
+        if self.hilo is None:
+            self.hilo = threading.Thread(target=self.trabajar, daemon=True)
+            self.hilo.start()
+
+    def cancelar(self):
+        self.generacion += 1
+        self.activa = False
+
+    def cerrar(self):
+        self.cancelar()
+        self.pedidos.put(None)
+
+    def trabajar(self):
+        while True:
+            pedido = self.pedidos.get()
+            while pedido is not None and not self.pedidos.empty():
+                pedido = self.pedidos.get()  # Solo importa el último
+            if pedido is None: return
+            generacion, busqueda, termino, base, version, ordenar = pedido
+            if generacion != self.generacion: continue
+            indice = busqueda.indice
+            try:
+                resultado = []
+                for parte in indice.buscar_por_partes(termino, base):
+                    if generacion != self.generacion or indice.version != version: break
+                    if parte:
+                        resultado.extend(parte)
+                        self.resultados.put(("parte", generacion, parte))
+                else:
+                    aproximada, vista = False, None
+                    if not resultado and termino:
+                        resultado = indice.buscar_aproximado(termino)
+                        aproximada = bool(resultado)
+                    elif ordenar and resultado and generacion == self.generacion:
+                        vista = ordenar(resultado)
+                    self.resultados.put(("fin", generacion, (resultado, version, aproximada, vista)))
+                    continue
+            except (RuntimeError, KeyError):
+                pass  # El índice cambió mientras se recorría
+            if generacion == self.generacion: self.resultados.put(("cambio", generacion, None))
+
+    def revisar(self):
+        self.revisando = None
+        avance, fin = False, None
+        while True:
+            try:
+                tipo, generacion, dato = self.resultados.get_nowait()
+            except queue.Empty:
+                break
+            if generacion != self.generacion: continue  # De una búsqueda reemplazada o cancelada
+            if tipo == "parte":
+                self.parciales.extend(dato)
+                avance = True
+            elif tipo == "fin" and dato[1] == self.busqueda.indice.version:
+                fin = dato
+            else:
+                avance = False
+                self.lanzar(None)
+        if fin:
+            resultado, version, aproximada, self.vista = fin
+            self.activa = False
+            self.busqueda.recordar(self.termino, resultado, version, aproximada)
+            return self.al_terminar(resultado)
+        if avance: self.al_avanzar(self.parciales)
+        if self.activa and self.ventana.winfo_exists():
+            self.revisando = self.ventana.after(INTERVALO_BUSQUEDA_MS, self.revisar)
+
+
+# --- BANDAS DE STOCK ---
+# Conjuntos de piezas en stock crítico y bajo, al día con cada cambio de cantidad o de puntos de
+# reorden. Sirven el semáforo de la tabla, los contadores de la barra lateral y la vista de alertas.
+def puntos_reorden(pieza):
+    critico, bajo = pieza.get('punto_critico'), pieza.get('punto_bajo')
+    return (STOCK_CRITICO if critico is None else critico), (STOCK_BAJO if bajo is None else bajo)
+
+
+def banda_stock(pieza):
+    cantidad = int(pieza['cantidad'])
+    critico, bajo = puntos_reorden(pieza)
+    if cantidad <= critico: return "critico"
+    if cantidad <= bajo: return "bajo"
+    return ""
+
+
+class IndiceBandas:
+    def __init__(self, inventario=None):
+        self.piezas = {"critico": set(), "bajo": set()}
+        self.banda = {}
+        for pid, pieza in (inventario or {}).items():
+            self.agregar(pid, pieza)
+
+    def agregar(self, pid, pieza):
+        banda = banda_stock(pieza)
+        if not banda: return
+        self.piezas[banda].add(pid)
+        self.banda[pid] = banda
+
+    def quitar(self, pid, pieza=None):
+        banda = self.banda.pop(pid, None)
+        if banda: self.piezas[banda].discard(pid)
+
+    @staticmethod
+    def cambio(anterior, nueva):
+        return banda_stock(anterior) != banda_stock(nueva)
+
+    def conteo(self, banda):
+        return len(self.piezas[banda])
+
+    def pids(self, bandas):
+        if len(bandas) == 1: return self.piezas[next(iter(bandas))]
+        return set().union(*(self.piezas[b] for b in bandas))
+
+
+# --- ÍNDICE DE UBICACIONES ---
+# gabinete -> pids, con los totales de cada ubicación (piezas, unidades y piezas en stock crítico)
+# siempre al día, para filtrar y resumir por ubicación sin recorrer el inventario.
+def clave_ubicacion(gabinete):
+    return str(gabinete).strip()
+
+
+class IndiceUbicaciones:
+    def __init__(self, inventario=None):
+        self.piezas = {}
+        self.unidades = {}
+        self.criticas = {}
+        for pid, pieza in (inventario or {}).items():
+            self.agregar(pid, pieza)
+
+    def agregar(self, pid, pieza):
+        ubicacion = clave_ubicacion(pieza.get('gabinete', ''))
+        cantidad = int(pieza['cantidad'])
+        self.piezas.setdefault(ubicacion, set()).add(pid)
+        self.unidades[ubicacion] = self.unidades.get(ubicacion, 0) + cantidad
+        self.criticas[ubicacion] = self.criticas.get(ubicacion, 0) + (banda_stock(pieza) == "critico")
+
+    def quitar(self, pid, pieza):
+        ubicacion = clave_ubicacion(pieza.get('gabinete', ''))
+        piezas = self.piezas.get(ubicacion)
+        if not piezas or pid not in piezas: return
+        cantidad = int(pieza['cantidad'])
+        piezas.discard(pid)
+        if not piezas:
+            del self.piezas[ubicacion], self.unidades[ubicacion], self.criticas[ubicacion]
+            return
+        self.unidades[ubicacion] -= cantidad
+        self.criticas[ubicacion] -= (banda_stock(pieza) == "critico")
+
+    @staticmethod
+    def cambio(anterior, nueva):
+        return clave_ubicacion(anterior.get('gabinete', '')) != clave_ubicacion(nueva.get('gabinete', '')) or \
+            int(anterior['cantidad']) != int(nueva['cantidad']) or puntos_reorden(anterior) != puntos_reorden(nueva)
+
+    def ubicaciones(self):
+        return sorted(self.piezas, key=str.lower)
+
+    def pids(self, ubicacion):
+        return self.piezas.get(ubicacion, set())
+
+    def resumen(self):
+        # [(ubicacion, piezas, unidades, criticas), ...]
+        return [(u, len(self.piezas[u]), self.unidades[u], self.criticas[u]) for u in self.ubicaciones()]
+
+
+# --- ÓRDENES MANTENIDOS ---
+# Una lista ordenada de (clave, pid) por cada criterio de la tabla. Cada cambio quita y vuelve a
+# insertar solo la pieza afectada (bisect), así cambiar de orden o refrescar no reordena todo.
+class IndiceOrden:
+    CLAVES = {
+        "id": lambda pid, p: clave_id(pid),
+        "nombre": lambda pid, p: (p['nombre'].lower(), clave_id(pid)),
+        "cantidad": lambda pid, p: (int(p['cantidad']), clave_id(pid)),
+        # Descendente (lo más nuevo arriba); sin movimientos va al fondo
+        "reciente": lambda pid, p: (-(p.get('ult_ts') or 0), clave_id(pid)),
+    }
+
+    def __init__(self, inventario=None):
+        # listas[modo]: (clave, pid) ordenados; pids[modo]: solo los pids, en el mismo orden, para
+        # copiar o filtrar la vista sin desarmar las tuplas
+        self.listas, self.pids = {}, {}
+        # Cambia con cada alta/baja en las listas: invalida un orden calculado en el hilo de búsqueda
+        self.version = 0
+        for modo, clave in self.CLAVES.items():
+            self.listas[modo] = sorted((clave(pid, p), pid) for pid, p in (inventario or {}).items())
+            self.pids[modo] = [pid for _, pid in self.listas[modo]]
+
+    def agregar(self, pid, pieza):
+        self.version += 1
+        for modo, clave in self.CLAVES.items():
+            lista, entrada = self.listas[modo], (clave(pid, pieza), pid)
+            i = bisect.bisect_right(lista, entrada)
+            lista.insert(i, entrada)
+            self.pids[modo].insert(i, pid)
+
+    def quitar(self, pid, pieza):
+        self.version += 1
+        for modo, clave in self.CLAVES.items():
+            lista, entrada = self.listas[modo], (clave(pid, pieza), pid)
+            i = bisect.bisect_left(lista, entrada)
+            if i < len(lista) and lista[i] == entrada:
+                del lista[i]
+                del self.pids[modo][i]
+
+    def cambio(self, pid, anterior, nueva):
+        return any(clave(pid, anterior) != clave(pid, nueva) for clave in self.CLAVES.values())
+
+    def ordenar(self, modo, inventario, pids=None):
+        # Todos los pids en el orden pedido, o solo los de "pids" (un conjunto) si se filtró
+        orden = self.pids.get(modo, self.pids["id"])
+        if pids is None: return list(orden)
+        if len(pids) * 8 < len(orden):
+            # Pocos resultados: sale más barato ordenarlos que recorrer la lista completa
+            clave = self.CLAVES.get(modo, self.CLAVES["id"])
+            return sorted(pids, key=lambda pid: clave(pid, inventario[pid]))
+        return list(filter(pids.__contains__, orden))
+
+
+# --- PERSISTENCIA EN SEGUNDO PLANO ---
+# Cada cambio ya queda en el journal al instante; el snapshot completo se consolida en un hilo
+# aparte para que la interfaz no espere al disco. Los cambios que llegan dentro de la ventana
+# viajan en la misma escritura.
+class PersistenciaAsincrona:
+    def __init__(self, copiar_datos, raiz=None, ventana=VENTANA_GUARDADO):
+        self.copiar_datos = copiar_datos
+        self.raiz = raiz  # Ventana de Tk donde se avisan los errores del hilo
+        self.ventana = ventana
+        # "candado" protege el inventario y el journal mientras se toma la copia
+        self.candado = threading.Lock()
+        self.escritura = threading.Lock()
+        self.pendiente = threading.Event()
+        self.despertar = threading.Event()
+        self.sucio = False
+        self.cerrando = False
+        self.error = None
+        self.avisado = False
+        # Efectos de historial que no se pudieron escribir en su segmento (ver aplicar_historial)
+        self.historial_pendiente = []
+        self.hilo = None
+        if MODO_ALMACENAMIENTO == "json":
+            self.hilo = threading.Thread(target=self.ciclo, name="persistencia", daemon=True)
+            self.hilo.start()
+
+    def marcar_sucio(self):
+        # Se llama con el candado tomado, justo después de aplicar la mutación
+        self.sucio = True
+        self.pendiente.set()
+
+    def aplicar_historial(self, efectos):
+        # Con el candado tomado. Si un segmento falla, los efectos quedan pendientes: se reintentan, en
+        # orden y sin duplicar lo ya escrito, con el siguiente cambio o antes del snapshot, que no
+        # recorta el journal mientras tanto (el journal es la única otra copia de esos movimientos)
+        if self.historial_pendiente:
+            self.historial_pendiente += efectos
+            reparar_segmentos(self.historial_pendiente)
+        else:
+            self.historial_pendiente = list(efectos)
+            aplicar_efectos_historial(efectos)
+        self.historial_pendiente = []
+
+    def ciclo(self):
+        espera = self.ventana
+        while not self.cerrando:
+            self.pendiente.wait()
+            self.despertar.wait(espera)
+            if self.cerrando: return
+            self.pendiente.clear()
+            self.escribir()
+            if self.error:
+                # Se reintenta aunque no lleguen más cambios, cada vez más espaciado
+                self.avisar_error()
+                espera = min(espera * 2, REINTENTO_GUARDADO_MAXIMO)
+                self.pendiente.set()
+            else:
+                espera = self.ventana
+
+    def avisar_error(self):
+        # Desde el hilo: el aviso se muestra en el de Tk, uno por racha de fallos y no uno por reintento
+        if self.raiz is None or self.avisado: return
+        self.avisado = True
+        error = self.error
+        try:
+            self.raiz.after(0, lambda: messagebox.showerror("Error", f"No se pudo guardar inventario: {error}"))
+        except (RuntimeError, tk.TclError):
+            pass  # La ventana ya se cerró
+
+    def escribir(self):
+        with self.escritura:
+            with self.candado:
+                if not self.sucio: return
+                if self.historial_pendiente:
+                    try:
+                        self.aplicar_historial([])
+                    except Exception as e:
+                        self.error = e
+                        return
+                self.sucio = False
+                datos = self.copiar_datos()
+                prestamos = _libro_prestamos.copiar()
+                posicion = tamano_journal()
+            try:
+                escribir_snapshot(datos)
+                with self.candado:
+                    recortar_journal(posicion)
+                escribir_prestamos(prestamos)
+                self.error = None
+                self.avisado = False
+            except Exception as e:
+                # El journal sigue intacto; se reintenta con el siguiente cambio o al salir
+                self.error = e
+                self.sucio = True
+
+    def vaciar(self):
+        # Escritura síncrona de lo pendiente al salir, en el hilo de Tk: el error se muestra directamente
+        if MODO_ALMACENAMIENTO == "sqlite": return almacen_sqlite().checkpoint()
+        self.escribir()
+        if self.error: messagebox.showerror("Error", f"No se pudo guardar inventario: {self.error}")
+
+    def detener(self):
+        self.cerrando = True
+        self.despertar.set()
+        self.pendiente.set()
+        if self.hilo: self.hilo.join(timeout=30)
+        self.vaciar()
+
+
+# --- POOL DE REPORTES ---
+# Hilos (no procesos): openpyxl / python-docx / fpdf sueltan poco el GIL, pero así el trabajo recibe
+# los datos sin serializarlos y funciona igual en el ejecutable congelado. La ventana no se congela.
+class ReporteCancelado(Exception):
+    pass
+
+
+class ProgresoReporte:
+    # Compartido entre el hilo del reporte (avanza) y la ventana de progreso (lee y cancela)
+    def __init__(self):
+        self.hecho = 0
+        self.total = 0
+        self.cancelado = threading.Event()
+
+    def iniciar(self, total):
+        self.total = total
+
+    def avanzar(self, cantidad=1):
+        if self.cancelado.is_set(): raise ReporteCancelado()
+        self.hecho += cantidad
+
+
+_pool_reportes = None
+
+
+def pool_reportes():
+    global _pool_reportes
+    if _pool_reportes is None:
+        _pool_reportes = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_REPORTES_SIMULTANEOS,
+                                                               thread_name_prefix="reporte")
+    return _pool_reportes
+
+
 # --- CLASE PRINCIPAL ---
 class SistemaInventario:
     def __init__(self, root):
@@ -144,8 +1991,27 @@ class SistemaInventario:
         self.pixel = tk.PhotoImage(width=1, height=1)
 
         self.inventario = cargar_datos()
+        self.persistencia = PersistenciaAsincrona(self.copiar_inventario, self.root)
+        self.contador_ids = ContadorIds(self.inventario)
+        self.reconstruir_indices()
+        migrar_log_global()
         self.orden_actual = "id"
         self.modo_actual = "lectura"
+        self.termino_filtro = ""
+        self.filtro_ubicacion = ""
+        self.filtro_stock = set()
+        self.busqueda_pendiente = None
+        self.buscador = BuscadorSegundoPlano(self.root)
+        self.filas_tabla = []
+        self.posiciones_tabla = (None, {})  # (lista de filas_tabla de la que sale, {pid: fila})
+        self.inicio_tabla = 0
+        self.pid_seleccionado = None
+        self.cambios_tabla = {}
+        self.dia_tabla = None
+        self.historial_ficha = []
+        self.lineas_ficha = 0
+        self.carga_ficha_pendiente = False
+        self.reportes_activos = set()
 
         self.ejecutar_respaldo_inicio()
 
@@ -157,32 +2023,47 @@ class SistemaInventario:
         self.actualizar_botones_sidebar()
         self.limpiar_campos_visual()
 
+        # Cerrar con la X también pasa por salir_sistema: confirma, cancela reportes y guarda lo pendiente
+        self.root.protocol("WM_DELETE_WINDOW", self.salir_sistema)
+
     def configurar_estilos(self):
         style = ttk.Style()
         style.theme_use("clam")
         style.configure("Treeview.Heading", font=("Segoe UI", 10, "bold"),
                         background=COLOR_FONDO_SIDEBAR, foreground="white", padding=5)
-        style.configure("Treeview", font=("Segoe UI", 9), rowheight=25)
+        style.configure("Treeview", font=("Segoe UI", 9), rowheight=ALTO_FILA_TABLA)
         style.map("Treeview", background=[("selected", "#3498db")])
         self.root.option_add('*Entry.disabledBackground', '#ecf0f1')
         self.root.option_add('*Entry.disabledForeground', '#7f8c8d')
 
-    def ejecutar_respaldo_inicio(self):
-        if not os.path.exists(ARCHIVO_DATOS): return
-        if not self.inventario: return
-        if not os.path.exists(CARPETA_RESPALDOS):
+    def ejecutar_en_segundo_plano(self, funcion, al_terminar=None):
+        # El trabajo corre en un hilo; el resultado se entrega en el hilo de Tk consultando con root.after
+        resultado = {}
+
+        def trabajo():
             try:
-                os.mkdir(CARPETA_RESPALDOS)
-            except:
-                return
+                resultado["valor"] = funcion()
+            except Exception as e:
+                resultado["error"] = e
 
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        nombre_bak = f"Respaldo_Auto_{timestamp}.json"
-        ruta_destino = os.path.join(CARPETA_RESPALDOS, nombre_bak)
-        try:
-            shutil.copy2(ARCHIVO_DATOS, ruta_destino)
-        except:
-            pass
+        hilo = threading.Thread(target=trabajo, daemon=True)
+        hilo.start()
+
+        def revisar():
+            if hilo.is_alive(): return self.root.after(100, revisar)
+            if al_terminar: al_terminar(resultado.get("valor"), resultado.get("error"))
+
+        self.root.after(100, revisar)
+
+    def ejecutar_respaldo_inicio(self):
+        # Respaldo incremental y poda según POLITICA_RESPALDOS, en segundo plano para no retrasar la ventana
+        copia = self.copiar_inventario() if self.inventario else None
+
+        def trabajo():
+            if copia: crear_punto_respaldo(copia, "Auto")
+            podar_respaldos()
+
+        self.ejecutar_en_segundo_plano(trabajo)
 
     def crear_respaldo_manual(self):
         if not self.inventario: return messagebox.showwarning("Vacío", "No hay datos para respaldar.")
@@ -190,16 +2071,13 @@ class SistemaInventario:
         if not messagebox.askyesno("Confirmar Respaldo", "¿Estás seguro de crear una copia de seguridad ahora?"):
             return
 
-        if not os.path.exists(CARPETA_RESPALDOS): os.mkdir(CARPETA_RESPALDOS)
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        nombre_bak = f"Respaldo_MANUAL_{timestamp}.json"
-        ruta_destino = os.path.join(CARPETA_RESPALDOS, nombre_bak)
-        try:
-            shutil.copy2(ARCHIVO_DATOS, ruta_destino)
+        def al_terminar(nombre_bak, error):
+            if error: return messagebox.showerror("Error", f"Fallo al crear respaldo: {error}")
             messagebox.showinfo("Respaldo Exitoso",
                                 f"✅ Copia creada correctamente en:\nCarpeta 'Respaldos'\nArchivo: {nombre_bak}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Fallo al crear respaldo: {e}")
+
+        copia = self.copiar_inventario()
+        self.ejecutar_en_segundo_plano(lambda: crear_punto_respaldo(copia, "MANUAL"), al_terminar)
 
     def abrir_visor_respaldos(self):
         if not messagebox.askyesno("Confirmar Visor", "¿Deseas buscar y leer un respaldo anterior?"):
@@ -211,17 +2089,23 @@ class SistemaInventario:
         ruta = filedialog.askopenfilename(
             initialdir=CARPETA_RESPALDOS,
             title="Seleccionar Respaldo para Visualizar",
-            filetypes=[("Archivos de Respaldo", "*.json")]
+            filetypes=[("Archivos de Respaldo", f"*{EXTENSION_RESPALDO} *.json")]
         )
 
         if not ruta: return
 
-        try:
+        def leer():
+            if ruta.endswith(EXTENSION_RESPALDO): return reconstruir_respaldo(ruta)
             with open(ruta, 'r', encoding='utf-8') as f:
-                datos_backup = json.load(f)
-        except Exception as e:
-            return messagebox.showerror("Error", f"No se pudo leer el archivo: {e}")
+                return json.load(f)
+
+        def al_terminar(datos_backup, error):
+            if error: return messagebox.showerror("Error", f"No se pudo leer el archivo: {error}")
+            self.mostrar_visor_respaldo(ruta, datos_backup)
+
+        self.ejecutar_en_segundo_plano(leer, al_terminar)
 
+    def mostrar_visor_respaldo(self, ruta, datos_backup):
         ventana = tk.Toplevel(self.root)
         ventana.title(f"VISOR HISTÓRICO - {os.path.basename(ruta)}")
         ventana.geometry("1100x600")
@@ -260,15 +2144,79 @@ class SistemaInventario:
         items_ordenados = sorted(datos_backup.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0)
 
         for pid, d in items_ordenados:
-            historial = d.get('historial', [])
-            ultimo = historial[0] if historial else "Sin movimientos"
+            ultimo = texto_ultimo_movimiento(d)
             tree.insert("", tk.END, values=(pid, d.get('codigo', ''), d['nombre'], d['cantidad'], d['gabinete'], ultimo,
                                             d['descripcion']))
 
+        def exportar():
+            destino = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")],
+                                                   initialfile=os.path.splitext(os.path.basename(ruta))[0] + ".json")
+            if not destino: return
+            try:
+                exportar_json(datos_backup, destino)
+                messagebox.showinfo("Exportado", f"✅ Respaldo exportado a:\n{destino}")
+            except Exception as e:
+                messagebox.showerror("Error", f"No se pudo exportar: {e}")
+
+        def restaurar():
+            if not messagebox.askyesno("Restaurar Respaldo",
+                                       "⚠️ Se reemplazará el inventario actual por este respaldo.\n"
+                                       "Antes se creará un respaldo del estado actual.\n\n"
+                                       "El respaldo no incluye el historial de movimientos ni los préstamos: "
+                                       "las piezas que siguen existiendo conservan su historial actual y los "
+                                       "préstamos abiertos se recalculan con él.\n\n¿Continuar?"):
+                return
+            # El respaldo previo se escribe en un hilo; mientras tanto el visor retiene la ventana (grab)
+            # para que no entren cambios que ese respaldo no incluiría
+            btn_restaurar.config(state="disabled")
+            ventana.grab_set()
+            copia = self.copiar_inventario()
+
+            def al_terminar(_, error):
+                if ventana.winfo_exists():
+                    ventana.grab_release()
+                    btn_restaurar.config(state="normal")
+                if error: return messagebox.showerror("Error", f"Fallo al crear respaldo: {error}")
+                if self.restaurar_inventario(datos_backup, os.path.basename(ruta)):
+                    if ventana.winfo_exists(): ventana.destroy()
+                    messagebox.showinfo("Restaurado", "✅ Inventario restaurado.")
+
+            self.ejecutar_en_segundo_plano(lambda: crear_punto_respaldo(copia, "PreRestauracion"), al_terminar)
+
+        frame_btns = tk.Frame(ventana, bg="#f1c40f")
+        frame_btns.pack(fill=tk.X, padx=15, pady=(0, 5))
+        tk.Button(frame_btns, text="💾 Exportar a JSON", command=exportar,
+                  bg=COLOR_BTN_LEER_RESPALDO, fg="white", font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT)
+        btn_restaurar = tk.Button(frame_btns, text="♻️ Restaurar este respaldo", command=restaurar,
+                                  bg=COLOR_BTN_RESPALDO, fg="white", font=("Segoe UI", 9, "bold"))
+        btn_restaurar.pack(side=tk.RIGHT)
+
         btn_cerrar = tk.Button(ventana, text="Cerrar Visor", command=ventana.destroy,
                                bg="#34495e", fg="white", font=("Segoe UI", 10, "bold"), height=2)
         btn_cerrar.pack(fill=tk.X, padx=15, pady=(0, 15))
 
+    def restaurar_inventario(self, datos, origen):
+        # Se toma también el candado de escritura para que el hilo de persistencia no pise el reemplazo
+        with self.persistencia.escritura, self.persistencia.candado:
+            try:
+                reemplazar_datos(datos)
+            except Exception as e:
+                messagebox.showerror("Error", f"No se pudo restaurar: {e}")
+                return False
+            self.inventario = datos
+            self.persistencia.sucio = False
+            # El historial pendiente de piezas que no están en el respaldo ya no corresponde a nada
+            self.persistencia.historial_pendiente = [e for e in self.persistencia.historial_pendiente
+                                                     if e[1] in datos]
+            self.contador_ids.ajustar(datos)
+            self.reconstruir_indices()
+        registrar_accion_global("RESTAURACIÓN", "", "Inventario completo", f"Respaldo: {origen}")
+        self.modo_actual = "lectura"
+        self.refrescar_tabla()
+        self.limpiar_campos_visual()
+        self.actualizar_botones_sidebar()
+        return True
+
     def construir_interfaz(self):
         self.sidebar = tk.Frame(self.root, bg=COLOR_FONDO_SIDEBAR, width=320)
         self.sidebar.pack(side=tk.LEFT, fill=tk.Y)
@@ -303,9 +2251,24 @@ class SistemaInventario:
         self.entry_gabinete = self.crear_entry(frame_inputs)
         self.crear_label_input(frame_inputs, "Descripción:")
         self.entry_desc = self.crear_entry(frame_inputs)
+        self.crear_label_input(frame_inputs, f"Punto Crítico / Bajo (vacío = {STOCK_CRITICO} / {STOCK_BAJO}):")
+        frame_puntos = tk.Frame(frame_inputs, bg=COLOR_FONDO_SIDEBAR)
+        frame_puntos.pack(fill=tk.X)
+        self.entry_punto_critico = self.crear_entry(frame_puntos, solo_numeros=True, lado=tk.LEFT)
+        self.entry_punto_bajo = self.crear_entry(frame_puntos, solo_numeros=True, lado=tk.LEFT)
 
         self.campos_editables = [self.entry_codigo, self.entry_nombre, self.entry_cantidad, self.entry_gabinete,
-                                 self.entry_desc]
+                                 self.entry_desc, self.entry_punto_critico, self.entry_punto_bajo]
+
+        # --- ALERTAS DE STOCK (contadores y vista de críticas / bajas) ---
+        frame_alertas = tk.Frame(content_sidebar, bg=COLOR_FONDO_SIDEBAR)
+        frame_alertas.pack(fill=tk.X, padx=15, pady=(5, 0))
+        self.btn_criticas = tk.Button(frame_alertas, command=lambda: self.cambiar_filtro_stock("critico"),
+                                      bg='#e74c3c', fg='white', font=("Segoe UI", 8, "bold"), bd=1, cursor="hand2")
+        self.btn_criticas.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 2))
+        self.btn_bajas = tk.Button(frame_alertas, command=lambda: self.cambiar_filtro_stock("bajo"),
+                                   bg='#f1c40f', fg='black', font=("Segoe UI", 8, "bold"), bd=1, cursor="hand2")
+        self.btn_bajas.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 0))
 
         frame_botones = tk.Frame(content_sidebar, bg=COLOR_FONDO_SIDEBAR)
         frame_botones.pack(fill=tk.X, padx=15, pady=10)
@@ -342,11 +2305,24 @@ class SistemaInventario:
         self.entry_buscar = tk.Entry(frame_search, font=("Segoe UI", 9), width=20)
         self.entry_buscar.pack(side=tk.LEFT, padx=5)
         self.entry_buscar.bind('<Return>', self.realizar_busqueda)
+        self.entry_buscar.bind('<KeyRelease>', self.programar_busqueda)
 
         self.btn_search = tk.Button(frame_search, text="🔍", command=self.realizar_busqueda,
                                     bg=COLOR_BTN_MODIFICAR, fg="white", relief="flat", cursor="hand2", width=3)
         self.btn_search.pack(side=tk.LEFT)
 
+        # --- FILTRO POR UBICACIÓN ---
+        tk.Label(frame_search, text="Ubicación:", bg=COLOR_FONDO_MAIN, fg="#7f8c8d",
+                 font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(10, 0))
+        self.combo_ubicacion = ttk.Combobox(frame_search, state="readonly", width=12,
+                                            postcommand=lambda: self.combo_ubicacion.config(
+                                                values=["Todas"] + self.indice_ubicaciones.ubicaciones()))
+        self.combo_ubicacion.set("Todas")
+        self.combo_ubicacion.pack(side=tk.LEFT, padx=5)
+        self.combo_ubicacion.bind("<<ComboboxSelected>>", self.cambiar_ubicacion)
+        tk.Button(frame_search, text="📍", command=self.abrir_resumen_ubicaciones, bg=COLOR_BTN_NORMAL,
+                  fg="white", relief="flat", cursor="hand2", width=3).pack(side=tk.LEFT)
+
         frame_sort = tk.Frame(header_frame, bg=COLOR_FONDO_MAIN)
         frame_sort.pack(side=tk.RIGHT)
 
@@ -374,10 +2350,11 @@ class SistemaInventario:
 
         columnas = ("ID", "Codigo", "Nombre", "Cantidad", "Gabinete", "Estatus", "Descripcion")
 
-        self.tabla = ttk.Treeview(frame_tabla, columns=columnas, show='headings',
-                                  yscrollcommand=scroll_y.set, xscrollcommand=scroll_x.set)
+        # Tabla virtual: el desplazamiento vertical lo maneja desplazar_tabla, no el Treeview
+        self.tabla = ttk.Treeview(frame_tabla, columns=columnas, show='headings', xscrollcommand=scroll_x.set)
 
-        scroll_y.config(command=self.tabla.yview);
+        self.scroll_tabla = scroll_y
+        scroll_y.config(command=self.desplazar_tabla);
         scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
         scroll_x.config(command=self.tabla.xview);
         scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
@@ -398,8 +2375,19 @@ class SistemaInventario:
         self.tabla.column("Estatus", width=140, anchor=tk.CENTER)
         self.tabla.column("Descripcion", width=200)
 
+        # --- SEMÁFORO DE INVENTARIO (CONFIGURACIÓN) ---
+        self.tabla.tag_configure('stock_critico', background='#e74c3c', foreground='white')  # Rojo
+        self.tabla.tag_configure('stock_bajo', background='#f1c40f', foreground='black')  # Amarillo
+
         self.tabla.pack(fill=tk.BOTH, expand=True)
         self.tabla.bind("<ButtonRelease-1>", self.seleccionar_item)
+        self.tabla.bind("<Configure>", lambda e: self.dibujar_ventana_tabla(sucios=()))
+        for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tabla.bind(evento, self.rueda_tabla)
+        self.tabla.bind("<Up>", lambda e: self.mover_seleccion_tabla(-1))
+        self.tabla.bind("<Down>", lambda e: self.mover_seleccion_tabla(1))
+        self.tabla.bind("<Prior>", lambda e: self.mover_seleccion_tabla(-self.filas_visibles()))
+        self.tabla.bind("<Next>", lambda e: self.mover_seleccion_tabla(self.filas_visibles()))
 
         lbl_detalles = tk.Label(self.main_area, text="Ficha Técnica e Historial Completo",
                                 font=("Segoe UI", 12, "bold"), bg=COLOR_FONDO_MAIN, fg=COLOR_TEXTO_OSCURO)
@@ -415,10 +2403,14 @@ class SistemaInventario:
         self.txt_detalles.tag_config("azul", foreground="blue")
         self.txt_detalles.tag_config("verde", foreground="green")
         self.txt_detalles.tag_config("negro", foreground="black")
+        self.txt_detalles.tag_config("mas", foreground="#2980b9", underline=True)
+        self.txt_detalles.tag_bind("mas", "<Button-1>", lambda e: self.cargar_mas_historial())
+        self.txt_detalles.tag_bind("mas", "<Enter>", lambda e: self.txt_detalles.config(cursor="hand2"))
+        self.txt_detalles.tag_bind("mas", "<Leave>", lambda e: self.txt_detalles.config(cursor=""))
 
-        scroll_det = tk.Scrollbar(frame_detalles, command=self.txt_detalles.yview)
-        scroll_det.pack(side=tk.RIGHT, fill=tk.Y)
-        self.txt_detalles.config(yscrollcommand=scroll_det.set, state=tk.DISABLED)
+        self.scroll_det = tk.Scrollbar(frame_detalles, command=self.txt_detalles.yview)
+        self.scroll_det.pack(side=tk.RIGHT, fill=tk.Y)
+        self.txt_detalles.config(yscrollcommand=self.desplazamiento_detalles, state=tk.DISABLED)
 
         self.refrescar_tabla()
 
@@ -433,11 +2425,14 @@ class SistemaInventario:
         tk.Label(parent, text=texto, font=("Segoe UI", 8, "bold"), bg=COLOR_FONDO_SIDEBAR, fg="#ecf0f1").pack(
             anchor="w", padx=15, pady=(2, 0))
 
-    def crear_entry(self, parent, readonly=False, solo_numeros=False):
+    def crear_entry(self, parent, readonly=False, solo_numeros=False, lado=None):
         entry = ttk.Entry(parent, font=("Segoe UI", 9))
         if solo_numeros: entry.config(validate='key',
                                       validatecommand=(self.root.register(self.validar_solo_numeros), '%P'))
-        entry.pack(fill=tk.X, padx=15, pady=2)
+        if lado:
+            entry.pack(side=lado, fill=tk.X, expand=True, padx=15, pady=2)
+        else:
+            entry.pack(fill=tk.X, padx=15, pady=2)
         if readonly: entry.configure(state="readonly")
         return entry
 
@@ -499,6 +2494,7 @@ class SistemaInventario:
         self.entry_id.config(state='readonly')
         self.desbloquear_campos()
         for c in self.campos_editables: c.delete(0, tk.END)
+        self.historial_ficha, self.lineas_ficha = [], 0
         self.txt_detalles.config(state=tk.NORMAL)
         self.txt_detalles.delete(1.0, tk.END)
         self.txt_detalles.insert(tk.END, "Modo Creación: Ingresa los datos numéricos.")
@@ -509,26 +2505,23 @@ class SistemaInventario:
             c.config(state="normal")
             c.delete(0, tk.END)
             c.config(state="readonly")
+        self.historial_ficha, self.lineas_ficha = [], 0
         self.txt_detalles.config(state=tk.NORMAL)
         self.txt_detalles.delete(1.0, tk.END)
         self.txt_detalles.insert(tk.END, "Bienvenido. Selecciona una herramienta o crea una nueva.")
         self.txt_detalles.config(state=tk.DISABLED)
 
     def validar_codigo_duplicado(self, codigo, id_actual=None):
-        codigo = str(codigo).strip().lower()
-        if not codigo: return False
-        for pid, data in self.inventario.items():
-            if id_actual and str(pid) == str(id_actual): continue
-            codigo_existente = str(data.get('codigo', '')).strip().lower()
-            if codigo_existente == codigo:
-                return data['nombre']
-        return None
+        if not normalizar_codigo(codigo): return False
+        pid = self.indice_codigos.buscar(codigo, excluir=id_actual)
+        return self.inventario[pid]['nombre'] if pid is not None else None
 
     def accion_boton_nuevo(self):
         if self.verificar_bloqueo(): return
         self.refrescar_tabla()
         self.modo_actual = "nuevo"
         self.limpiar_campos_logica()
+        self.pid_seleccionado = None
         if self.tabla.selection(): self.tabla.selection_remove(self.tabla.selection())
         self.actualizar_botones_sidebar()
 
@@ -552,121 +2545,354 @@ class SistemaInventario:
             self.actualizar_pieza()
 
     def generar_proximo_id(self):
-        ids = [int(k) for k in self.inventario if k.isdigit()]
-        return str(max(ids) + 1) if ids else "1"
+        return self.contador_ids.proximo()
+
+    def reservar_ids(self, cantidad):
+        return self.contador_ids.reservar(cantidad)
 
     def accion_refrescar_manual(self):
         if self.verificar_bloqueo(): return
+        self.entry_buscar.delete(0, tk.END)
+        self.buscador.cancelar()
+        self.termino_filtro = ""
+        self.filtro_ubicacion = ""
+        self.filtro_stock = set()
+        self.combo_ubicacion.set("Todas")
         self.refrescar_tabla(self.obtener_id_actual_seleccionado())
 
     def obtener_id_actual_seleccionado(self):
-        sel = self.tabla.selection()
-        return str(self.tabla.item(sel[0])['values'][0]) if sel else None
-
-    def realizar_busqueda(self, event=None):
-        if self.verificar_bloqueo(): return
+        # La fila puede no estar creada (fuera de la ventana visible); la selección se guarda aparte
+        return self.pid_seleccionado
+
+    # --- BÚSQUEDA MIENTRAS SE ESCRIBE ---
+    def programar_busqueda(self, event=None):
+        # Cada tecla cancela el filtrado pendiente: solo se busca cuando el usuario hace una pausa
+        if event is not None and event.keysym == "Return": return
+        if self.busqueda_pendiente: self.root.after_cancel(self.busqueda_pendiente)
+        self.busqueda_pendiente = self.root.after(RETARDO_BUSQUEDA_MS, self.filtrar_tabla)
+
+    def filtrar_tabla(self):
+        self.busqueda_pendiente = None
+        if self.modo_actual == "editar": return
         termino = self.entry_buscar.get().strip().lower()
-        if not termino: return messagebox.showwarning("Buscador", "Ingresa un código o nombre.")
-        resultados = []
-        for pid, data in self.inventario.items():
-            codigo = str(data.get('codigo', '')).lower()
-            nombre = str(data['nombre']).lower()
-            if termino in codigo or termino in nombre:
-                resultados.append((pid, data))
-
-        if len(resultados) == 0:
-            messagebox.showerror("Sin resultados", f"No se encontró nada con '{termino}'.")
-        elif len(resultados) == 1:
-            pid, data = resultados[0]
-            self.refrescar_tabla(id_seleccionado=pid)
-            messagebox.showinfo("Encontrado", f"✅ Pieza: {data['nombre']}")
-            self.entry_buscar.delete(0, tk.END)
+        if termino == self.termino_filtro: return self.buscador.cancelar()
+        if not termino:
+            self.buscador.cancelar()
+            self.termino_filtro = termino
+            return self.refrescar_tabla(self.obtener_id_actual_seleccionado())
+        self.buscar_en_tabla(termino, self.obtener_id_actual_seleccionado())
+
+    def buscar_en_tabla(self, termino, id_seleccionado=None, al_terminar=None):
+        # La búsqueda corre en el hilo del buscador; la tabla se llena con las coincidencias a medida
+        # que llegan y al final queda con el resultado completo (al_terminar lo reemplaza si se da)
+        # Por ID las coincidencias llegan ya en el orden de la tabla y se muestran por partes; en otro
+        # orden cada parte obligaría a reordenar la vista completa, así que el hilo entrega el
+        # resultado ya ordenado y la tabla se llena una sola vez.
+        primera = [True]
+        modo, version_orden = self.orden_actual, self.indice_orden.version
+
+        def mostrar(encontrados, ordenados=False):
+            if self.modo_actual == "editar": return self.buscador.cancelar()
+            self.termino_filtro = termino
+            if primera[0]:
+                primera[0] = False
+                self.refrescar_tabla(id_seleccionado, encontrados, ordenados)
+            else:
+                # Sin volver arriba: las filas nuevas se suman a las que ya se están viendo
+                self.filas_tabla = self.calcular_filas(encontrados, ordenados)
+                self.dibujar_ventana_tabla()
+
+        def ordenar(pids):
+            return self.indice_orden.ordenar(modo, self.inventario, set(pids))
+
+        def terminar(resultado):
+            if al_terminar: return al_terminar(resultado)
+            vista = self.buscador.vista
+            if vista is not None and self.orden_actual == modo and self.indice_orden.version == version_orden:
+                mostrar(vista, ordenados=True)
+            else:
+                mostrar(None)
+
+        if modo == "id":
+            self.buscador.buscar(self.busqueda_principal, termino, mostrar, terminar)
         else:
-            self.mostrar_resultados_busqueda(resultados)
+            self.buscador.buscar(self.busqueda_principal, termino, lambda pids: None, terminar, ordenar)
 
-    def mostrar_resultados_busqueda(self, resultados):
-        ventana = tk.Toplevel(self.root)
-        ventana.title(f"{len(resultados)} Coincidencias")
-        ventana.geometry("400x400")
-        ventana.configure(bg=COLOR_FONDO_MAIN)
-        ventana.grab_set()
-        tk.Label(ventana, text="Selecciona la pieza que buscas:", font=("Segoe UI", 10, "bold"),
-                 bg=COLOR_FONDO_MAIN).pack(pady=10)
-        listbox = tk.Listbox(ventana, font=("Segoe UI", 10), width=50, height=15)
-        listbox.pack(padx=20, pady=5)
-        mapa_ids = []
-        for pid, data in resultados:
-            texto = f"[{data.get('codigo', '')}] {data['nombre']} (Stock: {data['cantidad']})"
-            listbox.insert(tk.END, texto)
-            mapa_ids.append(pid)
-
-        def seleccionar():
-            idx = listbox.curselection()
-            if not idx: return
-            pid_elegido = mapa_ids[idx[0]]
-            self.refrescar_tabla(id_seleccionado=pid_elegido)
-            self.entry_buscar.delete(0, tk.END)
-            ventana.destroy()
+    def cambiar_ubicacion(self, event=None):
+        if self.verificar_bloqueo():
+            self.combo_ubicacion.set(self.filtro_ubicacion or "Todas")
+            return
+        valor = self.combo_ubicacion.get()
+        self.filtro_ubicacion = "" if valor == "Todas" else valor
+        self.refrescar_tabla(self.obtener_id_actual_seleccionado())
 
-        tk.Button(ventana, text="Ver Pieza", command=seleccionar, bg=COLOR_BTN_MODIFICAR, fg="white",
-                  font=("Segoe UI", 10, "bold")).pack(pady=10)
-        listbox.bind('<Double-Button-1>', lambda e: seleccionar())
+    def cambiar_filtro_stock(self, banda):
+        # Cada botón agrega / quita su banda de la vista; con los dos activos se ven críticas y bajas
+        if self.verificar_bloqueo(): return
+        self.filtro_stock ^= {banda}
+        self.refrescar_tabla(self.obtener_id_actual_seleccionado())
 
-    def refrescar_tabla(self, id_seleccionado=None):
-        for item in self.tabla.get_children(): self.tabla.delete(item)
-        items = self.inventario.items()
+    def actualizar_contadores_stock(self):
+        for banda, boton, texto in (("critico", self.btn_criticas, "🔴 CRÍTICAS"), ("bajo", self.btn_bajas, "🟡 BAJAS")):
+            boton.config(text=f"{texto}: {self.indice_bandas.conteo(banda)}",
+                         relief="sunken" if banda in self.filtro_stock else "raised")
 
-        # --- LÓGICA DE ORDENAMIENTO ---
-        if self.orden_actual == "nombre":
-            items_ordenados = sorted(items, key=lambda x: x[1]['nombre'].lower())
-        elif self.orden_actual == "cantidad":
-            items_ordenados = sorted(items, key=lambda x: int(x[1]['cantidad']))
-        elif self.orden_actual == "reciente":
-            # Función auxiliar para obtener la fecha del último movimiento
-            def obtener_fecha_ultimo_mov(item):
-                hist = item[1].get('historial', [])
-                if not hist: return datetime.datetime.min  # Si no hay historial, al fondo
-                try:
-                    # Formato esperado: "📤 07/01/2026 15:30:00 | ..."
-                    # Partimos por el pipe "|" y luego quitamos el icono
-                    partes = hist[0].split("|")[0].strip().split(" ", 1)
-                    if len(partes) > 1:
-                        fecha_str = partes[1]  # "07/01/2026 15:30:00"
-                        return datetime.datetime.strptime(fecha_str, "%d/%m/%Y %H:%M:%S")
-                    return datetime.datetime.min
-                except:
-                    return datetime.datetime.min
+    def abrir_resumen_ubicaciones(self):
+        if self.verificar_bloqueo(): return
+        ventana = tk.Toplevel(self.root)
+        ventana.title("📍 Resumen por Ubicación")
+        ventana.geometry("520x450")
+        ventana.configure(bg=COLOR_FONDO_MAIN)
 
-            # Ordenamos DESCENDENTE (lo más nuevo arriba)
-            items_ordenados = sorted(items, key=obtener_fecha_ultimo_mov, reverse=True)
-        else:
-            items_ordenados = sorted(items, key=lambda x: int(x[0]) if x[0].isdigit() else 0)
+        tk.Label(ventana, text="Doble clic en una ubicación para verla en la tabla", font=("Segoe UI", 9),
+                 bg=COLOR_FONDO_MAIN, fg="#7f8c8d").pack(pady=(10, 5))
 
-        # --- SEMÁFORO DE INVENTARIO (CONFIGURACIÓN) ---
-        self.tabla.tag_configure('stock_critico', background='#e74c3c', foreground='white')  # Rojo
-        self.tabla.tag_configure('stock_bajo', background='#f1c40f', foreground='black')  # Amarillo
+        frame_tabla = tk.Frame(ventana, bg=COLOR_FONDO_MAIN)
+        frame_tabla.pack(fill=tk.BOTH, expand=True, padx=15)
+        columnas = ("Ubicacion", "Piezas", "Unidades", "Criticas")
+        tree = ttk.Treeview(frame_tabla, columns=columnas, show='headings')
+        tree.heading("Ubicacion", text="UBICACIÓN");
+        tree.column("Ubicacion", width=160)
+        tree.heading("Piezas", text="PIEZAS");
+        tree.column("Piezas", width=80, anchor=tk.CENTER)
+        tree.heading("Unidades", text="UNIDADES");
+        tree.column("Unidades", width=90, anchor=tk.CENTER)
+        tree.heading("Criticas", text="STOCK CRÍTICO");
+        tree.column("Criticas", width=110, anchor=tk.CENTER)
+        tree.tag_configure('con_criticas', foreground=COLOR_BTN_ROJO)
+        scroll = tk.Scrollbar(frame_tabla, command=tree.yview)
+        tree.configure(yscrollcommand=scroll.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
-        for pid, d in items_ordenados:
-            estatus_hoy = self.obtener_estatus_hoy_texto(d.get('historial', []))
+        resumen = self.indice_ubicaciones.resumen()
+        for ubicacion, piezas, unidades, criticas in resumen:
+            tree.insert("", tk.END, values=(ubicacion, piezas, unidades, criticas),
+                        tags=('con_criticas',) if criticas else ())
+        tk.Label(ventana, text=f"{len(resumen)} ubicaciones | {sum(r[1] for r in resumen)} piezas | "
+                               f"{sum(r[2] for r in resumen)} unidades | {sum(r[3] for r in resumen)} en stock crítico",
+                 font=("Segoe UI", 9, "bold"), bg=COLOR_FONDO_MAIN, fg=COLOR_TEXTO_OSCURO).pack(pady=10)
 
-            # --- SEMÁFORO DE INVENTARIO (LÓGICA) ---
-            cantidad = int(d['cantidad'])
-            tag_fila = ()  # Sin color por defecto
+        def ver_ubicacion(event=None):
+            sel = tree.selection()
+            if not sel: return
+            self.filtro_ubicacion = str(tree.item(sel[0], 'values')[0])
+            self.combo_ubicacion.set(self.filtro_ubicacion)
+            self.refrescar_tabla()
+            ventana.destroy()
 
-            if cantidad <= 2:
-                tag_fila = ('stock_critico',)  # Menos de 2: ROJO
-            elif cantidad <= 5:
-                tag_fila = ('stock_bajo',)  # Entre 3 y 5: AMARILLO
+        tree.bind("<Double-1>", ver_ubicacion)
+
+    def realizar_busqueda(self, event=None):
+        if self.verificar_bloqueo(): return
+        if self.busqueda_pendiente:
+            self.root.after_cancel(self.busqueda_pendiente)
+            self.busqueda_pendiente = None
+        termino = self.entry_buscar.get().strip().lower()
+        if not termino: return messagebox.showwarning("Buscador", "Ingresa un código o nombre.")
 
-            item_id = self.tabla.insert("", tk.END,
-                                        values=(pid, d.get('codigo', ''), d['nombre'], d['cantidad'], d['gabinete'],
-                                                estatus_hoy, d['descripcion']),
-                                        tags=tag_fila)  # Agregar el tag aquí
+        def al_terminar(resultados):
+            if self.modo_actual == "editar": return
+            if len(resultados) == 0:
+                messagebox.showerror("Sin resultados", f"No se encontró nada con '{termino}'.")
+            elif self.busqueda_principal.aproximada:
+                # Sin coincidencia exacta: la tabla muestra las más parecidas, la mejor arriba y seleccionada
+                self.termino_filtro = termino
+                self.refrescar_tabla(id_seleccionado=resultados[0])
+                messagebox.showinfo("Búsqueda Aproximada",
+                                    f"No hay coincidencia exacta con '{termino}'.\n"
+                                    f"Se muestran {len(resultados)} piezas parecidas, la más parecida primero.")
+            else:
+                # La tabla ya queda filtrada; con una sola coincidencia se abre su ficha
+                self.termino_filtro = termino
+                self.refrescar_tabla(id_seleccionado=resultados[0] if len(resultados) == 1 else None)
+
+        self.buscar_en_tabla(termino, al_terminar=al_terminar)
+
+    def refrescar_tabla(self, id_seleccionado=None, encontrados=None, ordenados=False):
+        # Refresco completo (cambio de filtro, de orden o restauración): la tabla vuelve arriba
+        self.cambios_tabla = {}
+        self.filas_tabla = self.calcular_filas(encontrados, ordenados)
+        self.actualizar_contadores_stock()
+        self.inicio_tabla = 0
+        self.pid_seleccionado = None
+        if id_seleccionado and self.mostrar_fila(str(id_seleccionado)):
+            self.seleccionar_item(None)
+        else:
+            self.dibujar_ventana_tabla()
+
+    def actualizar_tabla(self, id_seleccionado=None):
+        # Refresco después de un cambio: solo se tocan las filas de las piezas que cambiaron
+        # (self.cambios_tabla, llenado en aplicar_lote). El orden de la vista se recalcula solo si
+        # alguna pudo cambiar de lugar o entrar / salir del filtro; la posición en pantalla se conserva.
+        cambios, self.cambios_tabla = self.cambios_tabla, {}
+        if any(self.cambia_vista(pid, anterior) for pid, anterior in cambios.items()):
+            self.filas_tabla = self.calcular_filas()
+        if self.pid_seleccionado not in self.inventario: self.pid_seleccionado = None
+        self.actualizar_contadores_stock()
+        if id_seleccionado and self.mostrar_fila(str(id_seleccionado), sucios=cambios):
+            self.seleccionar_item(None)
+        else:
+            self.dibujar_ventana_tabla(sucios=cambios)
+
+    def cambia_vista(self, pid, anterior):
+        nueva = self.inventario.get(pid)
+        if anterior is None or nueva is None: return True
+        if self.termino_filtro and self.indice_busqueda.cambio(anterior, nueva): return True
+        if self.filtro_ubicacion and \
+                clave_ubicacion(anterior.get('gabinete', '')) != clave_ubicacion(nueva.get('gabinete', '')):
+            return True
+        if self.filtro_stock and banda_stock(anterior) != banda_stock(nueva): return True
+        if self.termino_filtro and self.busqueda_principal.aproximada: return False
+        clave = IndiceOrden.CLAVES[self.orden_actual]
+        return clave(pid, anterior) != clave(pid, nueva)
+
+    def calcular_filas(self, encontrados=None, ordenados=False):
+        # --- LÓGICA DE ORDENAMIENTO (órdenes ya mantenidos en indice_orden) ---
+        # "encontrados": coincidencias exactas que entrega el buscador (por partes, en orden de ID, o
+        # completas y ya en el orden de la tabla si "ordenados")
+        filtros = []
+        if self.filtro_ubicacion: filtros.append(self.indice_ubicaciones.pids(self.filtro_ubicacion))
+        if self.filtro_stock: filtros.append(self.indice_bandas.pids(self.filtro_stock))
+        if self.termino_filtro:
+            if encontrados is None:
+                pids, aproximada = self.busqueda_principal.buscar(self.termino_filtro), \
+                                   self.busqueda_principal.aproximada
+            elif ordenados:
+                # Quien llama ya comprobó que indice_orden no cambió: no hubo altas ni bajas desde la búsqueda
+                pids, aproximada = encontrados, False
+            else:
+                pids, aproximada = list(filter(self.inventario.__contains__, encontrados)), False
+            for filtro in filtros:
+                pids = list(filter(filtro.__contains__, pids))
+            if aproximada or self.orden_actual == "id":
+                # Aproximada: primero la más parecida. Por ID el índice ya las entrega así, y los
+                # filtros conservan el orden.
+                pids = list(pids)
+            elif not ordenados:
+                pids = self.indice_orden.ordenar(self.orden_actual, self.inventario, set(pids))
+        elif filtros:
+            filtros.sort(key=len)
+            pids = self.indice_orden.ordenar(self.orden_actual, self.inventario,
+                                             set(filtros[0]).intersection(*filtros[1:]))
+        else:
+            pids = self.indice_orden.ordenar(self.orden_actual, self.inventario)
+        return pids
+
+    # --- TABLA VIRTUAL ---
+    # self.filas_tabla es el orden completo de la vista (pids); el Treeview solo tiene la ventana
+    # que se ve más MARGEN_FILAS_TABLA filas, con el pid como iid. La barra vertical mueve la ventana.
+    def filas_visibles(self):
+        alto = self.tabla.winfo_height()
+        if alto <= 1: return 30  # Aún no se dibuja
+        return max(1, (alto - ALTO_FILA_TABLA) // ALTO_FILA_TABLA)  # Sin el encabezado
+
+    def fila_tabla(self, pid, inicio_hoy):
+        d = self.inventario[pid]
+        estatus_hoy = self.obtener_estatus_hoy_texto(d, inicio_hoy)
+
+        # --- SEMÁFORO DE INVENTARIO (LÓGICA): la banda ya está calculada en indice_bandas ---
+        banda = self.indice_bandas.banda.get(pid)
+        tag_fila = ('stock_' + banda,) if banda else ()  # Sin color por defecto
+
+        return (pid, d.get('codigo', ''), d['nombre'], d['cantidad'], d['gabinete'], estatus_hoy,
+                d['descripcion']), tag_fila
+
+    def dibujar_ventana_tabla(self, sucios=None):
+        # Sincroniza las filas creadas con la ventana: borra las que salieron, crea las que entraron,
+        # actualiza en su lugar las de "sucios" (None = todas) y mueve solo las que cambiaron de lugar
+        total, visibles = len(self.filas_tabla), self.filas_visibles()
+        self.inicio_tabla = max(0, min(self.inicio_tabla, total - visibles))
+        fin = min(total, self.inicio_tabla + visibles + MARGEN_FILAS_TABLA)
+        deseadas = self.filas_tabla[self.inicio_tabla:fin]
+
+        inicio_hoy = inicio_del_dia()
+        if inicio_hoy != self.dia_tabla:
+            # Cambió el día: el "estatus hoy" de todas las filas ya no vale
+            self.dia_tabla, sucios = inicio_hoy, None
+        actuales = self.tabla.get_children()
+        en_ventana = set(deseadas)
+        salen = [iid for iid in actuales if iid not in en_ventana]
+        if salen: self.tabla.delete(*salen)
+        quedan = set(actuales).difference(salen)
+
+        for pid in deseadas:
+            if pid not in quedan:
+                valores, tags = self.fila_tabla(pid, inicio_hoy)
+                self.tabla.insert("", tk.END, iid=pid, values=valores, tags=tags)
+            elif sucios is None or pid in sucios:
+                valores, tags = self.fila_tabla(pid, inicio_hoy)
+                self.tabla.item(pid, values=valores, tags=tags)
+
+        hijos = list(self.tabla.get_children())
+        if hijos != deseadas:
+            for i, pid in enumerate(deseadas):
+                if hijos[i] != pid:
+                    self.tabla.move(pid, "", i)
+                    hijos.remove(pid)
+                    hijos.insert(i, pid)
+
+        if self.pid_seleccionado is not None and self.tabla.exists(self.pid_seleccionado):
+            self.tabla.selection_set(self.pid_seleccionado)
+        elif self.tabla.selection():
+            self.tabla.selection_remove(*self.tabla.selection())
+        self.tabla.yview_moveto(0)
+        if total:
+            self.scroll_tabla.set(self.inicio_tabla / total, min(1.0, (self.inicio_tabla + visibles) / total))
+        else:
+            self.scroll_tabla.set(0, 1)
 
-            if id_seleccionado and str(pid) == str(id_seleccionado):
-                self.tabla.selection_set(item_id);
-                self.tabla.see(item_id);
-                self.seleccionar_item(None)
+    def desplazar_tabla(self, accion, cantidad, unidad=None):
+        # Mismos argumentos que recibe yview desde la barra: ("moveto", f) o ("scroll", n, "units"/"pages")
+        if accion == "moveto":
+            self.inicio_tabla = int(float(cantidad) * len(self.filas_tabla))
+        else:
+            self.inicio_tabla += int(cantidad) * (self.filas_visibles() if unidad == "pages" else 1)
+        self.dibujar_ventana_tabla(sucios=())
+
+    def rueda_tabla(self, event):
+        self.desplazar_tabla("scroll", -3 if event.num == 4 or event.delta > 0 else 3, "units")
+        return "break"
+
+    def fila_en_tabla(self, pid):
+        # Posición de pid en filas_tabla, o None. filas_tabla nunca se modifica en el lugar, solo se
+        # reemplaza: el índice se rearma, al primer uso, cada vez que la lista es otra
+        filas, posiciones = self.posiciones_tabla
+        if filas is not self.filas_tabla:
+            posiciones = dict(zip(self.filas_tabla, range(len(self.filas_tabla))))
+            self.posiciones_tabla = (self.filas_tabla, posiciones)
+        return posiciones.get(pid)
+
+    def mostrar_fila(self, pid, sucios=None):
+        # Equivalente a see(): mueve la ventana lo justo para que la pieza quede a la vista y la selecciona
+        i = self.fila_en_tabla(pid)
+        if i is None: return False
+        visibles = self.filas_visibles()
+        if i < self.inicio_tabla:
+            self.inicio_tabla = i
+        elif i >= self.inicio_tabla + visibles:
+            self.inicio_tabla = i - visibles + 1
+        self.pid_seleccionado = pid
+        self.dibujar_ventana_tabla(sucios)
+        return True
+
+    def mover_seleccion_tabla(self, paso):
+        # Flechas / RePág / AvPág: al llegar al borde de la ventana se desplaza la tabla
+        if self.modo_actual == "editar" or not self.filas_tabla: return "break"
+        i = self.fila_en_tabla(self.pid_seleccionado)
+        i = self.inicio_tabla if i is None else i + paso
+        self.mostrar_fila(self.filas_tabla[max(0, min(i, len(self.filas_tabla) - 1))], sucios=())
+        self.seleccionar_item(None)
+        return "break"
+
+    def leer_puntos_reorden(self):
+        # Vacío = valor por defecto (None); devuelve None si los puntos no son coherentes
+        critico, bajo = self.entry_punto_critico.get().strip(), self.entry_punto_bajo.get().strip()
+        puntos = {"punto_critico": int(critico) if critico else None, "punto_bajo": int(bajo) if bajo else None}
+        if puntos_reorden(puntos)[0] > puntos_reorden(puntos)[1]:
+            messagebox.showerror("Puntos de Reorden", "⛔ El punto crítico no puede ser mayor que el punto bajo.")
+            return None
+        return puntos
 
     def seleccionar_item(self, event):
         sel = self.tabla.selection()
@@ -676,6 +2902,7 @@ class SistemaInventario:
             self.modo_actual = "lectura"
             self.actualizar_botones_sidebar()
 
+        self.pid_seleccionado = sel[0]
         vals = self.tabla.item(sel[0], 'values')
         self.entry_id.config(state='normal')
         self.entry_id.delete(0, tk.END)
@@ -692,29 +2919,61 @@ class SistemaInventario:
         self.entry_gabinete.insert(0, vals[4])
         self.entry_desc.delete(0, tk.END);
         self.entry_desc.insert(0, vals[6])
+        pieza = self.inventario.get(str(vals[0]), {})
+        for entry, campo in ((self.entry_punto_critico, 'punto_critico'), (self.entry_punto_bajo, 'punto_bajo')):
+            entry.delete(0, tk.END)
+            if pieza.get(campo) is not None: entry.insert(0, pieza[campo])
         self.bloquear_campos()
 
         pid = vals[0]
-        historial = self.inventario[pid].get('historial', [])
+        # Copia: la lista es la del caché, y un movimiento nuevo se inserta al principio y correría las páginas
+        historial = list(historial_pieza(str(pid)))
+        self.historial_ficha, self.lineas_ficha = historial, 0
         self.txt_detalles.config(state=tk.NORMAL);
         self.txt_detalles.delete(1.0, tk.END)
-        info_header = f"--- FICHA TÉCNICA ---\nID: {pid} | CÓDIGO: {vals[1]} | PIEZA: {vals[2]} | UBICACIÓN: {vals[4]}\nDESCRIPCIÓN: {vals[6]}\n\n--- HISTORIAL DETALLADO ---\n"
+        critico, bajo = puntos_reorden(pieza)
+        info_header = f"--- FICHA TÉCNICA ---\nID: {pid} | CÓDIGO: {vals[1]} | PIEZA: {vals[2]} | UBICACIÓN: {vals[4]}\nDESCRIPCIÓN: {vals[6]}\nPUNTO CRÍTICO: {critico} | PUNTO BAJO: {bajo}\n\n--- HISTORIAL DETALLADO ---\n"
         self.txt_detalles.insert(tk.END, info_header, "negro")
 
         if not historial:
             self.txt_detalles.insert(tk.END, "Sin movimientos registrados.", "negro")
-        else:
-            for linea in historial:
-                if "SALIDA" in linea:
-                    self.txt_detalles.insert(tk.END, linea + "\n", "azul")
-                elif "ENTRADA" in linea:
-                    self.txt_detalles.insert(tk.END, linea + "\n", "verde")
-                else:
-                    self.txt_detalles.insert(tk.END, linea + "\n", "negro")
         self.txt_detalles.config(state=tk.DISABLED)
+        self.cargar_mas_historial()
+
+    # --- HISTORIAL DE LA FICHA POR PÁGINAS ---
+    # Se muestran LINEAS_HISTORIAL_PAGINA movimientos (los más nuevos); los anteriores se agregan al
+    # llegar al final con la barra o con "Cargar más". Cada página es un solo insert con sus colores.
+    def cargar_mas_historial(self):
+        self.carga_ficha_pendiente = False
+        inicio = self.lineas_ficha
+        pagina = self.historial_ficha[inicio:inicio + LINEAS_HISTORIAL_PAGINA]
+        if not pagina: return
+        self.lineas_ficha = inicio + len(pagina)
+
+        trozos = []  # [texto, tag, texto, tag, ...]; las líneas seguidas del mismo color van juntas
+        for mov in pagina:
+            tag = {"SALIDA": "azul", "ENTRADA": "verde"}.get(mov['tipo'], "negro")
+            if trozos and trozos[-1] == tag:
+                trozos[-2] += texto_movimiento(mov) + "\n"
+            else:
+                trozos += [texto_movimiento(mov) + "\n", tag]
+        restantes = len(self.historial_ficha) - self.lineas_ficha
+        if restantes: trozos += [f"▼ Cargar más ({restantes} movimientos anteriores)\n", "mas"]
+
+        self.txt_detalles.config(state=tk.NORMAL)
+        if self.txt_detalles.tag_ranges("mas"): self.txt_detalles.delete("mas.first", "mas.last")
+        self.txt_detalles.insert(tk.END, *trozos)
+        self.txt_detalles.config(state=tk.DISABLED)
+
+    def desplazamiento_detalles(self, primero, ultimo):
+        self.scroll_det.set(primero, ultimo)
+        # Al llegar al final se agrega la siguiente página (una sola vez por llegada)
+        if float(ultimo) >= 1.0 and self.lineas_ficha < len(self.historial_ficha) and not self.carga_ficha_pendiente:
+            self.carga_ficha_pendiente = True
+            self.txt_detalles.after_idle(self.cargar_mas_historial)
 
     def agregar_pieza(self):
-        pid, cod, nom, cant, gab, desc = self.entry_id.get(), self.entry_codigo.get().strip(), self.entry_nombre.get().strip(), self.entry_cantidad.get().strip(), self.entry_gabinete.get().strip(), self.entry_desc.get().strip()
+        cod, nom, cant, gab, desc = self.entry_codigo.get().strip(), self.entry_nombre.get().strip(), self.entry_cantidad.get().strip(), self.entry_gabinete.get().strip(), self.entry_desc.get().strip()
 
         if not cod or not nom or not cant or not gab:
             return messagebox.showwarning("Incompleto", "⚠️ Faltan datos obligatorios.")
@@ -727,19 +2986,31 @@ class SistemaInventario:
         if not messagebox.askyesno("Guardar", f"¿Registrar '{nom}'?"): return
 
         try:
-            self.inventario[pid] = {"codigo": cod, "nombre": nom, "cantidad": int(cant), "gabinete": gab,
-                                    "descripcion": desc, "historial": []}
+            cantidad = int(cant)
+        except ValueError:
+            return messagebox.showerror("Error", "Cantidad debe ser número")
+        puntos = self.leer_puntos_reorden()
+        if puntos is None: return
 
-            registrar_accion_global("CREACIÓN", cod, nom, f"Stock Inicial: {cant}")
+        # El ID mostrado es solo una vista previa; se reserva al guardar
+        try:
+            pid = self.reservar_ids(1)[0]
+        except Exception as e:
+            return messagebox.showerror("Error", f"No se pudo asignar un ID: {e}")
 
-            guardar_datos(self.inventario);
-            self.refrescar_tabla(id_seleccionado=pid);
-            self.modo_actual = "lectura"
-            self.bloquear_campos()
-            self.actualizar_botones_sidebar()
-            messagebox.showinfo("Éxito", "Pieza guardada.")
-        except ValueError:
-            messagebox.showerror("Error", "Cantidad debe ser número")
+        if not self.aplicar_cambio({"op": "alta", "id": pid,
+                                    "pieza": {"codigo": cod, "nombre": nom, "cantidad": cantidad,
+                                              "gabinete": gab, "descripcion": desc,
+                                              **{k: v for k, v in puntos.items() if v is not None}}}):
+            return
+
+        registrar_accion_global("CREACIÓN", cod, nom, f"Stock Inicial: {cant}")
+
+        self.actualizar_tabla(id_seleccionado=pid);
+        self.modo_actual = "lectura"
+        self.bloquear_campos()
+        self.actualizar_botones_sidebar()
+        messagebox.showinfo("Éxito", "Pieza guardada.")
 
     def actualizar_pieza(self):
         pid, cod, nom, cant, gab, desc = self.entry_id.get(), self.entry_codigo.get().strip(), self.entry_nombre.get().strip(), self.entry_cantidad.get().strip(), self.entry_gabinete.get().strip(), self.entry_desc.get().strip()
@@ -749,13 +3020,16 @@ class SistemaInventario:
             return messagebox.showerror("Código Repetido",
                                         f"⛔ El código '{cod}' ya está en uso por otra pieza:\n{nombre_duplicado}")
 
+        puntos = self.leer_puntos_reorden()
+        if puntos is None: return
+
         if not messagebox.askyesno("Actualizar", f"¿Guardar cambios en '{nom}'?"): return
         try:
-            historial_previo = self.inventario[pid].get('historial', [])
-            self.inventario[pid] = {"codigo": cod, "nombre": nom, "cantidad": int(cant), "gabinete": gab,
-                                    "descripcion": desc, "historial": historial_previo}
-            guardar_datos(self.inventario);
-            self.refrescar_tabla(id_seleccionado=pid);
+            if not self.aplicar_cambio({"op": "editar", "id": pid,
+                                        "campos": {"codigo": cod, "nombre": nom, "cantidad": int(cant),
+                                                   "gabinete": gab, "descripcion": desc, **puntos}}):
+                return
+            self.actualizar_tabla(id_seleccionado=pid);
             self.modo_actual = "lectura"
             self.bloquear_campos()
             self.actualizar_botones_sidebar()
@@ -765,18 +3039,16 @@ class SistemaInventario:
 
     def eliminar_pieza(self):
         if self.verificar_bloqueo(): return
-        seleccion = self.tabla.selection()
-        if not seleccion: return messagebox.showwarning("Aviso",
-                                                        "⚠️ Por favor, selecciona una herramienta de la lista para eliminar.")
+        if not self.pid_seleccionado: return messagebox.showwarning("Aviso",
+                                                                    "⚠️ Por favor, selecciona una herramienta de la lista para eliminar.")
         pid = self.entry_id.get();
         if not pid: return messagebox.showwarning("Aviso", "No hay un ID seleccionado.")
 
         if messagebox.askyesno("Eliminar", f"¿Estás seguro de ELIMINAR permanentemente la pieza ID {pid}?"):
             data = self.inventario[pid]
+            if not self.aplicar_cambio({"op": "baja", "id": pid}): return
             registrar_accion_global("ELIMINACIÓN", data.get('codigo', ''), data['nombre'], "Pieza dada de baja")
-            del self.inventario[pid];
-            guardar_datos(self.inventario);
-            self.refrescar_tabla();
+            self.actualizar_tabla();
             self.modo_actual = "lectura"
             self.limpiar_campos_visual()
             self.actualizar_botones_sidebar()
@@ -839,20 +3111,63 @@ class SistemaInventario:
         tree_search.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
         scroll_s.pack(side=tk.RIGHT, fill=tk.Y, pady=5)
 
-        # Lógica de Búsqueda
-        def buscar_en_modal(event=None):
-            term = entry_buscar_modal.get().strip().lower()
+        # Lógica de Búsqueda (se filtra mientras se escribe)
+        busqueda_modal = BusquedaIncremental(self.indice_busqueda)
+        buscador_modal = BuscadorSegundoPlano(ventana)
+        ventana.bind("<Destroy>", lambda e: buscador_modal.cerrar() if e.widget is ventana else None)
+        pendiente = [None]
+
+        def mostrar_en_modal(resultados, ubicacion, terminado=True, aproximada=False):
+            if not tree_search.winfo_exists(): return
+            if ubicacion != "Todas":
+                en_ubicacion = self.indice_ubicaciones.pids(ubicacion)
+                resultados = [pid for pid in resultados if pid in en_ubicacion]
             for i in tree_search.get_children(): tree_search.delete(i)
-            for pid, d in self.inventario.items():
-                cod = str(d.get('codigo', '')).lower()
-                nom = str(d['nombre']).lower()
-                if term in cod or term in nom:
-                    tree_search.insert("", tk.END, values=(d.get('codigo', ''), d['nombre'], d['cantidad']))
+            for pid in resultados[:LIMITE_RESULTADOS_MODAL]:
+                d = self.inventario.get(pid)
+                if d is None: continue
+                tree_search.insert("", tk.END, values=(d.get('codigo', ''), d['nombre'], d['cantidad']))
+            if not terminado:
+                frame_search.config(text=f"1. Buscar en Inventario (buscando... {len(resultados)})")
+            elif aproximada:
+                frame_search.config(text="1. Buscar en Inventario (parecidas)")
+            elif len(resultados) > LIMITE_RESULTADOS_MODAL:
+                frame_search.config(text=f"1. Buscar en Inventario ({LIMITE_RESULTADOS_MODAL} de {len(resultados)})")
+            else:
+                frame_search.config(text="1. Buscar en Inventario")
 
-        btn_b_modal = tk.Button(frame_input_search, text="🔍", command=buscar_en_modal,
+        def buscar_en_modal(event=None):
+            pendiente[0] = None
+            if not tree_search.winfo_exists(): return
+            term = entry_buscar_modal.get().strip().lower()
+            ubicacion = combo_ubic_modal.get()
+            if ubicacion != "Todas" and not term:
+                buscador_modal.cancelar()
+                # Ya son solo las de esa ubicación: no hace falta volver a filtrarlas
+                return mostrar_en_modal(sorted(self.indice_ubicaciones.pids(ubicacion), key=clave_id), "Todas")
+            buscador_modal.buscar(busqueda_modal, term, lambda pids: mostrar_en_modal(pids, ubicacion, False),
+                                  lambda pids: mostrar_en_modal(pids, ubicacion, True, busqueda_modal.aproximada))
+
+        def programar_busqueda_modal(event=None):
+            if event is not None and event.keysym == "Return": return
+            if pendiente[0]: ventana.after_cancel(pendiente[0])
+            pendiente[0] = ventana.after(RETARDO_BUSQUEDA_MS, buscar_en_modal)
+
+        def buscar_ahora(event=None):
+            if pendiente[0]: ventana.after_cancel(pendiente[0])
+            buscar_en_modal()
+
+        btn_b_modal = tk.Button(frame_input_search, text="🔍", command=buscar_ahora,
                                 bg="#34495e", fg="white", width=3)
         btn_b_modal.pack(side=tk.LEFT, padx=2)
-        entry_buscar_modal.bind('<Return>', buscar_en_modal)
+        combo_ubic_modal = ttk.Combobox(frame_input_search, state="readonly", width=10,
+                                        postcommand=lambda: combo_ubic_modal.config(
+                                            values=["Todas"] + self.indice_ubicaciones.ubicaciones()))
+        combo_ubic_modal.set("Todas")
+        combo_ubic_modal.pack(side=tk.LEFT, padx=2)
+        combo_ubic_modal.bind("<<ComboboxSelected>>", buscar_ahora)
+        entry_buscar_modal.bind('<Return>', buscar_ahora)
+        entry_buscar_modal.bind('<KeyRelease>', programar_busqueda_modal)
 
         # -- SUB-PANEL DERECHO: AGREGAR AL CARRITO --
         frame_add = tk.LabelFrame(frame_middle, text="2. Seleccionar", font=("Segoe UI", 10, "bold"),
@@ -868,14 +3183,6 @@ class SistemaInventario:
         entry_cant.insert(0, "1")
         entry_cant.pack(pady=2, padx=10)
 
-        # Función de Búsqueda ID
-        def buscar_id_por_codigo(codigo):
-            codigo = codigo.strip().lower()
-            for pid, data in self.inventario.items():
-                if str(data.get('codigo', '')).strip().lower() == codigo:
-                    return pid
-            return None
-
         # Función Agregar al Carrito
         def agregar_al_carrito():
             cod = entry_cod.get().strip()
@@ -886,7 +3193,7 @@ class SistemaInventario:
             cant = int(cant_str)
             if cant <= 0: return messagebox.showwarning("Error", "Cantidad > 0.")
 
-            pid = buscar_id_por_codigo(cod)
+            pid = self.indice_codigos.buscar(cod)
 
             if not pid:
                 return messagebox.showerror("Error", f"Código '{cod}' no existe.")
@@ -967,9 +3274,18 @@ class SistemaInventario:
 
             accion_txt = "PRESTAR" if tipo == "SALIDA" else "DEVOLVER"
 
+            # Líneas repetidas de la misma pieza se combinan antes de validar el stock
+            lineas = {}
+            for item in carrito:
+                if item['id'] in lineas:
+                    lineas[item['id']]['cant'] += item['cant']
+                else:
+                    lineas[item['id']] = dict(item)
+            lineas = list(lineas.values())
+
             # Validar stock solo para salidas
             if tipo == "SALIDA":
-                for item in carrito:
+                for item in lineas:
                     stock_actual = int(self.inventario[item['id']]['cantidad'])
                     if item['cant'] > stock_actual:
                         return messagebox.showerror("Error de Stock",
@@ -977,7 +3293,7 @@ class SistemaInventario:
 
             # --- MENSAJE DE CONFIRMACIÓN DETALLADO ---
             nombres_lista = ""
-            for item in carrito:
+            for item in lineas:
                 nombres_lista += f"• {item['cant']} pz - {item['nombre']}\n"
 
             msg_confirm = f"¿Está seguro de {accion_txt} estas herramientas al empleado {emp}?\n\n{nombres_lista}"
@@ -986,27 +3302,9 @@ class SistemaInventario:
                 return
             # -----------------------------------------
 
-            for item in carrito:
-                pid = item['id']
-                cant = item['cant']
-                nombre_pieza = item['nombre']
-                codigo_pieza = item['codigo']
-
-                stock_actual = int(self.inventario[pid]['cantidad'])
-
-                if tipo == "SALIDA":
-                    nuevo_stock = stock_actual - cant
-                    txt_log = f"Préstamo a Empleado: {emp} (-{cant})"
-                    msg_historial = f"📤 {datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')} | SALIDA | Empleado: {emp} | Cant: -{cant} | Restan: {nuevo_stock}"
-                else:
-                    nuevo_stock = stock_actual + cant
-                    txt_log = f"Devolución de Empleado: {emp} (+{cant})"
-                    msg_historial = f"📥 {datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')} | ENTRADA | Empleado: {emp} | Cant: +{cant} | Total: {nuevo_stock}"
-
-                registrar_accion_global(tipo, codigo_pieza, nombre_pieza, txt_log)
-                self.actualizar_inventario_movimiento(pid, nuevo_stock, msg_historial)
+            if not self.procesar_movimientos(tipo, emp, lineas): return
 
-            messagebox.showinfo("Éxito", f"Operación completada con {len(carrito)} ítems.")
+            messagebox.showinfo("Éxito", f"Operación completada con {len(lineas)} ítems.")
             ventana.destroy()
 
         btn_prestar = tk.Button(frame_final, text="📤 PROCESAR PRÉSTAMO",
@@ -1019,34 +3317,125 @@ class SistemaInventario:
                                  bg="#27ae60", fg="white", font=("Segoe UI", 10, "bold"), height=2)
         btn_devolver.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=5)
 
-    def actualizar_inventario_movimiento(self, pid, nuevo_stock, mensaje):
-        self.inventario[pid]['cantidad'] = nuevo_stock
-        if 'historial' not in self.inventario[pid]: self.inventario[pid]['historial'] = []
-        self.inventario[pid]['historial'].insert(0, mensaje)
-        guardar_datos(self.inventario)
-        self.refrescar_tabla(id_seleccionado=pid)
+    def procesar_movimientos(self, tipo, emp, lineas):
+        # Aplica todo el carrito como una sola transacción: una escritura del inventario,
+        # una escritura del log global y un solo refresco de la tabla.
+        ts = int(time.time())
+        registros, eventos = [], []
+        for item in lineas:
+            pid, cant = item['id'], item['cant']
+            stock_actual = int(self.inventario[pid]['cantidad'])
 
-    def obtener_estatus_hoy_texto(self, historial):
-        if not historial: return "✅ Sin cambios hoy"
-        try:
-            ultimo_mov = historial[0]
-            partes = ultimo_mov.split(" ")
-            if len(partes) > 2:
-                fecha_mov = partes[1]
-                hora_mov = partes[2][:5]
-                hoy = datetime.datetime.now().strftime("%d/%m/%Y")
-                if fecha_mov == hoy:
-                    if "SALIDA" in ultimo_mov:
-                        return f"📤 SALIDA a las {hora_mov}"
+            if tipo == "SALIDA":
+                nuevo_stock = stock_actual - cant
+                if nuevo_stock < 0: return False
+                txt_log = f"Préstamo a Empleado: {emp} (-{cant})"
+            else:
+                nuevo_stock = stock_actual + cant
+                txt_log = f"Devolución de Empleado: {emp} (+{cant})"
+
+            registros.append({"op": "mov", "id": pid, "cantidad": nuevo_stock,
+                              "mov": {"ts": ts, "tipo": tipo, "empleado": emp,
+                                      "delta": -cant if tipo == "SALIDA" else cant, "saldo": nuevo_stock}})
+            eventos.append(crear_evento_global(tipo, item['codigo'], item['nombre'], txt_log, empleado=emp))
+
+        if not self.aplicar_lote(registros): return False
+        registrar_acciones_globales(eventos)
+        self.actualizar_tabla(id_seleccionado=lineas[-1]['id'])
+        return True
+
+    # --- PERSISTENCIA POR JOURNAL ---
+    def aplicar_cambio(self, registro):
+        return self.aplicar_lote([registro])
+
+    def aplicar_lote(self, registros):
+        # Se aplica en memoria y se agrega al journal en una sola línea: el costo depende del cambio,
+        # no del almacén. Si la escritura falla se restaura el estado previo (todo o nada).
+        registro = registros[0] if len(registros) == 1 else {"op": "lote", "registros": registros}
+        previos = {}
+        for r in registros:
+            pid = r.get("id")
+            if pid in previos: continue
+            pieza = self.inventario.get(pid)
+            previos[pid] = None if pieza is None else dict(pieza)
+        efectos = []
+        with self.persistencia.candado:
+            try:
+                aplicar_mutacion(self.inventario, registro, efectos)
+                registrar_mutacion(registro)
+            except Exception as e:
+                for pid, pieza in previos.items():
+                    if pieza is None:
+                        self.inventario.pop(pid, None)
                     else:
-                        return f"📥 ENTRADA a las {hora_mov}"
-        except:
-            return "✅ Sin cambios hoy"
-        return "✅ Sin cambios hoy"
+                        self.inventario[pid] = pieza
+                messagebox.showerror("Error", f"No se pudo guardar inventario: {e}")
+                return False
+            for pid, anterior in previos.items():
+                self.actualizar_indices(pid, anterior, self.inventario.get(pid))
+                self.cambios_tabla.setdefault(pid, anterior)  # Se conserva el estado previo al primer cambio
+            _libro_prestamos.aplicar_efectos(efectos)
+            try:
+                self.persistencia.aplicar_historial(efectos)
+            except Exception as e:
+                # El cambio ya quedó en el journal; el segmento se completa en el siguiente intento
+                messagebox.showerror("Error", f"No se pudo guardar el historial de la pieza: {e}")
+            self.persistencia.marcar_sucio()
+        return True
+
+    # --- ÍNDICES EN MEMORIA ---
+    def reconstruir_indices(self):
+        self.indice_codigos = IndiceCodigos(self.inventario)
+        self.indice_busqueda = IndiceNgramas(self.inventario)
+        self.busqueda_principal = BusquedaIncremental(self.indice_busqueda)
+        self.indice_ubicaciones = IndiceUbicaciones(self.inventario)
+        self.indice_orden = IndiceOrden(self.inventario)
+        self.indice_bandas = IndiceBandas(self.inventario)
+        # Inventario e índices duran toda la sesión: se sacan del recolector para que sus pasadas
+        # completas no recorran cien mil fichas en medio de una búsqueda
+        gc.freeze()
+        repetidos = self.indice_codigos.repetidos()
+        if repetidos:
+            detalle = "\n".join(f"{codigo}: IDs {', '.join(pids)}" for codigo, pids in list(repetidos.items())[:10])
+            messagebox.showwarning("Códigos Repetidos", f"⚠️ Hay códigos usados por más de una pieza:\n{detalle}")
+
+    def actualizar_indices(self, pid, anterior, nueva):
+        # anterior / nueva son el registro antes y después del cambio (None si no existe)
+        if anterior is None or nueva is None or \
+                normalizar_codigo(anterior.get('codigo', '')) != normalizar_codigo(nueva.get('codigo', '')):
+            if anterior is not None: self.indice_codigos.quitar(pid, anterior)
+            if nueva is not None: self.indice_codigos.agregar(pid, nueva)
+        if anterior is None or nueva is None or self.indice_busqueda.cambio(anterior, nueva):
+            self.indice_busqueda.quitar(pid)
+            if nueva is not None: self.indice_busqueda.agregar(pid, nueva)
+        if anterior is None or nueva is None or self.indice_ubicaciones.cambio(anterior, nueva):
+            if anterior is not None: self.indice_ubicaciones.quitar(pid, anterior)
+            if nueva is not None: self.indice_ubicaciones.agregar(pid, nueva)
+        if anterior is None or nueva is None or self.indice_bandas.cambio(anterior, nueva):
+            self.indice_bandas.quitar(pid, anterior)
+            if nueva is not None: self.indice_bandas.agregar(pid, nueva)
+        if anterior is None or nueva is None or self.indice_orden.cambio(pid, anterior, nueva):
+            if anterior is not None: self.indice_orden.quitar(pid, anterior)
+            if nueva is not None: self.indice_orden.agregar(pid, nueva)
+
+    def copiar_inventario(self):
+        # Copia consistente para serializar fuera del hilo principal (se toma con el candado)
+        return {pid: dict(p) for pid, p in self.inventario.items()}
+
+    def obtener_estatus_hoy_texto(self, pieza, inicio_hoy=None):
+        ts = pieza.get('ult_ts')
+        if not ts or ts < (inicio_hoy or inicio_del_dia()): return "✅ Sin cambios hoy"
+        if pieza.get('ult_tipo') == "SALIDA":
+            return f"📤 SALIDA a las {fecha_movimiento(ts, '%H:%M')}"
+        else:
+            return f"📥 ENTRADA a las {fecha_movimiento(ts, '%H:%M')}"
 
     def salir_sistema(self):
         if self.verificar_bloqueo(): return
-        if messagebox.askyesno("Salir", "¿Deseas cerrar?"): self.root.destroy()
+        if messagebox.askyesno("Salir", "¿Deseas cerrar?"):
+            for progreso in self.reportes_activos: progreso.cancelado.set()
+            self.persistencia.detener()
+            self.root.destroy()
 
     def cambiar_orden(self, orden):
         if self.verificar_bloqueo(): return
@@ -1124,8 +3513,11 @@ class SistemaInventario:
 
         txt.insert(tk.END, "\n• Semáforo de Stock (NUEVO):\n", "h2")
         txt.insert(tk.END, "El sistema le avisará con colores cuando se acaben las piezas:\n", "normal")
-        txt.insert(tk.END, "   🔴 ROJO: Stock Crítico (Quedan 2 o menos).\n", "bullet")
-        txt.insert(tk.END, "   🟡 AMARILLO: Stock Bajo (Quedan 5 o menos).\n", "bullet")
+        txt.insert(tk.END, f"   🔴 ROJO: Stock Crítico (Quedan {STOCK_CRITICO} o menos).\n", "bullet")
+        txt.insert(tk.END, f"   🟡 AMARILLO: Stock Bajo (Quedan {STOCK_BAJO} o menos).\n", "bullet")
+        txt.insert(tk.END, "Cada pieza puede tener sus propios puntos en 'Punto Crítico / Bajo' (vacío = valores "
+                           "por defecto). Los botones 🔴 CRÍTICAS y 🟡 BAJAS muestran cuántas hay y, al "
+                           "presionarlos, filtran la tabla.\n", "normal")
 
         txt.insert(tk.END,
                    "\n⚠️ NOTA: El código de la herramienta debe ser único. El sistema no permitirá duplicados.\n",
@@ -1163,7 +3555,7 @@ class SistemaInventario:
                    "bullet")
         txt.insert(tk.END, "• Estatus Empleados:", "h2");
         txt.insert(tk.END,
-                   " Muestra una lista de quién debe material. Si está en ROJO, el empleado no ha devuelto la herramienta.\n",
+                   " Muestra todos los préstamos abiertos, sin importar el día en que se hicieron. Si está en ROJO, el empleado no ha devuelto la herramienta.\n",
                    "bullet")
         txt.insert(tk.END, "• Exportación:", "h2");
         txt.insert(tk.END, " Puede descargar todo el inventario en Excel, Word o PDF para inventarios físicos.\n",
@@ -1196,84 +3588,23 @@ class SistemaInventario:
 
     # --- NUEVA FUNCIONALIDAD: REPORTE EMPLEADOS (AGRUPADO) ---
     def ver_estatus_prestamos_empleados(self):
-        log = cargar_log_global()
-        hoy = datetime.datetime.now().strftime("%d/%m/%Y")
-
-        movimientos_hoy = [m for m in log if m['fecha'] == hoy]
-
-        if not movimientos_hoy:
-            return messagebox.showinfo("Reporte Empleados", "No hay movimientos registrados hoy.")
-
-        # Diccionario para agrupar por (Empleado, Codigo)
-        # Clave: (emp, cod) -> Valor: {nombre, sacados, devueltos}
-        reporte_agregado = {}
-
-        for m in movimientos_hoy:
-
-            # FILTRO ESTRICTO (SOLO PRÉSTAMOS Y DEVOLUCIONES)
-            if m['accion'] not in ["SALIDA", "ENTRADA"]:
-                continue
-
-            detalle = m['detalle']
-            codigo = m['codigo']
-            nombre = m['nombre']
-            accion = m['accion']
-
-            empleado = "Desconocido"
-
-            # LOGICA DE LIMPIEZA DE NOMBRE (Version v85.0)
-            try:
-                partes = detalle.split(" ")
-                # Buscar directamente el tag "Empleado:" y tomar el siguiente valor
-                if "Empleado:" in partes:
-                    idx = partes.index("Empleado:")
-                    if len(partes) > idx + 1:
-                        raw_emp = partes[idx + 1]
-                        # Limpiar si por error se guardó "Empleado:123" pegado
-                        empleado = raw_emp.replace("Empleado:", "").strip()
-
-                # Compatibilidad con formatos anteriores
-                elif "Préstamo" in detalle and "a" in partes:
-                    idx = partes.index("a")
-                    if len(partes) > idx + 1: empleado = partes[idx + 1]
-                elif "Devolución" in detalle and "de" in partes:
-                    idx = partes.index("de")
-                    if len(partes) > idx + 1: empleado = partes[idx + 1]
-            except:
-                continue
-
-            cantidad = 0
-            try:
-                if "(" in detalle and ")" in detalle:
-                    inicio = detalle.rfind("(") + 1
-                    fin = detalle.rfind(")")
-                    cant_str = detalle[inicio:fin]
-                    cantidad = int(cant_str.replace("+", "").replace("-", ""))
-                else:
-                    cantidad = 1
-            except:
-                cantidad = 1
+        # Se sirve directo del libro de préstamos: todos los abiertos, sin importar el día
+        abiertos = _libro_prestamos.abiertos()
 
-            key = (empleado, codigo)
-            if key not in reporte_agregado:
-                reporte_agregado[key] = {'nombre': nombre, 'sacados': 0, 'devueltos': 0}
-
-            if accion == "SALIDA":
-                reporte_agregado[key]['sacados'] += cantidad
-            elif accion == "ENTRADA":
-                reporte_agregado[key]['devueltos'] += cantidad
+        if not abiertos:
+            return messagebox.showinfo("Reporte Empleados", "No hay préstamos pendientes.")
 
         ventana = tk.Toplevel(self.root)
-        ventana.title(f"Estatus de Empleados - {hoy}")
-        ventana.geometry("1000x500")
+        ventana.title("Estatus de Empleados - Préstamos Abiertos")
+        ventana.geometry("1150x500")
         ventana.configure(bg=COLOR_FONDO_MAIN)
         ventana.grab_set()
 
-        lbl = tk.Label(ventana, text="CONTROL DE PRÉSTAMOS POR EMPLEADO (HOY)",
+        lbl = tk.Label(ventana, text="CONTROL DE PRÉSTAMOS POR EMPLEADO (ABIERTOS)",
                        font=("Segoe UI", 12, "bold"), bg=COLOR_FONDO_MAIN, fg=COLOR_TEXTO_OSCURO)
         lbl.pack(pady=10)
 
-        cols = ("Empleado", "Codigo", "Pieza", "Sacados", "Devueltos", "Pendiente", "Estatus")
+        cols = ("Empleado", "Codigo", "Pieza", "Sacados", "Devueltos", "Pendiente", "Desde", "Ultimo", "Estatus")
         tree = ttk.Treeview(ventana, columns=cols, show='headings')
 
         tree.heading("Empleado", text="Empleado")
@@ -1289,6 +3620,10 @@ class SistemaInventario:
         tree.column("Devueltos", width=70, anchor=tk.CENTER)
         tree.heading("Pendiente", text="Debe")
         tree.column("Pendiente", width=70, anchor=tk.CENTER)
+        tree.heading("Desde", text="Desde")
+        tree.column("Desde", width=110, anchor=tk.CENTER)
+        tree.heading("Ultimo", text="Último Mov.")
+        tree.column("Ultimo", width=110, anchor=tk.CENTER)
         tree.heading("Estatus", text="Estatus")
         tree.column("Estatus", width=150, anchor=tk.CENTER)
 
@@ -1296,41 +3631,38 @@ class SistemaInventario:
         tree.tag_configure('parcial', foreground='#d35400')  # Naranja
         tree.tag_configure('devuelto', foreground='green')
 
-        pendientes_count = 0
+        empleados_pendientes = set()
 
-        for (emp, cod), data in reporte_agregado.items():
-            sacados = data['sacados']
-            devueltos = data['devueltos']
-            pendiente = sacados - devueltos
+        for (emp, pid), saldo in abiertos:
+            sacados = saldo['sacados']
+            devueltos = saldo['devueltos']
+            pendiente = saldo['pendiente']
 
-            if pendiente == 0:
-                estatus_txt = "DEVUELTO TOTAL ✅"
-                tag = 'devuelto'
-            elif pendiente > 0 and devueltos > 0:
+            if pendiente > 0 and devueltos > 0:
                 estatus_txt = f"PARCIAL (Faltan {pendiente})"
                 tag = 'parcial'
-                pendientes_count += 1
-            elif pendiente == sacados:
+            elif pendiente > 0:
                 estatus_txt = "PENDIENTE ❌"
                 tag = 'pendiente'
-                pendientes_count += 1
             else:
                 estatus_txt = "SALDO A FAVOR"
                 tag = 'devuelto'
+            if pendiente > 0: empleados_pendientes.add(emp)
 
-            # SOLO PONEMOS EL NUMERO DEL EMPLEADO (SIN TEXTO EXTRA)
-            emp_str = str(emp).replace("Empleado:", "").strip()
+            pieza = self.inventario.get(pid, {})
+            desde = fecha_movimiento(saldo['primer_ts'], "%d/%m/%Y %H:%M") if saldo['primer_ts'] else "-"
+            ultimo = fecha_movimiento(saldo['ult_ts'], "%d/%m/%Y %H:%M") if saldo['ult_ts'] else "-"
 
             tree.insert("", tk.END, values=(
-                emp_str, cod, data['nombre'],
-                sacados, devueltos, pendiente, estatus_txt
+                emp, pieza.get('codigo', ''), pieza.get('nombre', f"(ID {pid})"),
+                sacados, devueltos, pendiente, desde, ultimo, estatus_txt
             ), tags=(tag,))
 
         tree.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
 
-        resumen_txt = f"Registros Activos: {len(reporte_agregado)} | Empleados con Pendientes: {pendientes_count}"
+        resumen_txt = f"Préstamos Abiertos: {len(abiertos)} | Empleados con Pendientes: {len(empleados_pendientes)}"
         lbl_res = tk.Label(ventana, text=resumen_txt, font=("Segoe UI", 10, "bold"),
-                           bg="#ecf0f1", fg="#c0392b" if pendientes_count > 0 else "#27ae60")
+                           bg="#ecf0f1", fg="#c0392b" if empleados_pendientes else "#27ae60")
         lbl_res.pack(pady=10)
 
         tk.Button(ventana, text="Cerrar", command=ventana.destroy, bg=COLOR_BTN_SALIR, fg="white").pack(pady=5)
@@ -1480,9 +3812,8 @@ class SistemaInventario:
                   cursor="hand2", image=self.pixel, compound="center", height=25, width=100).pack(pady=15)
 
     def ver_reporte_pantalla(self):
-        log = cargar_log_global()
         hoy = datetime.datetime.now().strftime("%d/%m/%Y")
-        movimientos_hoy = [m for m in log if m['fecha'] == hoy]
+        movimientos_hoy = eventos_del_dia(hoy)
 
         if not movimientos_hoy: return messagebox.showinfo("Aviso", "No hay movimientos hoy.")
 
@@ -1539,13 +3870,68 @@ class SistemaInventario:
                                   width=120)
         btn_continuar.pack(pady=10)
 
+    # --- REPORTES EN SEGUNDO PLANO ---
+    # Los datos se toman aquí (hilo de Tk) como una copia inmutable; el documento se arma en el pool
+    # de reportes y esta ventana muestra el avance consultando con root.after. Cancelar detiene el
+    # trabajo en la siguiente fila; el archivo solo se guarda al final, así que no queda a medias.
+    def ejecutar_reporte(self, titulo, trabajo, ruta, titulo_listo, mensaje_listo):
+        progreso = ProgresoReporte()
+        futuro = pool_reportes().submit(trabajo, progreso)
+        self.reportes_activos.add(progreso)
+
+        ventana = tk.Toplevel(self.root)
+        ventana.title(f"Generando {titulo}")
+        ventana.geometry("380x140")
+        ventana.resizable(False, False)
+        ventana.configure(bg=COLOR_FONDO_MAIN)
+        ventana.transient(self.root)
+
+        lbl = tk.Label(ventana, text=f"⏳ Generando {titulo}...", font=("Segoe UI", 10, "bold"),
+                       bg=COLOR_FONDO_MAIN, fg=COLOR_TEXTO_OSCURO)
+        lbl.pack(pady=(15, 5))
+        barra = ttk.Progressbar(ventana, length=320, mode="determinate")
+        barra.pack(pady=5)
+
+        def cancelar():
+            progreso.cancelado.set()
+            futuro.cancel()  # Si todavía no empezó, ya no se ejecuta
+
+        tk.Button(ventana, text="Cancelar", command=cancelar, bg=COLOR_BTN_SALIR, fg="white",
+                  relief="flat", cursor="hand2").pack(pady=5)
+        ventana.protocol("WM_DELETE_WINDOW", cancelar)
+
+        def revisar():
+            if not futuro.done():
+                if progreso.total:
+                    barra.config(maximum=progreso.total, value=progreso.hecho)
+                    lbl.config(text=f"⏳ Generando {titulo}... {progreso.hecho} de {progreso.total}")
+                return self.root.after(100, revisar)
+            self.reportes_activos.discard(progreso)
+            if ventana.winfo_exists(): ventana.destroy()
+            try:
+                futuro.result()
+            except (ReporteCancelado, concurrent.futures.CancelledError):
+                return messagebox.showinfo("Cancelado", f"Se canceló el reporte ({titulo}).")
+            except Exception as e:
+                return messagebox.showerror("Error", str(e))
+            if messagebox.askyesno(titulo_listo, mensaje_listo): os.startfile(ruta)
+
+        self.root.after(100, revisar)
+
+    def filas_inventario_reporte(self):
+        # Copia inmutable para los reportes generales, ordenada por ID
+        inicio_hoy = inicio_del_dia()
+        return tuple((pid, d.get('codigo', ''), d['nombre'], d['cantidad'], d['gabinete'],
+                      self.obtener_estatus_hoy_texto(d, inicio_hoy), d['descripcion'])
+                     for pid, d in ((pid, self.inventario[pid]) for pid in self.indice_orden.ordenar("id", self.inventario)))
+
     def generar_reporte_dia(self, formato):
-        log = cargar_log_global()
         hoy = datetime.datetime.now().strftime("%d/%m/%Y")
-        movimientos_hoy = [m for m in log if m['fecha'] == hoy]
+        movimientos_hoy = eventos_del_dia(hoy)
 
         if not movimientos_hoy: return messagebox.showinfo("Reporte Diario", "No hay actividad registrada hoy.")
         movimientos_hoy.sort(key=lambda x: x['hora'])
+        movimientos_hoy = tuple(movimientos_hoy)
 
         resumen = {"CREACIÓN": 0, "ELIMINACIÓN": 0, "SALIDA": 0, "ENTRADA": 0}
         for m in movimientos_hoy:
@@ -1557,121 +3943,138 @@ class SistemaInventario:
             ruta = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")],
                                                 initialfile=f"{nombre_archivo}.xlsx")
             if not ruta: return
-            wb = openpyxl.Workbook();
-            ws = wb.active;
-            ws.title = "Reporte Diario"
-            ws.append([f"REPORTE DE ACTIVIDAD - {hoy}"])
-            ws.append([])
-            ws.append(["--- RESUMEN ESTADÍSTICO ---"])
-            ws.append(["Acción", "Total Eventos"])
-            ws.append(["✅ Piezas Creadas", resumen["CREACIÓN"]])
-            ws.append(["🗑️ Piezas Eliminadas", resumen["ELIMINACIÓN"]])
-            ws.append(["📤 Préstamos (Salidas)", resumen["SALIDA"]])
-            ws.append(["📥 Devoluciones (Entradas)", resumen["ENTRADA"]])
-            ws.append([])
-            ws.append(["HORA", "ACCIÓN", "CÓDIGO", "PIEZA", "DETALLES"])
-            for m in movimientos_hoy:
-                ws.append([m['hora'], m['accion'], m['codigo'], m['nombre'], m['detalle']])
-            wb.save(ruta)
-            if messagebox.askyesno("Listo", "¿Abrir reporte?"): os.startfile(ruta)
+
+            def trabajo(progreso):
+                progreso.iniciar(len(movimientos_hoy))
+                wb = openpyxl.Workbook();
+                ws = wb.active;
+                ws.title = "Reporte Diario"
+                ws.append([f"REPORTE DE ACTIVIDAD - {hoy}"])
+                ws.append([])
+                ws.append(["--- RESUMEN ESTADÍSTICO ---"])
+                ws.append(["Acción", "Total Eventos"])
+                ws.append(["✅ Piezas Creadas", resumen["CREACIÓN"]])
+                ws.append(["🗑️ Piezas Eliminadas", resumen["ELIMINACIÓN"]])
+                ws.append(["📤 Préstamos (Salidas)", resumen["SALIDA"]])
+                ws.append(["📥 Devoluciones (Entradas)", resumen["ENTRADA"]])
+                ws.append([])
+                ws.append(["HORA", "ACCIÓN", "CÓDIGO", "PIEZA", "DETALLES"])
+                for m in movimientos_hoy:
+                    progreso.avanzar()
+                    ws.append([m['hora'], m['accion'], m['codigo'], m['nombre'], m['detalle']])
+                wb.save(ruta)
+
+            self.ejecutar_reporte("Reporte Diario (Excel)", trabajo, ruta, "Listo", "¿Abrir reporte?")
 
         else:  # Word
             ruta = filedialog.asksaveasfilename(defaultextension=".docx", filetypes=[("Word", "*.docx")],
                                                 initialfile=f"{nombre_archivo}.docx")
             if not ruta: return
-            doc = Document()
-            doc.add_heading(f"REPORTE DIARIO DE ACTIVIDAD", 0)
-            doc.add_paragraph(f"Fecha: {hoy}")
-            doc.add_heading("1. Resumen Estadístico", level=2)
-            tr = doc.add_table(rows=1, cols=2);
-            tr.style = 'Table Grid'
-            tr.rows[0].cells[0].text = "Acción";
-            tr.rows[0].cells[1].text = "Cantidad Total"
-            tr.add_row().cells[0].text = "✅ Piezas Creadas";
-            tr.rows[1].cells[1].text = str(resumen["CREACIÓN"])
-            doc.add_paragraph("")
-            doc.add_heading("2. Detalle Cronológico", level=2)
-            t = doc.add_table(rows=1, cols=5);
-            t.style = 'Table Grid'
-            h = t.rows[0].cells;
-            h[0].text = "HORA";
-            h[1].text = "ACCIÓN";
-            h[2].text = "CÓDIGO";
-            h[3].text = "PIEZA";
-            h[4].text = "DETALLES"
-            for m in movimientos_hoy:
-                r = t.add_row().cells
-                r[0].text = m['hora'];
-                r[1].text = m['accion'];
-                r[2].text = str(m['codigo']);
-                r[3].text = m['nombre'];
-                r[4].text = m['detalle']
-            doc.save(ruta)
-            if messagebox.askyesno("Listo", "¿Abrir reporte?"): os.startfile(ruta)
+
+            def trabajo(progreso):
+                progreso.iniciar(len(movimientos_hoy))
+                doc = Document()
+                doc.add_heading(f"REPORTE DIARIO DE ACTIVIDAD", 0)
+                doc.add_paragraph(f"Fecha: {hoy}")
+                doc.add_heading("1. Resumen Estadístico", level=2)
+                tr = doc.add_table(rows=1, cols=2);
+                tr.style = 'Table Grid'
+                tr.rows[0].cells[0].text = "Acción";
+                tr.rows[0].cells[1].text = "Cantidad Total"
+                tr.add_row().cells[0].text = "✅ Piezas Creadas";
+                tr.rows[1].cells[1].text = str(resumen["CREACIÓN"])
+                doc.add_paragraph("")
+                doc.add_heading("2. Detalle Cronológico", level=2)
+                t = doc.add_table(rows=1, cols=5);
+                t.style = 'Table Grid'
+                h = t.rows[0].cells;
+                h[0].text = "HORA";
+                h[1].text = "ACCIÓN";
+                h[2].text = "CÓDIGO";
+                h[3].text = "PIEZA";
+                h[4].text = "DETALLES"
+                for m in movimientos_hoy:
+                    progreso.avanzar()
+                    r = t.add_row().cells
+                    r[0].text = m['hora'];
+                    r[1].text = m['accion'];
+                    r[2].text = str(m['codigo']);
+                    r[3].text = m['nombre'];
+                    r[4].text = m['detalle']
+                doc.save(ruta)
+
+            self.ejecutar_reporte("Reporte Diario (Word)", trabajo, ruta, "Listo", "¿Abrir reporte?")
 
     def generar_reporte_dia_pdf(self):
-        log = cargar_log_global()
         hoy = datetime.datetime.now().strftime("%d/%m/%Y")
-        movimientos_hoy = [m for m in log if m['fecha'] == hoy]
+        movimientos_hoy = eventos_del_dia(hoy)
         if not movimientos_hoy: return messagebox.showinfo("Aviso", "No hay movimientos hoy.")
 
         movimientos_hoy.sort(key=lambda x: x['hora'])
+        movimientos_hoy = tuple(movimientos_hoy)
 
         nombre_archivo = f"Reporte_Diario_{hoy.replace('/', '-')}"
         ruta = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF", "*.pdf")],
                                             initialfile=f"{nombre_archivo}.pdf")
         if not ruta: return
 
-        pdf = PDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=10)
-        pdf.cell(0, 10, f"Fecha del Reporte: {hoy}", 0, 1)
-        pdf.ln(5)
-
-        pdf.set_font("Arial", "B", 9)
-        pdf.cell(20, 8, "Hora", 1)
-        pdf.cell(25, 8, "Accion", 1)
-        pdf.cell(20, 8, "Codigo", 1)
-        pdf.cell(50, 8, "Pieza", 1)
-        pdf.cell(75, 8, "Detalle", 1)
-        pdf.ln()
-
-        pdf.set_font("Arial", size=8)
-        for m in movimientos_hoy:
-            pdf.cell(20, 8, pdf.clean_text(m['hora']), 1)
-            pdf.cell(25, 8, pdf.clean_text(m['accion']), 1)
-            pdf.cell(20, 8, pdf.clean_text(str(m['codigo'])), 1)
-            pdf.cell(50, 8, pdf.clean_text(str(m['nombre'])[:25]), 1)
-            pdf.cell(75, 8, pdf.clean_text(str(m['detalle'])[:40]), 1)
+        def trabajo(progreso):
+            progreso.iniciar(len(movimientos_hoy))
+            pdf = PDF()
+            pdf.add_page()
+            pdf.set_font("Arial", size=10)
+            pdf.cell(0, 10, f"Fecha del Reporte: {hoy}", 0, 1)
+            pdf.ln(5)
+
+            pdf.set_font("Arial", "B", 9)
+            pdf.cell(20, 8, "Hora", 1)
+            pdf.cell(25, 8, "Accion", 1)
+            pdf.cell(20, 8, "Codigo", 1)
+            pdf.cell(50, 8, "Pieza", 1)
+            pdf.cell(75, 8, "Detalle", 1)
             pdf.ln()
 
-        pdf.output(ruta)
-        if messagebox.askyesno("Listo", "¿Abrir PDF?"): os.startfile(ruta)
+            pdf.set_font("Arial", size=8)
+            for m in movimientos_hoy:
+                progreso.avanzar()
+                pdf.cell(20, 8, pdf.clean_text(m['hora']), 1)
+                pdf.cell(25, 8, pdf.clean_text(m['accion']), 1)
+                pdf.cell(20, 8, pdf.clean_text(str(m['codigo'])), 1)
+                pdf.cell(50, 8, pdf.clean_text(str(m['nombre'])[:25]), 1)
+                pdf.cell(75, 8, pdf.clean_text(str(m['detalle'])[:40]), 1)
+                pdf.ln()
+
+            pdf.output(ruta)
+
+        self.ejecutar_reporte("Reporte Diario (PDF)", trabajo, ruta, "Listo", "¿Abrir PDF?")
 
     def generar_excel_general(self):
         ruta = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")],
                                             initialfile="Inventario_Completo.xlsx")
         if not ruta: return
-        try:
+        filas = self.filas_inventario_reporte()
+
+        def trabajo(progreso):
+            progreso.iniciar(len(filas))
             wb = openpyxl.Workbook();
             ws = wb.active;
             ws.title = "Inventario"
             ws.append(["ID", "Código", "Nombre", "Cantidad", "Ubicación", "Estatus Hoy", "Descripción"])
-            for pid, d in sorted(self.inventario.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0):
-                estatus = self.obtener_estatus_hoy_texto(d.get('historial', []))
-                ws.append(
-                    [int(pid) if pid.isdigit() else pid, d.get('codigo', ''), d['nombre'], d['cantidad'], d['gabinete'],
-                     estatus, d['descripcion']])
+            for pid, codigo, nombre, cantidad, gabinete, estatus, descripcion in filas:
+                progreso.avanzar()
+                ws.append([int(pid) if pid.isdigit() else pid, codigo, nombre, cantidad, gabinete, estatus, descripcion])
             wb.save(ruta)
-            if messagebox.askyesno("Éxito", "Reporte generado.\n¿Abrir?"): os.startfile(ruta)
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+
+        self.ejecutar_reporte("Inventario (Excel)", trabajo, ruta, "Éxito", "Reporte generado.\n¿Abrir?")
 
     def generar_word_general(self):
         ruta = filedialog.asksaveasfilename(defaultextension=".docx", filetypes=[("Word", "*.docx")],
                                             initialfile="Inventario_Completo.docx")
         if not ruta: return
-        try:
+        filas = self.filas_inventario_reporte()
+
+        def trabajo(progreso):
+            progreso.iniciar(len(filas))
             doc = Document();
             doc.add_heading('Inventario', 0)
             t = doc.add_table(rows=1, cols=7);
@@ -1684,56 +4087,63 @@ class SistemaInventario:
             h[4].text = 'UBIC';
             h[5].text = 'EST';
             h[6].text = 'DESC'
-            for pid, d in sorted(self.inventario.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0):
+            for pid, codigo, nombre, cantidad, gabinete, estatus, descripcion in filas:
+                progreso.avanzar()
                 r = t.add_row().cells;
-                est = self.obtener_estatus_hoy_texto(d.get('historial', []))
                 r[0].text = str(pid);
-                r[1].text = str(d.get('codigo', ''));
-                r[2].text = str(d['nombre']);
-                r[3].text = str(d['cantidad'])
-                r[4].text = str(d['gabinete']);
-                r[5].text = est;
-                r[6].text = str(d['descripcion'])
+                r[1].text = str(codigo);
+                r[2].text = str(nombre);
+                r[3].text = str(cantidad)
+                r[4].text = str(gabinete);
+                r[5].text = estatus;
+                r[6].text = str(descripcion)
             doc.save(ruta);
-            if messagebox.askyesno("Éxito", "Reporte generado.\n¿Abrir?"): os.startfile(ruta)
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+
+        self.ejecutar_reporte("Inventario (Word)", trabajo, ruta, "Éxito", "Reporte generado.\n¿Abrir?")
 
     def generar_pdf_general(self):
         ruta = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF", "*.pdf")],
                                             initialfile="Inventario_Completo.pdf")
         if not ruta: return
-
-        pdf = PDF()
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 9)
-        pdf.cell(10, 8, "ID", 1)
-        pdf.cell(20, 8, "Cod", 1)
-        pdf.cell(60, 8, "Nombre", 1)
-        pdf.cell(15, 8, "Cant", 1)
-        pdf.cell(20, 8, "Ubic", 1)
-        pdf.cell(65, 8, "Desc", 1)
-        pdf.ln()
-
-        pdf.set_font("Arial", size=8)
-        for pid, d in sorted(self.inventario.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0):
-            pdf.cell(10, 8, pdf.clean_text(str(pid)), 1)
-            pdf.cell(20, 8, pdf.clean_text(str(d.get('codigo', ''))), 1)
-            pdf.cell(60, 8, pdf.clean_text(str(d['nombre'])[:30]), 1)
-            pdf.cell(15, 8, pdf.clean_text(str(d['cantidad'])), 1)
-            pdf.cell(20, 8, pdf.clean_text(str(d['gabinete'])), 1)
-            pdf.cell(65, 8, pdf.clean_text(str(d['descripcion'])[:35]), 1)
+        filas = self.filas_inventario_reporte()
+
+        def trabajo(progreso):
+            progreso.iniciar(len(filas))
+            pdf = PDF()
+            pdf.add_page()
+            pdf.set_font("Arial", "B", 9)
+            pdf.cell(10, 8, "ID", 1)
+            pdf.cell(20, 8, "Cod", 1)
+            pdf.cell(60, 8, "Nombre", 1)
+            pdf.cell(15, 8, "Cant", 1)
+            pdf.cell(20, 8, "Ubic", 1)
+            pdf.cell(65, 8, "Desc", 1)
             pdf.ln()
 
-        pdf.output(ruta)
-        if messagebox.askyesno("Éxito", "PDF generado.\n¿Abrir?"): os.startfile(ruta)
+            pdf.set_font("Arial", size=8)
+            for pid, codigo, nombre, cantidad, gabinete, estatus, descripcion in filas:
+                progreso.avanzar()
+                pdf.cell(10, 8, pdf.clean_text(str(pid)), 1)
+                pdf.cell(20, 8, pdf.clean_text(str(codigo)), 1)
+                pdf.cell(60, 8, pdf.clean_text(str(nombre)[:30]), 1)
+                pdf.cell(15, 8, pdf.clean_text(str(cantidad)), 1)
+                pdf.cell(20, 8, pdf.clean_text(str(gabinete)), 1)
+                pdf.cell(65, 8, pdf.clean_text(str(descripcion)[:35]), 1)
+                pdf.ln()
+
+            pdf.output(ruta)
+
+        self.ejecutar_reporte("Inventario (PDF)", trabajo, ruta, "Éxito", "PDF generado.\n¿Abrir?")
 
     def generar_excel_individual(self, pid):
-        d = self.inventario[pid]
+        d = dict(self.inventario[pid])
         ruta = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")],
                                             initialfile=f"Ficha_{d['nombre']}.xlsx")
         if not ruta: return
-        try:
+        historial = tuple(historial_pieza(pid))
+
+        def trabajo(progreso):
+            progreso.iniciar(len(historial))
             wb = openpyxl.Workbook();
             ws = wb.active;
             ws.title = "Ficha Técnica"
@@ -1745,18 +4155,22 @@ class SistemaInventario:
             ws.append(["DESCRIPCIÓN:", d['descripcion']]);
             ws.append([]);
             ws.append(["HISTORIAL"])
-            for linea in d.get('historial', []): ws.append([linea])
+            for mov in historial:
+                progreso.avanzar()
+                ws.append([texto_movimiento(mov)])
             wb.save(ruta)
-            if messagebox.askyesno("Éxito", "Ficha guardada.\n¿Abrir?"): os.startfile(ruta)
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+
+        self.ejecutar_reporte("Ficha (Excel)", trabajo, ruta, "Éxito", "Ficha guardada.\n¿Abrir?")
 
     def generar_word_individual(self, pid):
-        d = self.inventario[pid]
+        d = dict(self.inventario[pid])
         ruta = filedialog.asksaveasfilename(defaultextension=".docx", filetypes=[("Word", "*.docx")],
                                             initialfile=f"Ficha_{d['nombre']}.docx")
         if not ruta: return
-        try:
+        historial = tuple(historial_pieza(pid))
+
+        def trabajo(progreso):
+            progreso.iniciar(len(historial))
             doc = Document();
             doc.add_heading(f"Ficha: {d['nombre']}", 0)
             doc.add_paragraph(
@@ -1764,67 +4178,149 @@ class SistemaInventario:
             doc.add_heading("Descripción", 2);
             doc.add_paragraph(d['descripcion'])
             doc.add_heading("Historial", 2)
-            if d.get('historial', []):
+            if historial:
                 t = doc.add_table(rows=1, cols=1);
                 t.style = 'Table Grid'
-                for l in d['historial']: t.add_row().cells[0].text = l
+                for mov in historial:
+                    progreso.avanzar()
+                    t.add_row().cells[0].text = texto_movimiento(mov)
             else:
                 doc.add_paragraph("Sin movimientos.")
             doc.save(ruta)
-            if messagebox.askyesno("Éxito", "Ficha guardada.\n¿Abrir?"): os.startfile(ruta)
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+
+        self.ejecutar_reporte("Ficha (Word)", trabajo, ruta, "Éxito", "Ficha guardada.\n¿Abrir?")
 
     def generar_pdf_individual(self, pid):
-        d = self.inventario[pid]
+        d = dict(self.inventario[pid])
         ruta = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF", "*.pdf")],
                                             initialfile=f"Ficha_{d['nombre']}.pdf")
         if not ruta: return
-
-        pdf = PDF()
-        pdf.add_page()
-
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, pdf.clean_text(f"FICHA TECNICA: {d['nombre']}"), 0, 1)
-        pdf.ln(5)
-
-        pdf.set_font("Arial", "B", 10)
-        pdf.cell(30, 8, "CODIGO:", 0)
-        pdf.set_font("Arial", "", 10)
-        pdf.cell(50, 8, pdf.clean_text(str(d.get('codigo', ''))), 0)
-
-        pdf.set_font("Arial", "B", 10)
-        pdf.cell(30, 8, "UBICACION:", 0)
-        pdf.set_font("Arial", "", 10)
-        pdf.cell(50, 8, pdf.clean_text(d['gabinete']), 0, 1)
-
-        pdf.set_font("Arial", "B", 10)
-        pdf.cell(30, 8, "STOCK ACTUAL:", 0)
-        pdf.set_font("Arial", "", 10)
-        pdf.cell(50, 8, pdf.clean_text(str(d['cantidad'])), 0, 1)
-        pdf.ln(5)
-
-        pdf.set_font("Arial", "B", 10)
-        pdf.cell(0, 8, "DESCRIPCION:", 0, 1)
-        pdf.set_font("Arial", "", 10)
-        pdf.multi_cell(0, 5, pdf.clean_text(d['descripcion']))
-        pdf.ln(10)
-
-        pdf.set_font("Arial", "B", 10)
-        pdf.cell(0, 8, "HISTORIAL DE MOVIMIENTOS:", 0, 1)
-        pdf.set_font("Arial", size=8)
-
-        if d.get('historial', []):
-            for line in d['historial']:
-                pdf.cell(0, 6, pdf.clean_text(line), 1, 1)
-        else:
-            pdf.cell(0, 6, "Sin movimientos registrados", 1, 1)
-
-        pdf.output(ruta)
-        if messagebox.askyesno("Exito", "PDF generado.\n¿Abrir?"): os.startfile(ruta)
+        historial = tuple(historial_pieza(pid))
+
+        def trabajo(progreso):
+            progreso.iniciar(len(historial))
+            pdf = PDF()
+            pdf.add_page()
+
+            pdf.set_font("Arial", "B", 14)
+            pdf.cell(0, 10, pdf.clean_text(f"FICHA TECNICA: {d['nombre']}"), 0, 1)
+            pdf.ln(5)
+
+            pdf.set_font("Arial", "B", 10)
+            pdf.cell(30, 8, "CODIGO:", 0)
+            pdf.set_font("Arial", "", 10)
+            pdf.cell(50, 8, pdf.clean_text(str(d.get('codigo', ''))), 0)
+
+            pdf.set_font("Arial", "B", 10)
+            pdf.cell(30, 8, "UBICACION:", 0)
+            pdf.set_font("Arial", "", 10)
+            pdf.cell(50, 8, pdf.clean_text(d['gabinete']), 0, 1)
+
+            pdf.set_font("Arial", "B", 10)
+            pdf.cell(30, 8, "STOCK ACTUAL:", 0)
+            pdf.set_font("Arial", "", 10)
+            pdf.cell(50, 8, pdf.clean_text(str(d['cantidad'])), 0, 1)
+            pdf.ln(5)
+
+            pdf.set_font("Arial", "B", 10)
+            pdf.cell(0, 8, "DESCRIPCION:", 0, 1)
+            pdf.set_font("Arial", "", 10)
+            pdf.multi_cell(0, 5, pdf.clean_text(d['descripcion']))
+            pdf.ln(10)
+
+            pdf.set_font("Arial", "B", 10)
+            pdf.cell(0, 8, "HISTORIAL DE MOVIMIENTOS:", 0, 1)
+            pdf.set_font("Arial", size=8)
+
+            if historial:
+                for mov in historial:
+                    progreso.avanzar()
+                    pdf.cell(0, 6, pdf.clean_text(texto_movimiento(mov)), 1, 1)
+            else:
+                pdf.cell(0, 6, "Sin movimientos registrados", 1, 1)
+
+            pdf.output(ruta)
+
+        self.ejecutar_reporte("Ficha (PDF)", trabajo, ruta, "Exito", "PDF generado.\n¿Abrir?")
+
+
+# --- BENCHMARK DE SNAPSHOTS ---
+# Uso: python "Sistema de Inventario (Almacen).py" --benchmark-snapshot
+def benchmark_snapshot(tamanos=(10_000, 100_000, 1_000_000)):
+    import tempfile
+    carpeta = tempfile.mkdtemp()
+    ruta_json = os.path.join(carpeta, "bench.json")
+    ruta_bin = os.path.join(carpeta, "bench.snap")
+    print(f"{'Piezas':>10} | {'JSON escribir':>13} | {'JSON leer':>9} | {'BIN escribir':>12} | {'BIN leer':>8} | "
+          f"{'MB JSON':>7} | {'MB BIN':>6}")
+    for n in tamanos:
+        inventario = {str(i): {"codigo": str(10000 + i), "nombre": f"Pieza de prueba {i}", "cantidad": i % 50,
+                               "gabinete": f"G{i % 40}", "descripcion": "Herramienta de uso general",
+                               "ult_ts": 1767821400, "ult_tipo": "SALIDA"}
+                      for i in range(n)}
+        t = time.perf_counter()
+        with open(ruta_json, "w", encoding="utf-8") as f:
+            json.dump(inventario, f, indent=4)
+        t_json_w = time.perf_counter() - t
+        t = time.perf_counter()
+        with open(ruta_bin, "wb") as f:
+            marshal.dump((FORMATO_SNAPSHOT, inventario), f)
+        t_bin_w = time.perf_counter() - t
+        del inventario
+
+        with sin_recolector():
+            t = time.perf_counter()
+            with open(ruta_json, "r", encoding="utf-8") as f:
+                json.load(f)
+            t_json_r = time.perf_counter() - t
+            t = time.perf_counter()
+            with open(ruta_bin, "rb") as f:
+                marshal.loads(f.read())
+            t_bin_r = time.perf_counter() - t
+
+        print(f"{n:>10} | {t_json_w:>12.3f}s | {t_json_r:>8.3f}s | {t_bin_w:>11.3f}s | {t_bin_r:>7.3f}s | "
+              f"{os.path.getsize(ruta_json) / 1e6:>7.1f} | {os.path.getsize(ruta_bin) / 1e6:>6.1f}")
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+
+# --- BENCHMARK DE BÚSQUEDA ---
+# Uso: python "Sistema de Inventario (Almacen).py" --benchmark-busqueda
+def benchmark_busqueda(tamanos=(10_000, 100_000, 1_000_000), repeticiones=5):
+    terminos = ("1234", "prueba 777", "taladro", "zzz", "al")
+    print(f"{'Piezas':>10} | {'Construir':>9} | {'Término':>11} | {'Recorrido':>10} | {'Índice':>10} | {'Result.':>7}")
+    for n in tamanos:
+        inventario = {str(i): {"codigo": str(10000 + i), "nombre": f"Pieza de prueba {i}", "cantidad": i % 50,
+                               "gabinete": f"G{i % 40}",
+                               "descripcion": "Taladro percutor" if i % 1000 == 0 else "Herramienta de uso general"}
+                      for i in range(n)}
+        t = time.perf_counter()
+        indice = IndiceNgramas(inventario)
+        t_construir = time.perf_counter() - t
+        for termino in terminos:
+            # Recorrido lineal equivalente al que hacía el buscador antes del índice
+            t = time.perf_counter()
+            for _ in range(repeticiones):
+                lineal = [pid for pid, d in inventario.items()
+                          if termino in str(d.get('codigo', '')).lower() or termino in str(d['nombre']).lower()
+                          or termino in str(d['descripcion']).lower()]
+            t_lineal = (time.perf_counter() - t) / repeticiones
+            t = time.perf_counter()
+            for _ in range(repeticiones):
+                resultado = indice.buscar(termino)
+            t_indice = (time.perf_counter() - t) / repeticiones
+            assert sorted(lineal, key=clave_id) == resultado
+            print(f"{n:>10} | {t_construir:>8.2f}s | {termino:>11} | {t_lineal * 1000:>8.2f}ms | "
+                  f"{t_indice * 1000:>8.2f}ms | {len(resultado):>7}")
+        del indice, inventario
 
 
 if __name__ == "__main__":
+    if "--benchmark-snapshot" in sys.argv:
+        benchmark_snapshot()
+        sys.exit()
+    if "--benchmark-busqueda" in sys.argv:
+        benchmark_busqueda()
+        sys.exit()
     root = tk.Tk();
     app = SistemaInventario(root);
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import importlib.util
+import os
+import random
+
+import pytest
+
+RUTA_PROGRAMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "Sistema de Inventario (Almacen).py")
+
+
+def cargar_programa():
+    # El nombre del archivo tiene espacios y paréntesis: se carga por ruta
+    spec = importlib.util.spec_from_file_location("sistema_inventario", RUTA_PROGRAMA)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+programa = cargar_programa()
+
+
+class AvisosRegistrados:
+    # Reemplaza a messagebox: sin ventana, cada aviso queda anotado como (tipo, título, mensaje)
+    def __init__(self):
+        self.avisos = []
+
+    def __getattr__(self, tipo):
+        def avisar(*args, **kwargs):
+            self.avisos.append((tipo,) + args)
+            return True
+        return avisar
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # El programa guarda todo junto al script: cada prueba trabaja en su propia carpeta y con
+    # los cachés del módulo vacíos
+    carpeta = str(tmp_path)
+    for nombre, valor in list(vars(programa).items()):
+        if nombre.isupper() and isinstance(valor, str) and valor.startswith(programa.CARPETA_ACTUAL + os.sep):
+            monkeypatch.setattr(programa, nombre, carpeta + valor[len(programa.CARPETA_ACTUAL):])
+    monkeypatch.setattr(programa, "CARPETA_ACTUAL", carpeta)
+    monkeypatch.setattr(programa, "MODO_ALMACENAMIENTO", "json")
+    monkeypatch.setattr(programa, "messagebox", AvisosRegistrados())
+    monkeypatch.setattr(programa, "_cache_historial", programa.CacheHistorial())
+    monkeypatch.setattr(programa, "_libro_prestamos", programa.LibroPrestamos())
+    monkeypatch.setattr(programa, "_indices_log", {})
+    monkeypatch.setattr(programa, "_almacen_sqlite", None)
+    yield programa
+    if programa._almacen_sqlite is not None: programa._almacen_sqlite.conexion.close()
+
+
+def pieza(numero, **campos):
+    datos = {"codigo": f"C-{numero}", "nombre": f"Pieza {numero}", "cantidad": numero,
+             "gabinete": f"G{numero % 4}", "descripcion": ""}
+    datos.update(campos)
+    return datos
+
+
+PALABRAS = ["llave", "Allén", "tornillo", "perno", "tuerca", "broca", "disco", "lija", "pinza", "TALADRO"]
+
+
+def inventario_aleatorio(semilla, cantidad):
+    azar = random.Random(semilla)
+    return {str(i): pieza(i, nombre=f"{azar.choice(PALABRAS)} {i}", descripcion=" ".join(azar.choices(PALABRAS, k=2)),
+                          ult_ts=azar.randint(0, 9)) for i in range(1, cantidad + 1)}
+
+
+def editar_al_azar(semilla, inventario, pasos, al_cambiar):
+    # Altas, bajas y ediciones como las hace la ventana: al_cambiar(pid, anterior, nueva) recibe
+    # None como anterior en un alta y como nueva en una baja
+    azar = random.Random(semilla)
+    siguiente = max(map(int, inventario), default=0) + 1
+    for _ in range(pasos):
+        accion = azar.random()
+        if accion < 0.3 or not inventario:
+            pid, siguiente = str(siguiente), siguiente + 1
+            anterior = None
+            inventario[pid] = pieza(azar.randint(1, 50), nombre=azar.choice(PALABRAS), ult_ts=azar.randint(0, 9))
+        elif accion < 0.5:
+            pid = azar.choice(sorted(inventario))
+            anterior = inventario.pop(pid)
+        else:
+            pid = azar.choice(sorted(inventario))
+            anterior = inventario[pid]
+            inventario[pid] = dict(anterior, cantidad=azar.randint(0, 50), nombre=azar.choice(PALABRAS),
+                                   descripcion=azar.choice(PALABRAS))
+        al_cambiar(pid, anterior, inventario.get(pid))
+
+
+# Métodos que solo redibujan widgets
+VISTA = ("refrescar_tabla", "actualizar_tabla", "limpiar_campos_visual", "actualizar_botones_sidebar")
+
+
+@pytest.fixture
+def ventana(app):
+    # Instancias de la ventana sin Tk: solo el estado que usa la lógica de inventario. El hilo de
+    # guardado no escribe durante la prueba (ventana de una hora) y se detiene al final.
+    creadas = []
+
+    def crear(inventario):
+        sistema = app.SistemaInventario.__new__(app.SistemaInventario)
+        sistema.inventario = inventario
+        sistema.persistencia = app.PersistenciaAsincrona(sistema.copiar_inventario, ventana=3600)
+        for nombre in VISTA:
+            setattr(sistema, nombre, lambda *args, **kwargs: None)
+        sistema.cambios_tabla = {}
+        sistema.contador_ids = app.ContadorIds(inventario)
+        sistema.reconstruir_indices()
+        creadas.append(sistema)
+        return sistema
+    yield crear
+    for sistema in creadas: sistema.persistencia.detener()
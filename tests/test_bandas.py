@@ -0,0 +1,35 @@
+from conftest import editar_al_azar, inventario_aleatorio, pieza
+
+
+def test_los_puntos_propios_de_la_pieza_mandan(app):
+    critico, bajo = app.STOCK_CRITICO, app.STOCK_BAJO
+
+    assert app.banda_stock(pieza(1, cantidad=critico)) == "critico"
+    assert app.banda_stock(pieza(1, cantidad=bajo)) == "bajo"
+    assert app.banda_stock(pieza(1, cantidad=bajo + 1)) == ""
+    assert app.banda_stock(pieza(1, cantidad=bajo + 1, punto_critico=bajo + 5)) == "critico"
+    assert app.banda_stock(pieza(1, cantidad=3, punto_critico=0, punto_bajo=2)) == ""
+
+
+def test_las_bandas_editadas_son_iguales_a_unas_reconstruidas(app):
+    inventario = inventario_aleatorio(19, 300)
+    indice = app.IndiceBandas(inventario)
+
+    def al_cambiar(pid, anterior, nueva):
+        indice.quitar(pid, anterior)
+        if nueva is not None: indice.agregar(pid, nueva)
+    editar_al_azar(19, inventario, 500, al_cambiar)
+
+    nuevo = app.IndiceBandas(inventario)
+    assert (indice.piezas, indice.banda) == (nuevo.piezas, nuevo.banda)
+    assert indice.conteo("critico") == sum(app.banda_stock(p) == "critico" for p in inventario.values())
+    assert indice.pids({"critico", "bajo"}) == set(indice.banda)
+
+
+def test_un_movimiento_cambia_la_banda_en_la_ventana(app, ventana):
+    sistema = ventana({"1": pieza(1, cantidad=app.STOCK_BAJO + 5)})
+    assert sistema.indice_bandas.conteo("critico") == 0
+
+    sistema.aplicar_cambio({"op": "editar", "id": "1", "campos": {"cantidad": app.STOCK_CRITICO}})
+
+    assert sistema.indice_bandas.pids({"critico"}) == {"1"}
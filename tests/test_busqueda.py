@@ -0,0 +1,142 @@
+import time
+
+from conftest import inventario_aleatorio, pieza
+
+
+class VentanaFalsa:
+    # Lo que usa el buscador de la ventana de Tk: after guarda la revisión y la prueba la corre
+    def __init__(self):
+        self.programadas = []
+
+    def after(self, ms, funcion):
+        self.programadas.append(funcion)
+        return len(self.programadas)
+
+    def winfo_exists(self):
+        return True
+
+
+def esperar(ventana, listo):
+    limite = time.monotonic() + 5
+    while not listo() and time.monotonic() < limite:
+        time.sleep(0.005)
+        while ventana.programadas: ventana.programadas.pop(0)()
+    assert listo()
+
+
+def test_refinar_filtra_el_resultado_anterior(app):
+    indice = app.IndiceNgramas(inventario_aleatorio(14, 300))
+
+    anterior = indice.buscar("ll")
+
+    assert indice.refinar("llave", anterior) == indice.buscar("llave")
+    assert [pid for parte in indice.buscar_por_partes("llave", base=anterior, tamano=17) for pid in parte] \
+        == indice.buscar("llave")
+
+
+def test_un_termino_mas_largo_solo_filtra_el_resultado_anterior(app, monkeypatch):
+    indice = app.IndiceNgramas(inventario_aleatorio(14, 300))
+    busqueda = app.BusquedaIncremental(indice)
+    refinados = []
+    refinar = indice.refinar
+    monkeypatch.setattr(indice, "refinar", lambda termino, pids: refinados.append(termino) or refinar(termino, pids))
+
+    for termino in ("l", "ll", "lla", "llav", "llave"):
+        assert busqueda.buscar(termino) == indice.buscar(termino)
+
+    assert refinados == ["ll", "lla", "llav", "llave"]
+    assert busqueda.buscar("perno") == indice.buscar("perno")
+    assert refinados[-1] == "llave"
+
+
+def test_un_cambio_en_el_indice_invalida_el_resultado(app):
+    indice = app.IndiceNgramas({"1": pieza(1, nombre="Llave")})
+    busqueda = app.BusquedaIncremental(indice)
+    assert busqueda.buscar("llave") == ["1"]
+
+    indice.agregar("2", pieza(2, nombre="Llave fija"))
+
+    assert busqueda.buscar("llave") == ["1", "2"]
+    assert busqueda.buscar("llave f") == ["2"]
+
+
+def test_los_acentos_y_mayusculas_no_importan(app):
+    indice = app.IndiceNgramas({"1": pieza(1, nombre="Llave ALLÉN"), "2": pieza(2, nombre="Destornillador")})
+
+    assert indice.buscar("allen") == ["1"]
+    assert indice.buscar("LLAVE allén") == ["1"]
+
+
+def test_un_error_de_dedo_encuentra_las_mas_parecidas(app):
+    indice = app.IndiceNgramas({"1": pieza(1, nombre="Tornillo hexagonal"), "2": pieza(2, nombre="Tornillo"),
+                                "3": pieza(3, nombre="Tuerca"), "4": pieza(4, nombre="Martillo")})
+    busqueda = app.BusquedaIncremental(indice)
+
+    assert busqueda.buscar("tornilo") == ["2", "1"]
+    assert busqueda.aproximada
+    # Seguir escribiendo no refina sobre un resultado aproximado
+    assert busqueda.buscar("tornilo x") == indice.buscar_aproximado("tornilo x")
+    assert busqueda.buscar("tuerca") == ["3"] and not busqueda.aproximada
+
+
+def test_el_buscador_entrega_por_partes_y_recuerda_el_resultado(app):
+    indice = app.IndiceNgramas(inventario_aleatorio(25, 300))
+    busqueda, ventana = app.BusquedaIncremental(indice), VentanaFalsa()
+    buscador = app.BuscadorSegundoPlano(ventana)
+    avances, finales = [], []
+
+    buscador.buscar(busqueda, "ll", lambda pids: avances.append(list(pids)), finales.append)
+    esperar(ventana, lambda: finales)
+    buscador.cerrar()
+
+    assert finales == [indice.buscar("ll")]
+    assert all(avance == finales[0][:len(avance)] for avance in avances)
+    assert busqueda.vigente() and busqueda.buscar("ll") is finales[0]
+
+
+def test_una_busqueda_reemplazada_se_descarta(app):
+    indice = app.IndiceNgramas(inventario_aleatorio(25, 300))
+    busqueda, ventana = app.BusquedaIncremental(indice), VentanaFalsa()
+    buscador = app.BuscadorSegundoPlano(ventana)
+    finales = []
+
+    buscador.buscar(busqueda, "perno", lambda pids: None, lambda pids: finales.append(("perno", pids)))
+    buscador.buscar(busqueda, "broca", lambda pids: None, lambda pids: finales.append(("broca", pids)))
+    esperar(ventana, lambda: finales)
+    time.sleep(0.05)
+    while ventana.programadas: ventana.programadas.pop(0)()
+    buscador.cerrar()
+
+    assert finales == [("broca", indice.buscar("broca"))]
+
+
+def test_si_el_indice_cambia_la_busqueda_se_repite(app):
+    indice = app.IndiceNgramas({"1": pieza(1, nombre="Llave")})
+    busqueda, ventana = app.BusquedaIncremental(indice), VentanaFalsa()
+    buscador = app.BuscadorSegundoPlano(ventana)
+    finales = []
+
+    buscador.buscar(busqueda, "llave", lambda pids: None, finales.append)
+    indice.agregar("2", pieza(2, nombre="Llave fija"))
+    esperar(ventana, lambda: finales)
+    buscador.cerrar()
+
+    assert finales == [["1", "2"]]
+
+
+def test_el_resultado_se_ordena_en_el_hilo_para_la_vista(app):
+    inventario = inventario_aleatorio(25, 300)
+    indice, orden = app.IndiceNgramas(inventario), app.IndiceOrden(inventario)
+    busqueda, ventana = app.BusquedaIncremental(indice), VentanaFalsa()
+    buscador = app.BuscadorSegundoPlano(ventana)
+    finales = []
+
+    buscador.buscar(busqueda, "ll", lambda pids: None, finales.append,
+                    ordenar=lambda pids: orden.ordenar("nombre", inventario, set(pids)))
+    esperar(ventana, lambda: finales)
+
+    assert buscador.vista == orden.ordenar("nombre", inventario, set(indice.buscar("ll")))
+    # Con el resultado ya guardado no se vuelve a buscar ni a ordenar
+    buscador.buscar(busqueda, "ll", lambda pids: None, finales.append, ordenar=sorted)
+    buscador.cerrar()
+    assert finales[1] is finales[0] and buscador.vista is None
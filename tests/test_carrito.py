@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+
+from conftest import pieza
+
+
+def lineas_journal(app):
+    with open(app.ARCHIVO_JOURNAL, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f]
+
+
+def item(numero, cant):
+    return {"id": str(numero), "cant": cant, "codigo": f"C-{numero}", "nombre": f"Pieza {numero}"}
+
+
+def test_el_carrito_se_guarda_como_un_solo_lote(app, ventana):
+    sistema = ventana({"1": pieza(5), "2": pieza(3)})
+
+    assert sistema.procesar_movimientos("SALIDA", "123", [item(1, 2), item(2, 3)])
+
+    assert (sistema.inventario["1"]["cantidad"], sistema.inventario["2"]["cantidad"]) == (3, 0)
+    registros = lineas_journal(app)
+    assert len(registros) == 1 and registros[0]["op"] == "lote"
+    assert [(r["mov"]["delta"], r["mov"]["saldo"]) for r in registros[0]["registros"]] == [(-2, 3), (-3, 0)]
+    eventos = app.eventos_del_dia(app.datetime.datetime.now().strftime("%d/%m/%Y"))
+    assert [e["codigo"] for e in eventos] == ["C-1", "C-2"]
+
+
+def test_un_carrito_sin_stock_no_cambia_nada(app, ventana):
+    sistema = ventana({"1": pieza(5), "2": pieza(3)})
+
+    assert not sistema.procesar_movimientos("SALIDA", "123", [item(1, 2), item(2, 4)])
+
+    assert sistema.inventario == {"1": pieza(5), "2": pieza(3)}
+    assert not os.path.exists(app.ARCHIVO_JOURNAL)
+
+
+def test_si_falla_el_journal_se_restaura_el_estado_previo(app, ventana, monkeypatch):
+    sistema = ventana({"1": pieza(5, historial=[])})
+
+    def falla(registro):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(app, "registrar_mutacion", falla)
+
+    assert not sistema.aplicar_lote([{"op": "editar", "id": "1", "campos": {"cantidad": 1}},
+                                     {"op": "alta", "id": "2", "pieza": pieza(2)}])
+
+    assert sistema.inventario == {"1": pieza(5, historial=[])}
+    assert app.messagebox.avisos[0][0] == "showerror"
+
+
+def test_un_lote_sqlite_falla_entero(app, monkeypatch):
+    monkeypatch.setattr(app, "MODO_ALMACENAMIENTO", "sqlite")
+    almacen = app.almacen_sqlite()
+
+    with pytest.raises(KeyError):
+        app.registrar_mutacion({"op": "lote", "registros": [{"op": "alta", "id": "1", "pieza": pieza(1)},
+                                                             {"op": "alta", "id": "2", "pieza": {}}]})
+
+    assert almacen.cargar() == {}
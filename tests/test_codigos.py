@@ -0,0 +1,29 @@
+from conftest import pieza
+
+
+def test_el_codigo_se_busca_normalizado(app):
+    indice = app.IndiceCodigos({"1": pieza(1, codigo=" AB-10 "), "2": pieza(2, codigo="")})
+
+    assert indice.buscar("ab-10") == "1"
+    assert indice.buscar("AB-10", excluir="1") is None
+    assert indice.buscar("") is None
+
+
+def test_los_repetidos_se_informan_al_abrir(app, ventana):
+    ventana({"1": pieza(1, codigo="X"), "2": pieza(2, codigo="x "), "3": pieza(3)})
+
+    assert app.messagebox.avisos[0][0] == "showwarning"
+    assert "x: IDs 1, 2" in app.messagebox.avisos[0][2]
+
+
+def test_el_indice_sigue_a_las_ediciones(app, ventana):
+    sistema = ventana({"1": pieza(1), "2": pieza(2)})
+
+    sistema.aplicar_cambio({"op": "editar", "id": "1", "campos": {"codigo": "NUEVO"}})
+    sistema.aplicar_cambio({"op": "baja", "id": "2"})
+    sistema.aplicar_cambio({"op": "alta", "id": "3", "pieza": pieza(3, codigo="C-2")})
+
+    assert sistema.validar_codigo_duplicado("nuevo") == "Pieza 1"
+    assert sistema.validar_codigo_duplicado("nuevo", id_actual="1") is None
+    assert sistema.validar_codigo_duplicado("C-1") is None
+    assert sistema.indice_codigos.buscar("c-2") == "3"
@@ -0,0 +1,73 @@
+import types
+
+import pytest
+
+
+class TextoFalso:
+    # Lo que usa el historial de la ficha de un Text: trozos (texto, tag), inserts y tareas programadas
+    def __init__(self):
+        self.trozos = []
+        self.inserts = 0
+        self.programadas = []
+
+    def config(self, **opciones):
+        pass
+
+    def insert(self, indice, *textos_y_tags):
+        self.inserts += 1
+        self.trozos += list(zip(textos_y_tags[::2], textos_y_tags[1::2]))
+
+    def tag_ranges(self, tag):
+        return [t for t in self.trozos if t[1] == tag]
+
+    def delete(self, inicio, fin):
+        self.trozos = [t for t in self.trozos if t[1] != "mas"]
+
+    def after_idle(self, funcion):
+        self.programadas.append(funcion)
+
+    def lineas(self):
+        return "".join(texto for texto, tag in self.trozos if tag != "mas").splitlines()
+
+
+def movimiento(i):
+    return {"ts": 1767821400 - i, "tipo": "SALIDA" if i % 3 else "ENTRADA", "empleado": "7",
+            "delta": 1, "saldo": 300 - i}
+
+
+@pytest.fixture
+def ficha(app):
+    sistema = app.SistemaInventario.__new__(app.SistemaInventario)
+    sistema.txt_detalles, sistema.scroll_det = TextoFalso(), types.SimpleNamespace(set=lambda *args: None)
+    # Del más nuevo al más viejo, como lo devuelve historial_pieza
+    sistema.historial_ficha, sistema.lineas_ficha = [movimiento(i) for i in range(250)], 0
+    sistema.carga_ficha_pendiente = False
+    return sistema
+
+
+def test_cada_pagina_es_un_solo_insert_con_los_colores_juntos(app, ficha):
+    ficha.cargar_mas_historial()
+
+    texto = ficha.txt_detalles
+    assert texto.inserts == 1
+    assert texto.lineas() == [app.texto_movimiento(movimiento(i)) for i in range(app.LINEAS_HISTORIAL_PAGINA)]
+    assert [tag for _, tag in texto.trozos[:4]] == ["verde", "azul", "verde", "azul"]
+    assert texto.trozos[1][0].count("\n") == 2
+    assert texto.trozos[-1] == ("▼ Cargar más (150 movimientos anteriores)\n", "mas")
+
+
+def test_al_llegar_al_final_se_agrega_la_siguiente_pagina_una_vez(app, ficha):
+    ficha.cargar_mas_historial()
+
+    ficha.desplazamiento_detalles("0.9", "1.0")
+    ficha.desplazamiento_detalles("0.9", "1.0")
+    assert len(ficha.txt_detalles.programadas) == 1
+
+    ficha.txt_detalles.programadas.pop()()
+    ficha.cargar_mas_historial()
+
+    texto = ficha.txt_detalles
+    assert texto.lineas() == [app.texto_movimiento(movimiento(i)) for i in range(250)]
+    assert not texto.tag_ranges("mas")
+    ficha.desplazamiento_detalles("0.9", "1.0")
+    assert not texto.programadas
@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import pieza
+
+
+def test_un_id_borrado_no_se_vuelve_a_usar(app):
+    contador = app.ContadorIds({"1": pieza(1), "2": pieza(2)})
+    assert contador.reservar() == ["3"]
+
+    # Reinicio con la pieza 3 ya dada de baja
+    contador = app.ContadorIds({"1": pieza(1), "2": pieza(2)})
+
+    assert contador.proximo() == "4"
+    assert contador.reservar(3) == ["4", "5", "6"]
+    assert app.ContadorIds({}).proximo() == "7"
+
+
+def test_sin_contador_guardado_sigue_al_id_mas_alto(app):
+    contador = app.ContadorIds({"7": pieza(7), "x": pieza(1)})
+
+    assert contador.proximo() == "8"
+    contador.ajustar({"20": pieza(20)})
+    assert contador.proximo() == "21"
+
+
+def test_en_sqlite_el_contador_va_en_la_tabla_meta(app, monkeypatch):
+    monkeypatch.setattr(app, "MODO_ALMACENAMIENTO", "sqlite")
+
+    app.ContadorIds({"1": pieza(1)}).reservar(2)
+
+    assert app.almacen_sqlite().leer_meta("siguiente_id") == "4"
+    assert app.ContadorIds({}).proximo() == "4"
+
+
+def test_si_no_se_puede_guardar_el_id_no_se_entrega(app, monkeypatch):
+    contador = app.ContadorIds({})
+
+    def falla(siguiente):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(app, "guardar_contador_ids", falla)
+
+    with pytest.raises(OSError):
+        contador.reservar()
+    assert contador.proximo() == "1"
+
+
+def test_un_respaldo_restaurado_mueve_el_contador(app, ventana):
+    sistema = ventana({"1": pieza(1)})
+
+    sistema.restaurar_inventario({"1": pieza(1), "9": pieza(9)}, "Respaldo_MANUAL_2026-01-01_08-00-00.resp")
+
+    assert sistema.contador_ids.proximo() == "10"
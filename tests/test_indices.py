@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from conftest import editar_al_azar, inventario_aleatorio, pieza, programa
+
+
+def buscar_recorriendo(app, inventario, termino):
+    termino = app.normalizar_texto(termino).strip()
+    return [pid for pid in sorted(inventario, key=app.clave_id)
+            if any(termino in app.normalizar_texto(inventario[pid][c]) for c in app.IndiceNgramas.CAMPOS)]
+
+
+def editar_con_indice(indice):
+    # Una edición quita y vuelve a agregar, como actualizar_indices
+    def al_cambiar(pid, anterior, nueva):
+        indice.quitar(pid)
+        if nueva is not None: indice.agregar(pid, nueva)
+    return al_cambiar
+
+
+def editar_con_orden(indice):
+    def al_cambiar(pid, anterior, nueva):
+        if anterior is not None and nueva is not None and not indice.cambio(pid, anterior, nueva): return
+        if anterior is not None: indice.quitar(pid, anterior)
+        if nueva is not None: indice.agregar(pid, nueva)
+    return al_cambiar
+
+
+def test_el_indice_editado_es_igual_a_uno_reconstruido(app):
+    inventario = inventario_aleatorio(13, 300)
+    indice = app.IndiceNgramas(inventario)
+
+    editar_al_azar(13, inventario, 500, editar_con_indice(indice))
+
+    nuevo = app.IndiceNgramas(inventario)
+    assert indice.textos == nuevo.textos
+    assert indice.postings == nuevo.postings
+
+
+@pytest.mark.parametrize("termino", ["", "a", "T", "ll", "ALLEN", "len", "rno", "ca ", "zz", "lla 1", "12"])
+def test_buscar_coincide_con_recorrer_todo(app, termino):
+    inventario = inventario_aleatorio(13, 300)
+    indice = app.IndiceNgramas(inventario)
+    editar_al_azar(13, inventario, 200, editar_con_indice(indice))
+
+    esperado = buscar_recorriendo(app, inventario, termino)
+
+    assert indice.buscar(termino) == esperado
+    assert [pid for parte in indice.buscar_por_partes(termino, tamano=17) for pid in parte] == esperado
+
+
+def test_los_terminos_cortos_revisan_todas_las_piezas(app):
+    indice = app.IndiceNgramas({"1": pieza(1, nombre="llave")})
+
+    assert indice.candidatos("ll") is None
+    assert indice.candidatos("lla") == {"1"}
+    assert indice.candidatos("zzz") == set()
+
+def test_la_ventana_mantiene_el_indice_con_cada_cambio(app, ventana):
+    sistema = ventana({"1": pieza(1, nombre="Llave Allen"), "2": pieza(2, nombre="Broca")})
+
+    sistema.aplicar_cambio({"op": "editar", "id": "2", "campos": {"descripcion": "para llave"}})
+    sistema.aplicar_cambio({"op": "baja", "id": "1"})
+    sistema.aplicar_cambio({"op": "alta", "id": "3", "pieza": pieza(3, nombre="LLAVE fija")})
+
+    assert sistema.indice_busqueda.buscar("llave") == ["2", "3"]
+
+
+def test_los_ordenes_editados_son_iguales_a_unos_reconstruidos(app):
+    inventario = inventario_aleatorio(18, 300)
+    indice = app.IndiceOrden(inventario)
+    version = indice.version
+
+    editar_al_azar(18, inventario, 500, editar_con_orden(indice))
+
+    nuevo = app.IndiceOrden(inventario)
+    assert indice.listas == nuevo.listas
+    assert indice.pids == nuevo.pids
+    assert indice.version > version
+
+
+@pytest.mark.parametrize("modo", list(programa.IndiceOrden.CLAVES))
+@pytest.mark.parametrize("cantidad", [5, 200])
+def test_ordenar_un_subconjunto(app, modo, cantidad):
+    inventario = inventario_aleatorio(18, 300)
+    indice = app.IndiceOrden(inventario)
+    editar_al_azar(18, inventario, 200, editar_con_orden(indice))
+    clave = app.IndiceOrden.CLAVES[modo]
+    subconjunto = set(random.Random(18).sample(sorted(inventario), cantidad))
+
+    assert indice.ordenar(modo, inventario) == sorted(inventario, key=lambda pid: clave(pid, inventario[pid]))
+    assert indice.ordenar(modo, inventario, subconjunto) == \
+        sorted(subconjunto, key=lambda pid: clave(pid, inventario[pid]))
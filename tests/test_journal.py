@@ -0,0 +1,94 @@
+import json
+import os
+
+from conftest import pieza
+
+
+def test_el_journal_se_reaplica_sobre_el_snapshot(app):
+    app.escribir_snapshot({"1": pieza(1), "2": pieza(2)})
+    app.registrar_mutacion({"op": "alta", "id": "3", "pieza": pieza(3)})
+    app.registrar_mutacion({"op": "editar", "id": "1", "campos": {"nombre": "Llave Allen"}})
+    app.registrar_mutacion({"op": "baja", "id": "2"})
+
+    inventario = app.cargar_datos()
+
+    assert inventario == {"1": pieza(1, nombre="Llave Allen"), "3": pieza(3)}
+
+
+def test_al_cargar_el_journal_queda_consolidado(app):
+    app.escribir_snapshot({"1": pieza(1)})
+    app.registrar_mutacion({"op": "editar", "id": "1", "campos": {"cantidad": 9}})
+
+    app.cargar_datos()
+
+    assert os.path.getsize(app.ARCHIVO_JOURNAL) == 0
+    with open(app.ARCHIVO_DATOS, encoding="utf-8") as f:
+        assert json.load(f) == {"1": pieza(1, cantidad=9)}
+    # Una segunda carga no vuelve a aplicar nada
+    assert app.cargar_datos() == {"1": pieza(1, cantidad=9)}
+
+
+def test_la_ultima_linea_cortada_se_ignora(app):
+    app.escribir_snapshot({"1": pieza(1)})
+    app.registrar_mutacion({"op": "editar", "id": "1", "campos": {"cantidad": 7}})
+    with open(app.ARCHIVO_JOURNAL, "a", encoding="utf-8") as f:
+        f.write('{"op":"baja","id":"1"')
+
+    assert app.cargar_datos() == {"1": pieza(1, cantidad=7)}
+
+
+def test_un_movimiento_actualiza_cantidad_y_ultimo_movimiento(app):
+    inventario = {"1": pieza(1)}
+    mov = {"ts": 1767821400, "tipo": "SALIDA", "empleado": "123", "delta": -1, "saldo": 0}
+    efectos = []
+
+    app.aplicar_mutacion(inventario, {"op": "mov", "id": "1", "cantidad": 0, "mov": mov}, efectos)
+
+    assert inventario["1"]["cantidad"] == 0
+    assert (inventario["1"]["ult_ts"], inventario["1"]["ult_tipo"]) == (1767821400, "SALIDA")
+    assert efectos == [("mov", "1", mov)]
+
+
+def test_un_movimiento_del_journal_anterior_trae_el_texto(app):
+    inventario = {"1": pieza(4)}
+    efectos = []
+    linea = "📤 07/01/2026 15:30:00 | SALIDA | Empleado: 123 | Cant: -3 | Restan: 1"
+
+    app.aplicar_mutacion(inventario, {"op": "mov", "id": "1", "cantidad": 1, "linea": linea}, efectos)
+
+    mov = efectos[0][2]
+    assert (mov["tipo"], mov["empleado"], mov["delta"], mov["saldo"]) == ("SALIDA", "123", -3, 1)
+    assert app.texto_movimiento(mov) == linea
+
+
+def test_un_lote_se_aplica_completo(app):
+    inventario = {"1": pieza(1)}
+    lote = {"op": "lote", "registros": [{"op": "alta", "id": "2", "pieza": pieza(2)},
+                                        {"op": "editar", "id": "1", "campos": {"gabinete": "G9"}}]}
+
+    efectos = []
+
+    app.aplicar_mutacion(inventario, lote, efectos)
+
+    assert inventario == {"1": pieza(1, gabinete="G9"), "2": pieza(2)}
+    assert efectos == [("reinicio", "2")]
+
+
+def test_un_lote_cortado_no_se_aplica(app):
+    app.escribir_snapshot({"1": pieza(1)})
+    with open(app.ARCHIVO_JOURNAL, "a", encoding="utf-8") as f:
+        f.write('{"op":"lote","registros":[{"op":"baja","id":"1"},{"op":"alta","id":"2","pieza":{"cod')
+
+    assert app.cargar_datos() == {"1": pieza(1)}
+
+
+def test_recortar_conserva_lo_agregado_despues_del_snapshot(app):
+    app.registrar_mutacion({"op": "editar", "id": "1", "campos": {"cantidad": 1}})
+    posicion = app.tamano_journal()
+    app.registrar_mutacion({"op": "editar", "id": "1", "campos": {"cantidad": 2}})
+
+    app.recortar_journal(posicion)
+
+    with open(app.ARCHIVO_JOURNAL, encoding="utf-8") as f:
+        assert [json.loads(linea) for linea in f] == [{"op": "editar", "id": "1", "campos": {"cantidad": 2}}]
+    assert not os.path.exists(app.ARCHIVO_JOURNAL + ".tmp")
@@ -0,0 +1,61 @@
+import datetime
+import json
+import os
+
+
+def evento(hora, fecha="01/02/2026"):
+    return {"fecha": fecha, "hora": hora, "accion": "SALIDA", "codigo": "C-1", "nombre": "Pieza 1", "detalle": ""}
+
+
+def test_los_formatos_anteriores_pasan_a_las_particiones(app):
+    with open(app.ARCHIVO_LOG_ANTIGUO, "w", encoding="utf-8") as f:
+        json.dump([evento("10:00:01"), evento("09:00:00", "28/01/2026")], f)
+    with open(app.ARCHIVO_LOG_JSONL, "w", encoding="utf-8") as f:
+        f.write(app.serializar_evento(evento("10:00:02")) + "{no es json\n")
+
+    app.migrar_log_global()
+
+    assert [e["hora"] for e in app.eventos_del_dia("01/02/2026")] == ["10:00:01", "10:00:02"]
+    assert [e["hora"] for e in app.eventos_del_dia("28/01/2026")] == ["09:00:00"]
+    assert sorted(os.listdir(app.CARPETA_LOG)) == ["2026-01.idx.json", "2026-01.jsonl",
+                                                   "2026-02.idx.json", "2026-02.jsonl"]
+    for ruta in (app.ARCHIVO_LOG_ANTIGUO, app.ARCHIVO_LOG_JSONL):
+        assert not os.path.exists(ruta) and os.path.exists(ruta + ".migrado")
+
+
+def test_los_dias_intercalados_se_leen_por_rangos(app):
+    app.agregar_eventos_log([evento("10:00:00"), evento("10:00:00", "02/02/2026")])
+    app.agregar_eventos_log([evento("11:00:00")])
+
+    _, ruta_idx = app.rutas_particion_log("01/02/2026")
+    with open(ruta_idx, encoding="utf-8") as f:
+        assert len(json.load(f)["01/02/2026"]) == 2
+    assert [e["hora"] for e in app.eventos_del_dia("01/02/2026")] == ["10:00:00", "11:00:00"]
+
+
+def test_la_cola_sin_indexar_se_recupera(app):
+    # Cierre entre la escritura del evento y la del índice
+    app.agregar_eventos_log([evento("10:00:00")])
+    ruta_datos, _ = app.rutas_particion_log("01/02/2026")
+    with open(ruta_datos, "a", encoding="utf-8") as f:
+        f.write(app.serializar_evento(evento("10:00:05")))
+    app._indices_log.clear()
+
+    assert [e["hora"] for e in app.eventos_del_dia("01/02/2026")] == ["10:00:00", "10:00:05"]
+
+
+def test_un_rango_de_fechas_abre_solo_sus_meses(app, monkeypatch):
+    app.agregar_eventos_log([evento("08:00:00", "31/12/2025"), evento("09:00:00", "28/01/2026"),
+                             evento("10:00:00"), evento("11:00:00", "02/03/2026"), evento("10:30:00", "28/01/2026")])
+    abiertos = []
+    leer_rangos_log = app.leer_rangos_log
+
+    def leer_registrando(ruta, rangos):
+        abiertos.append(os.path.basename(ruta))
+        return leer_rangos_log(ruta, rangos)
+    monkeypatch.setattr(app, "leer_rangos_log", leer_registrando)
+
+    eventos = app.eventos_rango(datetime.date(2026, 1, 1), datetime.date(2026, 2, 28))
+
+    assert [e["hora"] for e in eventos] == ["09:00:00", "10:30:00", "10:00:00"]
+    assert abiertos == ["2026-01.jsonl", "2026-02.jsonl"]
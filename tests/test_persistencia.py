@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+from conftest import pieza
+
+
+def esperar(condicion, limite=5):
+    fin = time.monotonic() + limite
+    while not condicion() and time.monotonic() < fin:
+        time.sleep(0.01)
+    return condicion()
+
+
+class RaizFalsa:
+    # El hilo programa los avisos en la ventana de Tk con after; la prueba los corre
+    def __init__(self):
+        self.programadas = []
+
+    def after(self, ms, funcion):
+        self.programadas.append(funcion)
+
+
+def leer_snapshot(app):
+    with open(app.ARCHIVO_DATOS, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_los_cambios_seguidos_viajan_en_una_escritura(app):
+    inventario, copias = {}, []
+
+    def copiar():
+        copias.append(dict(inventario))
+        return dict(inventario)
+
+    persistencia = app.PersistenciaAsincrona(copiar, ventana=0.3)
+    for i in range(1, 4):
+        with persistencia.candado:
+            inventario[str(i)] = pieza(i)
+            app.registrar_mutacion({"op": "alta", "id": str(i), "pieza": pieza(i)})
+            persistencia.marcar_sucio()
+
+    assert esperar(lambda: app.tamano_journal() == 0)
+    persistencia.detener()
+
+    assert len(copias) == 1
+    assert leer_snapshot(app) == {"1": pieza(1), "2": pieza(2), "3": pieza(3)}
+
+
+def test_detener_escribe_lo_pendiente(app):
+    inventario = {"1": pieza(1)}
+    persistencia = app.PersistenciaAsincrona(lambda: dict(inventario), ventana=3600)
+    with persistencia.candado:
+        app.registrar_mutacion({"op": "alta", "id": "1", "pieza": pieza(1)})
+        persistencia.marcar_sucio()
+
+    persistencia.detener()
+
+    assert not persistencia.hilo.is_alive()
+    assert leer_snapshot(app) == {"1": pieza(1)}
+    assert app.tamano_journal() == 0
+
+
+def test_si_falla_el_snapshot_el_journal_queda_intacto(app, monkeypatch):
+    persistencia = app.PersistenciaAsincrona(lambda: {"1": pieza(1)}, ventana=3600)
+    escribir_snapshot = app.escribir_snapshot
+    app.registrar_mutacion({"op": "alta", "id": "1", "pieza": pieza(1)})
+    tamano = app.tamano_journal()
+
+    def falla(datos):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(app, "escribir_snapshot", falla)
+    persistencia.marcar_sucio()
+    persistencia.escribir()
+
+    assert isinstance(persistencia.error, OSError) and persistencia.sucio
+    assert app.tamano_journal() == tamano
+    monkeypatch.setattr(app, "escribir_snapshot", escribir_snapshot)
+    persistencia.detener()
+    assert app.tamano_journal() == 0
+
+
+def test_un_solo_aviso_por_racha_de_fallos(app, monkeypatch):
+    raiz, intentos = RaizFalsa(), []
+    persistencia = app.PersistenciaAsincrona(lambda: {"1": pieza(1)}, raiz, ventana=0.01)
+    escribir_snapshot = app.escribir_snapshot
+
+    def falla(datos):
+        intentos.append(datos)
+        raise OSError("disco lleno")
+    monkeypatch.setattr(app, "escribir_snapshot", falla)
+    for n in (1, 2):
+        with persistencia.candado:
+            persistencia.marcar_sucio()
+        assert esperar(lambda: len(intentos) >= n and persistencia.avisado)
+
+    assert len(raiz.programadas) == 1
+    raiz.programadas[0]()
+    assert app.messagebox.avisos == [("showerror", "Error", "No se pudo guardar inventario: disco lleno")]
+
+    monkeypatch.setattr(app, "escribir_snapshot", escribir_snapshot)
+    with persistencia.candado:
+        persistencia.marcar_sucio()
+    assert esperar(lambda: os.path.exists(app.ARCHIVO_DATOS) and not persistencia.avisado)
+    persistencia.detener()
+    assert persistencia.error is None and len(raiz.programadas) == 1
+
+
+def test_despues_de_un_fallo_se_reintenta_cada_vez_mas_espaciado(app, monkeypatch):
+    persistencia = app.PersistenciaAsincrona(lambda: {"1": pieza(1)}, ventana=0.01)
+    esperas = []
+
+    class Despertar(threading.Event):
+        # Anota la espera pedida y espera poco, para no alargar la prueba
+        def wait(self, tiempo=None):
+            esperas.append(tiempo)
+            return super().wait(0.001)
+    persistencia.despertar = Despertar()
+    escribir_snapshot, fallos = app.escribir_snapshot, 3
+
+    def falla_las_primeras(datos):
+        nonlocal fallos
+        if fallos:
+            fallos -= 1
+            raise OSError("disco lleno")
+        escribir_snapshot(datos)
+    monkeypatch.setattr(app, "escribir_snapshot", falla_las_primeras)
+    app.registrar_mutacion({"op": "alta", "id": "1", "pieza": pieza(1)})
+    with persistencia.candado:
+        persistencia.marcar_sucio()
+
+    assert esperar(lambda: app.tamano_journal() == 0)
+    persistencia.detener()
+
+    assert esperas[:4] == [0.01, 0.02, 0.04, 0.08]
+    assert leer_snapshot(app) == {"1": pieza(1)} and persistencia.error is None
@@ -0,0 +1,108 @@
+from conftest import pieza
+
+
+def mov(tipo, delta, ts, empleado="7"):
+    return {"ts": ts, "tipo": tipo, "empleado": empleado, "delta": delta, "saldo": 0}
+
+
+def test_el_prestamo_se_cierra_cuando_se_devuelve_todo(app):
+    libro = app.LibroPrestamos()
+
+    libro.aplicar_efectos([("mov", "1", mov("SALIDA", -3, 100)), ("mov", "1", mov("ENTRADA", 1, 200)),
+                           ("mov", "2", mov("SALIDA", -1, 150, empleado="9"))])
+
+    assert libro.saldos == {("7", "1"): {"pendiente": 2, "sacados": 3, "devueltos": 1, "primer_ts": 100, "ult_ts": 200},
+                            ("9", "2"): {"pendiente": 1, "sacados": 1, "devueltos": 0, "primer_ts": 150, "ult_ts": 150}}
+    assert [clave for clave, _ in libro.abiertos()] == [("7", "1"), ("9", "2")]
+
+    libro.aplicar_efectos([("mov", "1", mov("ENTRADA", 2, 300)), ("reinicio", "2")])
+
+    assert libro.saldos == {}
+
+
+def test_devolver_de_mas_no_deja_saldo(app, monkeypatch):
+    libro = app.LibroPrestamos()
+
+    libro.aplicar_efectos([("mov", "1", mov("SALIDA", -2, 100)), ("mov", "1", mov("ENTRADA", 5, 200)),
+                           ("mov", "2", mov("ENTRADA", 1, 150))])
+
+    assert libro.saldos == {}
+    libro.aplicar_efectos([("mov", "1", mov("SALIDA", -1, 300))])
+    assert libro.saldos[("7", "1")]["pendiente"] == 1
+
+    monkeypatch.setattr(app, "MODO_ALMACENAMIENTO", "sqlite")
+    almacen = app.almacen_sqlite()
+    app.registrar_mutacion({"op": "alta", "id": "1", "pieza": pieza(5)})
+    app.registrar_mutacion({"op": "mov", "id": "1", "cantidad": 3, "mov": mov("SALIDA", -2, 100)})
+    app.registrar_mutacion({"op": "mov", "id": "1", "cantidad": 8, "mov": mov("ENTRADA", 5, 200)})
+    assert almacen.cargar_prestamos() == {}
+
+def test_el_libro_se_rehace_desde_los_segmentos(app):
+    app.escribir_snapshot({"1": pieza(1), "2": pieza(2)})
+    app.escribir_segmento("1", [mov("SALIDA", -3, 100), mov("ENTRADA", 1, 200)])
+    app.escribir_segmento("2", [mov("SALIDA", -2, 100), mov("ENTRADA", 2, 200)])
+    libro = app.LibroPrestamos()
+
+    app.cargar_datos_json(libro)
+
+    assert list(libro.saldos) == [("7", "1")] and libro.saldos[("7", "1")]["pendiente"] == 2
+    assert app.leer_prestamos() == libro.saldos
+
+
+def test_el_journal_se_aplica_sobre_el_libro_guardado(app):
+    app.escribir_snapshot({"1": pieza(5)})
+    app.escribir_prestamos({("7", "1"): {"pendiente": 1, "sacados": 1, "devueltos": 0, "primer_ts": 100,
+                                         "ult_ts": 100}})
+    app.registrar_mutacion({"op": "mov", "id": "1", "cantidad": 3, "mov": mov("SALIDA", -2, 200)})
+    libro = app.LibroPrestamos()
+
+    app.cargar_datos_json(libro)
+
+    assert libro.saldos[("7", "1")] == {"pendiente": 3, "sacados": 3, "devueltos": 0, "primer_ts": 100, "ult_ts": 200}
+
+
+def test_el_libro_sigue_valiendo_despues_de_consolidar_el_journal(app):
+    app.escribir_snapshot({"1": pieza(5)})
+    app.escribir_prestamos({("7", "1"): {"pendiente": 1, "sacados": 1, "devueltos": 0, "primer_ts": 1, "ult_ts": 1}})
+    app.registrar_mutacion({"op": "editar", "id": "1", "campos": {"nombre": "Llave Allen"}})
+    libro = app.LibroPrestamos()
+
+    app.cargar_datos_json(libro)
+
+    assert app.leer_prestamos() == libro.saldos == {("7", "1"): {"pendiente": 1, "sacados": 1, "devueltos": 0,
+                                                                 "primer_ts": 1, "ult_ts": 1}}
+
+def test_un_libro_de_otro_snapshot_no_se_usa(app):
+    app.escribir_snapshot({"1": pieza(5)})
+    app.escribir_prestamos({("7", "1"): {"pendiente": 1, "sacados": 1, "devueltos": 0, "primer_ts": 1, "ult_ts": 1}})
+    app.escribir_snapshot({"1": pieza(5), "2": pieza(2)})
+
+    assert app.leer_prestamos() is None
+    libro = app.LibroPrestamos()
+    app.cargar_datos_json(libro)
+    assert libro.saldos == {}
+
+
+def test_el_carrito_actualiza_el_libro_y_se_guarda_con_el_snapshot(app, ventana):
+    sistema = ventana({"1": pieza(5)})
+    item = {"id": "1", "cant": 2, "codigo": "C-5", "nombre": "Pieza 5"}
+
+    assert sistema.procesar_movimientos("SALIDA", "123", [item])
+
+    assert app._libro_prestamos.saldos[("123", "1")]["pendiente"] == 2
+    sistema.persistencia.escribir()
+    assert app.leer_prestamos() == app._libro_prestamos.saldos
+
+
+def test_en_sqlite_el_libro_va_en_la_misma_transaccion(app, monkeypatch):
+    monkeypatch.setattr(app, "MODO_ALMACENAMIENTO", "sqlite")
+    almacen = app.almacen_sqlite()
+    app.registrar_mutacion({"op": "alta", "id": "1", "pieza": pieza(5)})
+
+    app.registrar_mutacion({"op": "mov", "id": "1", "cantidad": 2, "mov": mov("SALIDA", -3, 100)})
+    app.registrar_mutacion({"op": "mov", "id": "1", "cantidad": 3, "mov": mov("ENTRADA", 1, 200)})
+
+    assert almacen.cargar_prestamos() == {("7", "1"): {"pendiente": 2, "sacados": 3, "devueltos": 1,
+                                                       "primer_ts": 100, "ult_ts": 200}}
+    app.registrar_mutacion({"op": "baja", "id": "1"})
+    assert almacen.cargar_prestamos() == {}
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from conftest import pieza
+
+
+def test_el_progreso_avanza_hasta_que_se_cancela(app):
+    progreso = app.ProgresoReporte()
+    progreso.iniciar(3)
+    progreso.avanzar()
+    progreso.avanzar()
+
+    progreso.cancelado.set()
+
+    with pytest.raises(app.ReporteCancelado):
+        progreso.avanzar()
+    assert (progreso.hecho, progreso.total) == (2, 3)
+
+
+def test_un_reporte_cancelado_no_guarda_el_archivo(app, tmp_path):
+    ruta = tmp_path / "reporte.txt"
+    progreso, empezado = app.ProgresoReporte(), threading.Event()
+
+    def trabajo(progreso):
+        # Igual que los reportes: una fila por avance y el archivo solo al final
+        filas = []
+        progreso.iniciar(1000)
+        for i in range(1000):
+            progreso.avanzar()
+            if i == 0:
+                empezado.set()
+                progreso.cancelado.wait(5)  # Se cancela a media generación
+            filas.append(str(i))
+        ruta.write_text("\n".join(filas))
+
+    futuro = app.pool_reportes().submit(trabajo, progreso)
+    empezado.wait(5)
+    progreso.cancelado.set()
+
+    with pytest.raises(app.ReporteCancelado):
+        futuro.result(5)
+    assert not ruta.exists()
+
+
+def test_las_filas_del_reporte_son_una_copia_ordenada_por_id(app, ventana):
+    sistema = ventana({"10": pieza(10), "2": pieza(2), "1": pieza(1)})
+
+    filas = sistema.filas_inventario_reporte()
+    sistema.inventario["1"]["nombre"] = "Llave Allen"
+
+    assert [fila[:4] for fila in filas] == [("1", "C-1", "Pieza 1", 1), ("2", "C-2", "Pieza 2", 2),
+                                            ("10", "C-10", "Pieza 10", 10)]
@@ -0,0 +1,201 @@
+import datetime
+import json
+import os
+import types
+
+import pytest
+
+from conftest import pieza
+
+
+class Reloj(datetime.datetime):
+    # crear_punto_respaldo nombra cada punto con datetime.datetime.now()
+    actual = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.actual
+
+
+@pytest.fixture
+def reloj(app, monkeypatch):
+    monkeypatch.setattr(app, "datetime", types.SimpleNamespace(datetime=Reloj, date=datetime.date))
+    Reloj.actual = datetime.datetime(2026, 1, 1, 8)
+    return Reloj
+
+
+def crear_punto(app, reloj, inventario, etiqueta="Auto", momento=None):
+    reloj.actual = momento or reloj.actual + datetime.timedelta(hours=1)
+    return app.crear_punto_respaldo({pid: dict(p) for pid, p in inventario.items()}, etiqueta)
+
+
+def leer(app, nombre):
+    return app.leer_punto_respaldo(os.path.join(app.CARPETA_RESPALDOS, nombre))
+
+
+def reconstruir(app, nombre):
+    return app.reconstruir_respaldo(os.path.join(app.CARPETA_RESPALDOS, nombre))
+
+
+def test_un_delta_guarda_solo_lo_que_cambio(app, reloj):
+    inventario = {"1": pieza(1), "2": pieza(2), "3": pieza(3)}
+    base = crear_punto(app, reloj, inventario)
+    inventario["1"] = pieza(1, cantidad=40)
+    del inventario["2"]
+    delta = crear_punto(app, reloj, inventario)
+
+    punto = leer(app, delta)
+    assert (punto["tipo"], punto["padre"], punto["bajas"]) == ("delta", base, ["2"])
+    assert list(punto["manifiesto"]) == ["1"]
+    assert reconstruir(app, base) == {"1": pieza(1), "2": pieza(2), "3": pieza(3)}
+    assert reconstruir(app, delta) == inventario
+
+
+def test_una_pieza_que_vuelve_a_un_contenido_conocido_no_se_guarda_de_nuevo(app, reloj):
+    inventario = {"1": pieza(1)}
+    crear_punto(app, reloj, inventario)
+    inventario["1"] = pieza(1, cantidad=0)
+    crear_punto(app, reloj, inventario)
+    inventario["1"] = pieza(1)
+
+    punto = leer(app, crear_punto(app, reloj, inventario))
+
+    assert list(punto["manifiesto"]) == ["1"] and punto["objetos"] == {}
+
+
+def test_sin_cambios_no_hay_punto_automatico(app, reloj):
+    inventario = {"1": pieza(1)}
+    crear_punto(app, reloj, inventario)
+
+    assert crear_punto(app, reloj, inventario) is None
+    assert crear_punto(app, reloj, inventario, "MANUAL") is not None
+    assert len(app.listar_puntos_respaldo()) == 2
+
+
+def test_despues_de_muchos_deltas_se_escribe_una_base(app, reloj, monkeypatch):
+    monkeypatch.setattr(app, "MAX_DELTAS_RESPALDO", 2)
+    inventario = {}
+    tipos = []
+    for i in range(1, 6):
+        inventario[str(i)] = pieza(i)
+        tipos.append(leer(app, crear_punto(app, reloj, inventario))["tipo"])
+
+    assert tipos == ["base", "delta", "delta", "base", "delta"]
+    assert reconstruir(app, app.listar_puntos_respaldo()[-1]) == inventario
+
+
+def test_restaurar_reemplaza_el_inventario_y_vacia_el_journal(app, ventana):
+    sistema = ventana({"1": pieza(1)})
+    sistema.aplicar_cambio({"op": "alta", "id": "2", "pieza": pieza(2)})
+
+    assert sistema.restaurar_inventario({"5": pieza(5)}, "Respaldo_MANUAL_2026-01-01_08-00-00.resp")
+
+    assert sistema.inventario == {"5": pieza(5)}
+    assert app.tamano_journal() == 0
+    with open(app.ARCHIVO_DATOS, encoding="utf-8") as f:
+        assert json.load(f) == {"5": pieza(5)}
+    assert not sistema.persistencia.sucio
+
+
+@pytest.mark.parametrize("modo", ["json", "sqlite"])
+def test_restaurar_recalcula_los_prestamos_con_el_historial_actual(app, ventana, monkeypatch, modo):
+    monkeypatch.setattr(app, "MODO_ALMACENAMIENTO", modo)
+    sistema = ventana({})
+    sistema.aplicar_cambio({"op": "alta", "id": "1", "pieza": pieza(5)})
+    sistema.aplicar_cambio({"op": "alta", "id": "2", "pieza": pieza(5)})
+    sistema.procesar_movimientos("SALIDA", "123", [{"id": pid, "cant": 2, "codigo": "C-5", "nombre": "Pieza 5"}
+                                                   for pid in ("1", "2")])
+
+    assert sistema.restaurar_inventario({"1": pieza(1)}, "Respaldo_MANUAL_2026-01-01_08-00-00.resp")
+
+    assert list(app._libro_prestamos.saldos) == [("123", "1")]
+    assert [m["tipo"] for m in app.historial_pieza("1")] == ["SALIDA"] and app.historial_pieza("2") == []
+    if modo == "json":
+        assert app.leer_prestamos() == app._libro_prestamos.saldos
+    else:
+        assert app.almacen_sqlite().cargar_prestamos() == app._libro_prestamos.saldos
+
+def test_un_delta_fusionado_reconstruye_lo_mismo(app, reloj):
+    inventario = {"1": pieza(1), "2": pieza(2)}
+    base = crear_punto(app, reloj, inventario)
+    del inventario["2"]
+    inventario["3"] = pieza(3)
+    medio = crear_punto(app, reloj, inventario)
+    inventario["2"] = pieza(2, cantidad=40)
+    inventario["1"]["nombre"] = "Llave Allen"
+    ultimo = crear_punto(app, reloj, inventario)
+    esperado = reconstruir(app, ultimo)
+
+    fusionado = app.fusionar_puntos(leer(app, medio), leer(app, ultimo))
+    app.escribir_punto_respaldo(os.path.join(app.CARPETA_RESPALDOS, ultimo), fusionado)
+    os.remove(os.path.join(app.CARPETA_RESPALDOS, medio))
+
+    assert fusionado["padre"] == base
+    assert reconstruir(app, ultimo) == esperado == inventario
+
+
+def test_una_base_fusionada_sigue_siendo_base(app, reloj):
+    inventario = {"1": pieza(1), "2": pieza(2)}
+    base = crear_punto(app, reloj, inventario)
+    del inventario["1"]
+    delta = crear_punto(app, reloj, inventario)
+
+    fusionado = app.fusionar_puntos(leer(app, base), leer(app, delta))
+
+    assert (fusionado["tipo"], fusionado["padre"], fusionado["bajas"]) == ("base", None, [])
+    assert set(fusionado["manifiesto"]) == {"2"}
+
+
+def test_podar_conserva_la_politica_y_cada_punto_se_reconstruye(app, reloj):
+    inicio = datetime.datetime(2026, 1, 1, 8)
+    inventario, estados = {"1": pieza(1)}, {}
+    for dia in range(40):
+        for hora in (8, 17):
+            inventario[str(dia * 2 + hora)] = pieza(dia)
+            etiqueta = "MANUAL" if (dia, hora) == (3, 8) else "Auto"
+            momento = inicio + datetime.timedelta(days=dia, hours=hora - 8)
+            nombre = crear_punto(app, reloj, inventario, etiqueta, momento)
+            estados[nombre] = {pid: dict(p) for pid, p in inventario.items()}
+    ahora = inicio + datetime.timedelta(days=39, hours=12)
+    politica = {"dias_completos": 1, "dias_diarios": 7, "meses_mensuales": None, "conservar_manuales": True}
+
+    eliminados = app.podar_respaldos(politica, ahora)
+
+    quedan = app.listar_puntos_respaldo()
+    assert quedan == sorted(app.seleccionar_respaldos_a_conservar(list(estados), politica, ahora),
+                            key=app.marca_tiempo_respaldo)
+    assert eliminados == len(estados) - len(quedan)
+    assert "Respaldo_MANUAL_2026-01-04_08-00-00.resp" in quedan
+    for nombre in quedan:
+        assert reconstruir(app, nombre) == estados[nombre]
+    # La cadena sigue: el siguiente punto es un delta sobre el último que quedó
+    inventario["999"] = pieza(999)
+    nuevo = crear_punto(app, reloj, inventario, momento=ahora)
+    assert leer(app, nuevo)["padre"] == quedan[-1]
+    assert reconstruir(app, nuevo) == inventario
+
+
+def test_dos_hijos_del_mismo_padre_sobreviven_a_la_poda(app):
+    # Puntos creados en el mismo segundo: los dos deltas cuelgan de la misma base
+    os.makedirs(app.CARPETA_RESPALDOS)
+    extension = app.EXTENSION_RESPALDO
+    base = f"Respaldo_Auto_2026-01-01_10-00-00{extension}"
+    manual = f"Respaldo_MANUAL_2026-01-01_10-00-05{extension}"
+    automatico = f"Respaldo_Auto_2026-01-01_10-00-06{extension}"
+
+    def escribir(nombre, tipo, padre, piezas):
+        hashes = {pid: app.hash_pieza(p) for pid, p in piezas.items()}
+        app.escribir_punto_respaldo(os.path.join(app.CARPETA_RESPALDOS, nombre), {
+            "formato": 1, "tipo": tipo, "padre": padre, "manifiesto": hashes, "bajas": [],
+            "objetos": {hashes[pid]: p for pid, p in piezas.items()}})
+
+    escribir(base, "base", None, {"1": pieza(1)})
+    escribir(manual, "delta", base, {"2": pieza(2)})
+    escribir(automatico, "delta", base, {"1": pieza(5)})
+    politica = {"dias_completos": 0, "dias_diarios": 0, "meses_mensuales": 0, "conservar_manuales": True}
+
+    assert app.podar_respaldos(politica, datetime.datetime(2026, 3, 1)) == 1
+
+    assert app.listar_puntos_respaldo() == [manual, automatico]
+    assert reconstruir(app, manual) == {"1": pieza(1), "2": pieza(2)}
+    assert reconstruir(app, automatico) == {"1": pieza(5)}
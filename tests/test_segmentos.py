@@ -0,0 +1,122 @@
+import os
+
+from conftest import pieza
+
+
+def movimiento(i):
+    return {"ts": 1767821400 + i, "tipo": "SALIDA", "empleado": "7", "delta": -1, "saldo": 10 - i}
+
+
+def registrar_movimientos(app, pid, movimientos):
+    for mov in movimientos:
+        app.registrar_mutacion({"op": "mov", "id": pid, "cantidad": mov["saldo"], "mov": mov})
+
+
+def test_el_journal_no_duplica_los_movimientos_ya_escritos(app):
+    # Cierre después de escribir en el segmento los dos primeros movimientos del journal
+    app.escribir_snapshot({"1": pieza(10)})
+    anteriores, nuevos = [movimiento(0)], [movimiento(i) for i in range(1, 5)]
+    app.escribir_segmento("1", anteriores + nuevos[:2])
+    registrar_movimientos(app, "1", nuevos)
+
+    inventario = app.cargar_datos_json()
+
+    assert app.leer_segmento("1") == anteriores + nuevos
+    assert inventario["1"]["cantidad"] == nuevos[-1]["saldo"]
+
+
+def test_una_linea_cortada_del_segmento_se_descarta(app):
+    app.escribir_segmento("1", [movimiento(0)])
+    with open(app.ruta_segmento("1"), "a", encoding="utf-8") as f:
+        f.write('{"ts": 17678')
+
+    app.reparar_segmentos([("mov", "1", movimiento(1))])
+
+    assert app.leer_segmento("1") == [movimiento(0), movimiento(1)]
+    with open(app.ruta_segmento("1"), encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_un_alta_reinicia_el_historial(app):
+    app.escribir_segmento("1", [movimiento(0), movimiento(1)])
+
+    app.reparar_segmentos([("reinicio", "1"), ("mov", "1", movimiento(2))])
+    assert app.leer_segmento("1") == [movimiento(2)]
+
+    app.reparar_segmentos([("reinicio", "1")])
+    assert not os.path.exists(app.ruta_segmento("1"))
+
+
+def test_el_historial_en_cache_recibe_los_movimientos_nuevos(app):
+    app.escribir_segmento("1", [movimiento(0)])
+    assert app.historial_pieza("1") == [movimiento(0)]
+
+    app.aplicar_efectos_historial([("mov", "1", movimiento(1))])
+
+    assert app.historial_pieza("1") == [movimiento(1), movimiento(0)]
+    assert app.leer_segmento("1") == [movimiento(0), movimiento(1)]
+
+
+def test_el_historial_dentro_de_la_pieza_pasa_al_segmento(app):
+    # Formato anterior: historial de texto, del más nuevo al más viejo
+    inventario = {"1": pieza(1, historial=[
+        "📥 08/01/2026 09:00:00 | ENTRADA | Empleado: 5 | Cant: +4 | Total: 7",
+        "📤 07/01/2026 15:30:00 | SALIDA | Empleado: 123 | Cant: -3 | Restan: 3"])}
+
+    app.separar_historial(inventario)
+
+    segmento = app.leer_segmento("1")
+    assert [(m["tipo"], m["empleado"], m["delta"], m["saldo"]) for m in segmento] == \
+        [("SALIDA", "123", -3, 3), ("ENTRADA", "5", 4, 7)]
+    assert "historial" not in inventario["1"]
+    assert (inventario["1"]["ult_ts"], inventario["1"]["ult_tipo"]) == (segmento[-1]["ts"], "ENTRADA")
+
+
+def test_un_segmento_de_texto_se_lee_como_movimientos(app):
+    # Segmento escrito antes de los registros estructurados: una línea de texto por movimiento
+    linea = "📤 07/01/2026 15:30:00 | SALIDA | Empleado: 123 | Cant: -3 | Restan: 3"
+    os.makedirs(app.CARPETA_MOVIMIENTOS)
+    with open(app.ruta_segmento("1"), "w", encoding="utf-8") as f:
+        f.write(app.serializar_evento(linea) + app.serializar_evento("Nota escrita a mano"))
+
+    primero, segundo = app.leer_segmento("1")
+
+    assert (primero["tipo"], primero["empleado"], primero["delta"], primero["saldo"]) == ("SALIDA", "123", -3, 3)
+    assert app.texto_movimiento(primero) == linea
+    assert app.texto_movimiento(segundo) == "Nota escrita a mano"
+
+
+def falla(*args):
+    raise OSError("disco lleno")
+
+
+def test_un_segmento_que_fallo_se_completa_con_el_siguiente_cambio(app, ventana, monkeypatch):
+    sistema = ventana({"1": pieza(10)})
+    monkeypatch.setattr(app, "agregar_a_segmento", falla)
+
+    sistema.aplicar_lote([{"op": "mov", "id": "1", "cantidad": 10, "mov": movimiento(0)}])
+    sistema.aplicar_lote([{"op": "mov", "id": "1", "cantidad": 9, "mov": movimiento(1)}])
+
+    assert [aviso[0] for aviso in app.messagebox.avisos] == ["showerror"]
+    assert app.leer_segmento("1") == [movimiento(0), movimiento(1)]
+    assert app.historial_pieza("1") == [movimiento(1), movimiento(0)]
+    assert not sistema.persistencia.historial_pendiente
+
+
+def test_el_snapshot_no_recorta_el_journal_con_historial_pendiente(app, ventana, monkeypatch):
+    sistema = ventana({"1": pieza(10)})
+    agregar_a_segmento, escribir_segmento = app.agregar_a_segmento, app.escribir_segmento
+    monkeypatch.setattr(app, "agregar_a_segmento", falla)
+    monkeypatch.setattr(app, "escribir_segmento", falla)
+    sistema.aplicar_lote([{"op": "mov", "id": "1", "cantidad": 10, "mov": movimiento(0)}])
+    tamano = app.tamano_journal()
+
+    sistema.persistencia.escribir()
+
+    assert isinstance(sistema.persistencia.error, OSError) and sistema.persistencia.sucio
+    assert app.tamano_journal() == tamano
+    monkeypatch.setattr(app, "agregar_a_segmento", agregar_a_segmento)
+    monkeypatch.setattr(app, "escribir_segmento", escribir_segmento)
+    sistema.persistencia.escribir()
+    assert app.leer_segmento("1") == [movimiento(0)]
+    assert app.tamano_journal() == 0
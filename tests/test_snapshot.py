@@ -0,0 +1,37 @@
+import json
+import marshal
+import os
+
+from conftest import pieza
+
+
+def test_el_snapshot_binario_tiene_lo_mismo_que_el_json(app):
+    app.escribir_snapshot({"1": pieza(1), "2": pieza(2, descripcion="Ñandú")})
+
+    assert app.leer_snapshot_binario() == {"1": pieza(1), "2": pieza(2, descripcion="Ñandú")}
+    assert app.cargar_datos_json() == {"1": pieza(1), "2": pieza(2, descripcion="Ñandú")}
+
+
+def test_un_json_editado_a_mano_gana(app):
+    app.escribir_snapshot({"1": pieza(1)})
+    with open(app.ARCHIVO_DATOS, "w", encoding="utf-8") as f:
+        json.dump({"1": pieza(1, nombre="Editada")}, f)
+    marca = os.path.getmtime(app.ARCHIVO_DATOS)
+    os.utime(app.ARCHIVO_SNAPSHOT_BIN, (marca - 10, marca - 10))
+
+    assert app.leer_snapshot_binario() is None
+    assert app.cargar_datos_json() == {"1": pieza(1, nombre="Editada")}
+
+
+def test_un_binario_danado_o_de_otro_formato_se_ignora(app):
+    app.escribir_snapshot({"1": pieza(1)})
+    with open(app.ARCHIVO_SNAPSHOT_BIN, "wb") as f:
+        f.write(b"\x00basura")
+
+    assert app.leer_snapshot_binario() is None
+    assert app.cargar_datos_json() == {"1": pieza(1)}
+
+    with open(app.ARCHIVO_SNAPSHOT_BIN, "wb") as f:
+        marshal.dump((app.FORMATO_SNAPSHOT + 1, {"1": pieza(9)}), f)
+
+    assert app.leer_snapshot_binario() is None
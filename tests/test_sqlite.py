@@ -0,0 +1,125 @@
+import datetime
+import json
+import os
+
+from conftest import pieza
+
+
+def evento(hora, fecha="01/02/2026"):
+    return {"fecha": fecha, "hora": hora, "accion": "SALIDA", "codigo": "C-1", "nombre": "Pieza 1", "detalle": ""}
+
+
+def pasar_a_sqlite(app, monkeypatch):
+    monkeypatch.setattr(app, "MODO_ALMACENAMIENTO", "sqlite")
+    return app.almacen_sqlite()
+
+
+def test_la_primera_apertura_importa_inventario_e_historial(app, monkeypatch):
+    app.escribir_snapshot({"1": pieza(1), "2": pieza(2)})
+    movimientos = [{"ts": 1767821400 + i, "tipo": "SALIDA", "empleado": "7", "delta": -1, "saldo": 1 - i}
+                   for i in range(2)]
+    app.escribir_segmento("1", movimientos)
+    app.agregar_eventos_log([evento("09:00:00", "28/01/2026"), evento("10:00:00")])
+
+    almacen = pasar_a_sqlite(app, monkeypatch)
+
+    assert {pid: {k: v for k, v in p.items() if k not in ("ult_ts", "ult_tipo")}
+            for pid, p in almacen.cargar().items()} == {"1": pieza(1), "2": pieza(2)}
+    assert almacen.historial("1") == list(reversed(movimientos))
+    assert almacen.historial("2") == []
+    assert [e["hora"] for e in app.eventos_del_dia("28/01/2026")] == ["09:00:00"]
+    assert [e["hora"] for e in app.eventos_del_dia("01/02/2026")] == ["10:00:00"]
+
+
+def test_el_log_anterior_se_importa_una_sola_vez(app, monkeypatch):
+    with open(app.ARCHIVO_LOG_ANTIGUO, "w", encoding="utf-8") as f:
+        json.dump([evento("10:00:01"), evento("10:00:02")], f)
+    with open(app.ARCHIVO_LOG_JSONL, "w", encoding="utf-8") as f:
+        f.write(app.serializar_evento(evento("10:00:03")) + app.serializar_evento(evento("10:00:04")))
+
+    pasar_a_sqlite(app, monkeypatch)
+    app.migrar_log_global()
+
+    horas = [e["hora"] for e in app.eventos_del_dia("01/02/2026")]
+    assert sorted(horas) == ["10:00:01", "10:00:02", "10:00:03", "10:00:04"]
+    for ruta in (app.ARCHIVO_LOG_ANTIGUO, app.ARCHIVO_LOG_JSONL):
+        assert not os.path.exists(ruta) and os.path.exists(ruta + ".migrado")
+
+
+def test_una_linea_danada_del_log_no_impide_la_importacion(app, monkeypatch):
+    with open(app.ARCHIVO_LOG_JSONL, "w", encoding="utf-8") as f:
+        f.write(app.serializar_evento(evento("10:00:01")) + "{no es json\n"
+                + app.serializar_evento(evento("10:00:02")) + '{"fecha": "01/02/20')
+
+    pasar_a_sqlite(app, monkeypatch)
+
+    assert [e["hora"] for e in app.eventos_del_dia("01/02/2026")] == ["10:00:01", "10:00:02"]
+    assert os.path.exists(app.ARCHIVO_LOG_JSONL + ".migrado")
+
+
+def test_un_arreglo_danado_queda_sin_migrar(app, monkeypatch):
+    with open(app.ARCHIVO_LOG_ANTIGUO, "w", encoding="utf-8") as f:
+        f.write('[{"fecha": "01/02/2026"')
+
+    pasar_a_sqlite(app, monkeypatch)
+
+    assert os.path.exists(app.ARCHIVO_LOG_ANTIGUO)
+    app.migrar_log_global()
+    assert app.messagebox.avisos and app.messagebox.avisos[0][0] == "showerror"
+
+def test_una_base_anterior_recibe_la_marca_de_tiempo(app):
+    conexion = app.sqlite3.connect(app.ARCHIVO_SQLITE)
+    conexion.execute("CREATE TABLE movimientos (id INTEGER PRIMARY KEY AUTOINCREMENT, pieza_id TEXT NOT NULL, "
+                     "fecha TEXT, tipo TEXT, empleado TEXT, delta INTEGER, saldo INTEGER, linea TEXT)")
+    conexion.execute("CREATE INDEX idx_movimientos_fecha ON movimientos (fecha)")
+    conexion.execute("INSERT INTO movimientos (pieza_id, fecha, tipo, empleado, delta, saldo, linea) "
+                     "VALUES ('1', '2026-01-07 15:30:00', 'SALIDA', '123', -3, 3, NULL)")
+    conexion.commit()
+    conexion.close()
+
+    almacen = app.AlmacenSQLite(app.ARCHIVO_SQLITE)
+
+    esperado = int(app.time.mktime(app.datetime.datetime(2026, 1, 7, 15, 30).timetuple()))
+    assert almacen.historial("1") == [{"ts": esperado, "tipo": "SALIDA", "empleado": "123", "delta": -3, "saldo": 3}]
+    indices = {fila[1] for fila in almacen.conexion.execute("PRAGMA index_list(movimientos)")}
+    assert "idx_movimientos_ts" in indices and "idx_movimientos_fecha" not in indices
+    plan = almacen.conexion.execute("EXPLAIN QUERY PLAN SELECT * FROM movimientos WHERE ts BETWEEN ? AND ?",
+                                    (0, esperado)).fetchall()
+    assert "idx_movimientos_ts" in str(plan)
+    almacen.conexion.close()
+
+
+def test_una_base_existente_no_se_vuelve_a_importar(app):
+    app.escribir_snapshot({"1": pieza(1)})
+    app.AlmacenSQLite(app.ARCHIVO_SQLITE).conexion.close()
+    app.escribir_snapshot({"1": pieza(1), "2": pieza(2)})
+
+    almacen = app.AlmacenSQLite(app.ARCHIVO_SQLITE)
+
+    assert set(almacen.cargar()) == {"1"}
+    almacen.conexion.close()
+
+
+def test_las_mutaciones_se_aplican_por_fila(app, monkeypatch):
+    almacen = pasar_a_sqlite(app, monkeypatch)
+    mov = {"ts": 1767821400, "tipo": "SALIDA", "empleado": "7", "delta": -2, "saldo": 1}
+
+    app.registrar_mutacion({"op": "lote", "registros": [{"op": "alta", "id": "1", "pieza": pieza(3)},
+                                                         {"op": "alta", "id": "2", "pieza": pieza(2)}]})
+    app.registrar_mutacion({"op": "mov", "id": "1", "cantidad": 1, "mov": mov})
+    app.registrar_mutacion({"op": "editar", "id": "1", "campos": {"nombre": "Llave Allen"}})
+    app.registrar_mutacion({"op": "baja", "id": "2"})
+
+    assert almacen.cargar() == {"1": pieza(3, nombre="Llave Allen", cantidad=1, ult_ts=1767821400,
+                                          ult_tipo="SALIDA")}
+    assert almacen.historial("1") == [mov]
+
+
+def test_un_rango_de_fechas_usa_la_tabla_de_eventos(app, monkeypatch):
+    pasar_a_sqlite(app, monkeypatch)
+    app.agregar_eventos_log([evento("08:00:00", "31/12/2025"), evento("09:00:00", "28/01/2026"),
+                             evento("10:00:00"), evento("11:00:00", "02/03/2026")])
+
+    eventos = app.eventos_rango(datetime.date(2026, 1, 1), datetime.date(2026, 2, 28))
+
+    assert [e["hora"] for e in eventos] == ["09:00:00", "10:00:00"]
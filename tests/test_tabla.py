@@ -0,0 +1,139 @@
+import pytest
+
+from conftest import pieza
+
+
+class TablaFalsa:
+    # Lo que usa la tabla virtual de un Treeview: filas por iid (en orden), selección y alto en
+    # píxeles. "actualizadas" anota las filas que se redibujaron en su lugar.
+    def __init__(self, alto):
+        self.alto = alto
+        self.filas = {}
+        self.seleccion = ()
+        self.actualizadas = []
+
+    def winfo_height(self):
+        return self.alto
+
+    def get_children(self):
+        return tuple(self.filas)
+
+    def delete(self, *iids):
+        for iid in iids: del self.filas[iid]
+
+    def insert(self, padre, posicion, iid, values, tags=()):
+        self.filas[iid] = values
+
+    def item(self, iid, values, tags=()):
+        self.filas[iid] = values
+        self.actualizadas.append(iid)
+
+    def move(self, iid, padre, posicion):
+        orden = [i for i in self.filas if i != iid]
+        orden.insert(posicion, iid)
+        self.filas = {i: self.filas[i] for i in orden}
+
+    def exists(self, iid):
+        return iid in self.filas
+
+    def selection(self):
+        return self.seleccion
+
+    def selection_set(self, iid):
+        self.seleccion = (iid,)
+
+    def selection_remove(self, *iids):
+        self.seleccion = ()
+
+    def yview_moveto(self, fraccion):
+        pass
+
+
+class BarraFalsa:
+    def set(self, inicio, fin):
+        self.posicion = (inicio, fin)
+
+
+@pytest.fixture
+def tabla(app, ventana):
+    # 1000 piezas y lugar para 10 filas (más el encabezado)
+    sistema = ventana({str(i): pieza(i) for i in range(1, 1001)})
+    sistema.tabla, sistema.scroll_tabla = TablaFalsa(11 * app.ALTO_FILA_TABLA), BarraFalsa()
+    sistema.modo_actual = "lectura"
+    sistema.seleccionar_item = sistema.actualizar_contadores_stock = lambda *args: None
+    sistema.orden_actual, sistema.termino_filtro, sistema.filtro_ubicacion, sistema.filtro_stock = "id", "", "", set()
+    sistema.dia_tabla = None
+    del sistema.actualizar_tabla  # Con la tabla falsa sí se redibuja
+    sistema.filas_tabla, sistema.inicio_tabla, sistema.pid_seleccionado = sorted(sistema.inventario, key=int), 0, None
+    sistema.posiciones_tabla = (None, {})
+    return sistema
+
+
+def test_solo_se_crean_las_filas_visibles(app, tabla):
+    tabla.dibujar_ventana_tabla()
+
+    assert tabla.tabla.get_children() == tuple(str(i) for i in range(1, 11 + app.MARGEN_FILAS_TABLA))
+    assert tabla.tabla.filas["3"][:3] == ("3", "C-3", "Pieza 3")
+    assert tabla.scroll_tabla.posicion == (0, 10 / 1000)
+
+
+def test_la_barra_mueve_la_ventana(app, tabla):
+    tabla.desplazar_tabla("moveto", "0.5")
+    assert tabla.tabla.get_children()[0] == "501"
+    assert tabla.scroll_tabla.posicion == (0.5, 0.51)
+
+    tabla.desplazar_tabla("scroll", "1", "pages")
+    assert tabla.tabla.get_children()[0] == "511"
+
+    tabla.desplazar_tabla("moveto", "1.0")
+    assert tabla.tabla.get_children() == tuple(str(i) for i in range(991, 1001))
+
+
+def test_mostrar_una_fila_la_trae_a_la_vista_y_la_selecciona(app, tabla):
+    assert tabla.mostrar_fila("700")
+
+    assert tabla.tabla.get_children()[9] == "700"
+    assert tabla.tabla.seleccion == ("700",) and tabla.obtener_id_actual_seleccionado() == "700"
+    assert not tabla.mostrar_fila("5000")
+
+
+def test_la_posicion_de_una_fila_sigue_a_la_lista_actual(app, tabla):
+    assert tabla.fila_en_tabla("700") == 699
+
+    tabla.filas_tabla = tabla.filas_tabla[::-1]
+
+    assert tabla.fila_en_tabla("700") == 300
+    assert tabla.fila_en_tabla("5000") is None
+
+def test_las_flechas_desplazan_al_llegar_al_borde(app, tabla):
+    tabla.mostrar_fila("10")
+
+    tabla.mover_seleccion_tabla(1)
+    assert (tabla.pid_seleccionado, tabla.tabla.get_children()[0]) == ("11", "2")
+
+    tabla.mover_seleccion_tabla(-20)
+    assert (tabla.pid_seleccionado, tabla.tabla.get_children()[0]) == ("1", "1")
+
+
+def test_un_cambio_solo_redibuja_su_fila(app, tabla):
+    tabla.desplazar_tabla("moveto", "0.5")
+    tabla.tabla.actualizadas = []
+
+    tabla.aplicar_lote([{"op": "editar", "id": "505", "campos": {"nombre": "Llave Allen"}}])
+    tabla.actualizar_tabla()
+
+    assert tabla.tabla.actualizadas == ["505"]
+    assert tabla.tabla.filas["505"][2] == "Llave Allen"
+    assert tabla.inicio_tabla == 500 and tabla.tabla.get_children()[0] == "501"
+
+
+def test_un_cambio_en_la_clave_de_orden_mueve_la_fila(app, tabla):
+    tabla.orden_actual = "cantidad"
+    tabla.filas_tabla = tabla.calcular_filas()
+    tabla.dibujar_ventana_tabla()
+
+    tabla.aplicar_lote([{"op": "editar", "id": "3", "campos": {"cantidad": 5}}])
+    tabla.actualizar_tabla()
+
+    assert tabla.tabla.get_children()[:5] == ("1", "2", "4", "3", "5")
+    assert tabla.filas_tabla[:5] == ["1", "2", "4", "3", "5"]
@@ -0,0 +1,34 @@
+from conftest import editar_al_azar, inventario_aleatorio, pieza
+
+
+def test_el_resumen_suma_por_gabinete(app):
+    critico = app.STOCK_CRITICO
+    indice = app.IndiceUbicaciones({"1": pieza(1, gabinete="A", cantidad=critico), "2": pieza(2, gabinete=" A ",
+                                                                                             cantidad=critico + 10),
+                                    "3": pieza(3, gabinete="b", cantidad=0)})
+
+    assert indice.resumen() == [("A", 2, 2 * critico + 10, 1), ("b", 1, 0, 1)]
+    assert indice.pids("A") == {"1", "2"}
+
+
+def test_el_indice_editado_es_igual_a_uno_reconstruido(app):
+    inventario = inventario_aleatorio(16, 300)
+    indice = app.IndiceUbicaciones(inventario)
+
+    def al_cambiar(pid, anterior, nueva):
+        if anterior is not None: indice.quitar(pid, anterior)
+        if nueva is not None: indice.agregar(pid, nueva)
+    editar_al_azar(16, inventario, 500, al_cambiar)
+
+    nuevo = app.IndiceUbicaciones(inventario)
+    assert (indice.piezas, indice.unidades, indice.criticas) == (nuevo.piezas, nuevo.unidades, nuevo.criticas)
+
+
+def test_la_ventana_mueve_la_pieza_de_gabinete(app, ventana):
+    sistema = ventana({"1": pieza(1, gabinete="A"), "2": pieza(2, gabinete="A")})
+
+    sistema.aplicar_cambio({"op": "editar", "id": "1", "campos": {"gabinete": "B"}})
+    sistema.aplicar_cambio({"op": "baja", "id": "2"})
+
+    assert sistema.indice_ubicaciones.ubicaciones() == ["B"]
+    assert sistema.indice_ubicaciones.pids("B") == {"1"}